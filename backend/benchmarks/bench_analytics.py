@@ -0,0 +1,80 @@
+"""
+Benchmark: analyze_portfolio (NumPy kernel) vs analyze_portfolio_pandas.
+
+    cd backend && python benchmarks/bench_analytics.py [rows ...]
+
+Builds normalized holdings frames (default 10k and 1M rows), checks both
+implementations return identical output, and prints best-of timings.
+Then times analyze_portfolios (one pass, keyed by batch_id) against
+analyze_portfolio called once per portfolio, for 5,000 portfolios.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.analytics import analyze_portfolio, analyze_portfolio_pandas, analyze_portfolios  # noqa: E402
+
+SECTORS = ["Technology", "Healthcare", "Financials", "Energy", "Industrials", "Utilities",
+           "Materials", "Real Estate", "Consumer Staples", "Communication", ""]
+
+def make_frame(rows: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_symbols = max(10, rows // 4)  # some symbols held in several lots
+    sym_ids = rng.integers(0, n_symbols, rows)
+    symbols = np.array([f"SYM{i:06d}" for i in range(n_symbols)], dtype=object)
+    qty = rng.integers(1, 5000, rows).astype(float)
+    price = np.round(rng.lognormal(3.5, 1.0, rows), 2)
+    return pd.DataFrame({
+        "symbol": symbols[sym_ids],
+        "name": np.char.add("Name ", sym_ids.astype(str)).astype(object),
+        "quantity": qty,
+        "price": price,
+        "market_value": np.round(qty * price, 2),
+        "sector": np.array(SECTORS, dtype=object)[sym_ids % len(SECTORS)],
+        "currency": "USD",
+    })
+
+def best_of(fn, df, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def main(sizes):
+    for rows in sizes:
+        df = make_frame(rows)
+        ref, new = analyze_portfolio_pandas(df), analyze_portfolio(df)
+        assert json.dumps(ref) == json.dumps(new), f"output differs at {rows} rows"
+        repeat = 5 if rows <= 100_000 else 2
+        t_ref = best_of(analyze_portfolio_pandas, df, repeat)
+        t_new = best_of(analyze_portfolio, df, repeat)
+        print(f"{rows:>9,} rows  pandas {t_ref * 1000:9.1f} ms  kernel {t_new * 1000:9.1f} ms  speedup {t_ref / t_new:5.2f}x")
+
+def main_portfolios(portfolios: int = 5_000, rows_each: int = 60):
+    df = make_frame(portfolios * rows_each)
+    df["batch_id"] = np.repeat(np.arange(1, portfolios + 1), rows_each)
+    parts = [g.drop(columns="batch_id") for _, g in df.groupby("batch_id")]
+
+    def one_by_one(_):
+        return [analyze_portfolio(p) for p in parts]
+
+    def grouped(frame):
+        return analyze_portfolios(frame, "batch_id")
+
+    looped, together = one_by_one(None), grouped(df)
+    assert json.dumps(looped) == json.dumps(list(together.values())), "portfolio outputs differ"
+    t_loop = best_of(one_by_one, None, 2)
+    t_group = best_of(grouped, df, 2)
+    print(f"{portfolios:>9,} portfolios x {rows_each} rows  one by one {t_loop * 1000:9.1f} ms  "
+          f"grouped {t_group * 1000:9.1f} ms  speedup {t_loop / t_group:5.2f}x")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 1_000_000])
+    main_portfolios()
@@ -0,0 +1,60 @@
+"""
+Benchmark: compact (categorical text columns) vs object-dtype normalized
+holdings frames.
+
+    cd backend && python benchmarks/bench_compact_frames.py [rows ...]
+
+For each size (default 100k and 1M rows) prints the frames' memory
+(deep), then best-of timings of analyze_portfolio (NumPy kernel), the
+pandas reference and analyze_portfolios over 1,000 portfolios on both
+layouts, asserting every result is identical.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_analytics import make_frame  # noqa: E402
+from services.analytics import analyze_portfolio, analyze_portfolio_pandas, analyze_portfolios  # noqa: E402
+from services.utils import compact_holdings, normalize_custodian_csv  # noqa: E402
+
+def best_of(fn, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def same(a, b) -> bool:
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+def main(sizes):
+    small = make_frame(2_000)
+    assert normalize_custodian_csv(small, compact=True).equals(compact_holdings(normalize_custodian_csv(small)))
+
+    for rows in sizes:
+        plain = make_frame(rows)
+        plain["batch_id"] = np.random.default_rng(1).integers(0, 1_000, rows)
+        compact = compact_holdings(plain)
+        mb = [f.memory_usage(deep=True).sum() / 1e6 for f in (plain, compact)]
+        print(f"{rows:>10,} rows  memory: object {mb[0]:8.1f} MB   compact {mb[1]:8.1f} MB   x{mb[0] / mb[1]:.1f}")
+
+        cases = [
+            ("kernel", analyze_portfolio),
+            ("pandas", analyze_portfolio_pandas),
+            ("1k portfolios", lambda f: analyze_portfolios(f, "batch_id")),
+        ]
+        for label, fn in cases:
+            t_plain, expected = best_of(lambda: fn(plain))
+            t_compact, got = best_of(lambda: fn(compact))
+            assert same(got, expected), label
+            print(f"{'':>16}{label:<14} object {t_plain * 1e3:8.1f} ms   compact {t_compact * 1e3:8.1f} ms"
+                  f"   x{t_plain / t_compact:.1f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [100_000, 1_000_000])
@@ -0,0 +1,58 @@
+"""
+Monte Carlo VaR/CVaR (services/montecarlo.py): correctness checks and
+scaling with worker processes.
+
+    cd backend && python benchmarks/bench_montecarlo.py [paths]
+
+  - results are identical with 1 and several workers (seeded per chunk);
+  - the chunk-tail merge gives the same VaR/CVaR as sorting every loss;
+  - then times `paths` (default 1e7) bootstrap paths with 1, 2, 4, ...
+    workers up to the CPU count.
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.montecarlo import _simulate_chunk, simulate_losses  # noqa: E402
+
+HORIZONS = (1, 5, 10)
+CONFIDENCES = (0.9, 0.95, 0.99, 0.999)
+
+def check(model: str, param, paths: int = 100_003, chunk: int = 10_000, seed: int = 7, confidences=CONFIDENCES):
+    serial = simulate_losses(model, param, paths=paths, horizons=HORIZONS, confidences=confidences,
+                             seed=seed, chunk_paths=chunk, workers=1)
+    parallel = simulate_losses(model, param, paths=paths, horizons=HORIZONS, confidences=confidences,
+                               seed=seed, chunk_paths=chunk, workers=4)
+    assert serial == parallel, model
+
+    sizes = [min(chunk, paths - lo) for lo in range(0, paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    losses = np.concatenate([_simulate_chunk(model, param, HORIZONS, n, s, n) for n, s in zip(sizes, seeds)], axis=1)
+    for r in serial:
+        worst = -np.sort(-losses[HORIZONS.index(r["horizon_days"])])
+        k = math.ceil((1 - r["confidence"]) * paths)
+        assert r["var"] == worst[k - 1] and np.isclose(r["cvar"], worst[:k].mean()), r
+
+def main(paths: int):
+    history = np.random.default_rng(0).standard_t(4, 250) * 0.01
+    check("bootstrap", history)
+    check("normal", 0.012)
+    check("bootstrap", history, confidences=(0.5, 0.99))  # tail longer than a chunk
+    print("parallel == serial, tail merge == full sort")
+
+    workers, cpus = 1, os.cpu_count() or 1
+    base = None
+    while workers <= cpus:
+        t0 = time.perf_counter()
+        simulate_losses("bootstrap", history, paths=paths, horizons=(1, 10), seed=3, workers=workers)
+        elapsed = time.perf_counter() - t0
+        base = base or elapsed
+        print(f"{paths:,} paths, {workers:>2} workers: {elapsed:6.2f} s  (x{base / elapsed:.1f})")
+        workers *= 2
+
+if __name__ == "__main__":
+    main(int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000)
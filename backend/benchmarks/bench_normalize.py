@@ -0,0 +1,116 @@
+"""
+Benchmark: normalize_custodian_csv with memoized normalization plans vs
+the previous per-call header resolution.
+
+    cd backend && python benchmarks/bench_normalize.py [files]
+
+Normalizes many small holdings files drawn from a dozen header layouts
+(synonyms, odd casing and separators, duplicate canonical names, missing
+columns, carry columns), checks every result equals the previous
+implementation (reproduced below) and every plan's inferred mapping the
+previous candidate lookup, and times both over the same files.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.utils import (  # noqa: E402
+    STANDARD_ORDER, _canonical_name, _smart_numeric, detect_custodian, normalization_plan, normalize_custodian_csv,
+)
+
+LAYOUTS = [
+    ["Symbol", "Description", "Quantity", "Price", "Market Value", "Sector", "Currency"],
+    ["Ticker", "Security Name", "Shares", "Last Price", "Current Value"],
+    ["security_id", "long name", "Position-Quantity", "PX", "MarketValue", "GICS_Sector", "CCY"],
+    ["CUSIP", "Symbol", "Qty", "Close Price", "MV"],
+    ["Account", "Symbol", "Name", "Units", "Unit Price", "Value", "Industry"],
+    ["SYMBOL", "QUANTITY", "PRICE"],
+    [" Symbol ", "Name", "Market Value", "Notes"],
+    ["Instrument", "Security Description", "Position", "Market Price", "Position Value", "Base Currency"],
+    ["symbol", "qty", "price", "mv", "batch_id"],
+    ["ISIN", "Name", "Quantity", "Market Value", "Reporting Currency", "Sector"],
+    ["Ticker", "Quantity", "Price", "Market Value", "Cost Basis", "Acquired"],
+    ["Security", "Security Name", "Shares", "Price", "Market Value", "Sector", "Currency", "Account"],
+    ["Qty", "Quantity", "Ticker", "Symbol", "MV", "Market Value", "Price", "Date", "Close", "Cash", "Acct"],
+    ["Symbol", "symbol ", "Shares", "Price", "PX_LAST", "As Of", "Avg Cost", "Cost"],
+]
+
+PREVIOUS_CANDIDATES = {
+    "symbol": ["symbol", "ticker", "security", "security id"], "name": ["name", "security name"],
+    "quantity": ["quantity", "shares", "qty"], "price": ["price", "current price", "last price"],
+    "market_value": ["market value", "marketvalue", "mv"], "cost_basis": ["cost basis", "cost", "avg cost", "average cost"],
+    "sector": ["sector"], "currency": ["currency", "ccy"], "date": ["date", "as of", "as_of", "pricedate"],
+    "close": ["close", "price", "px_last"], "cash": ["cash"], "account": ["account", "account number", "acct"],
+}
+
+def previous_mapping(headers):
+    index_map = {h: i for i, h in enumerate(h.strip().lower() for h in headers)}
+    return {field: next((index_map[c] for c in cands if c in index_map), None)
+            for field, cands in PREVIOUS_CANDIDATES.items()}
+
+def previous_normalize(df: pd.DataFrame, carry=None) -> pd.DataFrame:
+    carry = list(carry or [])
+    new_cols, seen = {}, set()
+    for c in df.columns:
+        can = _canonical_name(c)
+        new_cols[c] = c if can in seen else can
+        seen.add(can)
+    df = df.rename(columns=new_cols)
+    for col in STANDARD_ORDER:
+        if col not in df.columns:
+            df[col] = np.nan
+    for col in ["quantity", "price", "market_value"]:
+        df[col] = _smart_numeric(df[col])
+    mv_missing = df["market_value"].isna() | (df["market_value"] == 0)
+    df.loc[mv_missing, "market_value"] = (df["quantity"].fillna(0) * df["price"].fillna(0))
+    for tcol in ["symbol", "name", "sector", "currency"]:
+        df[tcol] = df[tcol].astype(str).replace({"nan": "", "None": "", "NaN": ""}).str.strip()
+    df = df[~(df["symbol"].replace({"": np.nan}).isna() & (df["market_value"].fillna(0) == 0))]
+    df = df[STANDARD_ORDER + carry]
+    df.attrs["custodian_guess"] = detect_custodian(df)
+    return df.reset_index(drop=True)
+
+def make_file(headers, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    columns = {}
+    for h in headers:
+        canon = _canonical_name(h)
+        if canon in ("quantity", "price", "market_value"):
+            values = np.round(rng.lognormal(4, 1.5, rows), 2)
+            columns[h] = [f"${v:,.2f}" if rng.random() < 0.3 else str(v) for v in values]
+        elif canon == "symbol":
+            columns[h] = [f"S{rng.integers(500):03d}" if rng.random() < 0.95 else "" for _ in range(rows)]
+        else:
+            columns[h] = [f"{h} {rng.integers(10)}" for _ in range(rows)]
+    return pd.DataFrame(columns, dtype=object)
+
+def main(n_files: int):
+    rng = np.random.default_rng(0)
+    files = [make_file(LAYOUTS[i % len(LAYOUTS)], int(rng.integers(5, 60)), rng) for i in range(n_files)]
+    for df in files[:len(LAYOUTS)]:
+        carry = ["batch_id"] if "batch_id" in df.columns else None
+        before = df.copy()
+        got, want = normalize_custodian_csv(df, carry), previous_normalize(df, carry)
+        pd.testing.assert_frame_equal(got, want)
+        assert got.attrs == want.attrs, (got.attrs, want.attrs)
+        pd.testing.assert_frame_equal(df, before)  # the caller's frame is left as it was
+    plan = normalization_plan(tuple(LAYOUTS[3]))
+    assert plan.columns == {"symbol": 0, "quantity": 2, "price": 3, "market_value": 4}, plan.columns
+    for headers in LAYOUTS:
+        mapping = normalization_plan(tuple(headers)).mapping
+        assert json.dumps(mapping) == json.dumps(previous_mapping(headers)), headers
+    print("identical to the previous normalizer and mapping inference")
+
+    for label, fn in (("previous", previous_normalize), ("planned", normalize_custodian_csv)):
+        t0 = time.perf_counter()
+        for df in files:
+            fn(df)
+        print(f"{label:>9}: {n_files:,} files in {time.perf_counter() - t0:.2f}s")
+    print("plan cache:", normalization_plan.cache_info())
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
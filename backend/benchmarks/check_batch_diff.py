@@ -0,0 +1,116 @@
+"""
+Correctness check + timing for services/batch_diff.py against an in-memory
+SQLite.
+
+    cd backend && python benchmarks/check_batch_diff.py [rows]
+
+Diffs overlapping batches (with and without accounts, both directions) and
+compares every key with a pandas outer join of the same batches grouped
+the same way: the change kind, quantity / market value changes and weight
+drift, plus the summary counts. Then times the diff of two batches of
+`rows` positions each (default 100,000) and reports the streamed size.
+"""
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from services.batch_diff import stream_batch_diff  # noqa: E402
+
+def fill_batch(db, rows: int, symbols, accounts, rng: np.random.Generator) -> pd.DataFrame:
+    batch = models.Batch(firm_id=1, client_id=1, as_of_date=date(2024, 1, 1))
+    db.add(batch)
+    db.flush()
+    records = [
+        dict(
+            batch_id=batch.id,
+            account_id=int(accounts[rng.integers(len(accounts))]) if accounts else None,
+            symbol=symbols[rng.integers(len(symbols))],
+            quantity=float(rng.integers(1, 100)),
+            price=float(rng.integers(1, 50)),
+            market_value=None if rng.random() < 0.2 else float(rng.integers(0, 5000)),
+        )
+        for _ in range(rows)
+    ]
+    db.execute(insert(models.Position), records)
+    db.flush()
+    frame = pd.DataFrame(records)
+    frame.attrs["batch_id"] = batch.id
+    return frame
+
+def reference(a: pd.DataFrame, b: pd.DataFrame, by_account: bool):
+    def grouped(frame):
+        mv = frame["market_value"].fillna(0.0)
+        frame = frame.assign(mv=mv.where(mv != 0, frame["quantity"] * frame["price"]))
+        keys = (["account_id"] if by_account else []) + ["symbol"]
+        return frame.groupby(keys).agg(q=("quantity", "sum"), mv=("mv", "sum")), frame["mv"].sum()
+
+    (ga, total_a), (gb, total_b) = grouped(a), grouped(b)
+    return ga.join(gb, how="outer", lsuffix="_a", rsuffix="_b"), total_a, total_b
+
+def diff(db, a: int, b: int, **kwargs):
+    return json.loads("".join(stream_batch_diff(db, a, b, **kwargs)))
+
+def main(rows: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.Firm(id=1, name="Firm"))
+    db.add(models.Client(id=1, firm_id=1, name="Client"))
+    db.add_all([models.Account(id=i, client_id=1, name=f"Account {i}") for i in (1, 2, 3)])
+    rng = np.random.default_rng(0)
+
+    symbols = [f"S{i:04d}" for i in range(300)]
+    a = fill_batch(db, 2000, symbols[:250], [1, 2], rng)
+    b = fill_batch(db, 1500, symbols[50:], [1, 2, 3], rng)
+    c = fill_batch(db, 100, symbols, None, rng)
+    db.commit()
+
+    for x, y, by_account in ((a, b, True), (b, a, True), (a, c, False), (a, b, False)):
+        doc = diff(db, x.attrs["batch_id"], y.attrs["batch_id"], by_account=by_account, include_unchanged=True)
+        joined, total_a, total_b = reference(x, y, by_account)
+        assert len(doc["changes"]) == len(joined)
+        assert abs(doc["total_value_a"] - total_a) < 0.01 and abs(doc["total_value_b"] - total_b) < 0.01
+        got = {((ch["account_id"],) if by_account else ()) + (ch["symbol"],): ch for ch in doc["changes"]}
+        for key, row in joined.iterrows():
+            ch = got[key if isinstance(key, tuple) else (key,)]
+            if np.isnan(row.q_a):
+                assert ch["change"] == "added", key
+            elif np.isnan(row.q_b):
+                assert ch["change"] == "removed", key
+            else:
+                assert abs(ch["quantity_change"] - (row.q_b - row.q_a)) < 1e-6, key
+                assert abs(ch["market_value_change"] - (row.mv_b - row.mv_a)) < 0.011, key
+            w_a = 0.0 if np.isnan(row.mv_a) else row.mv_a / total_a
+            w_b = 0.0 if np.isnan(row.mv_b) else row.mv_b / total_b
+            assert abs(ch["weight_drift"] - (w_b - w_a)) < 2e-6, key
+        counts = {k: sum(ch["change"] == k for ch in doc["changes"]) for k in ("added", "removed", "changed", "unchanged")}
+        assert all(doc["summary"][k] == v for k, v in counts.items())
+
+    same = diff(db, a.attrs["batch_id"], a.attrs["batch_id"])
+    assert not same["changes"] and same["summary"]["unchanged"] == len(reference(a, a, True)[0])
+    assert same["summary"]["turnover"] == 0
+    print("diffs identical to the pandas outer join")
+
+    e = fill_batch(db, rows, [f"X{i}" for i in range(int(rows * 1.2))], None, rng)
+    f = fill_batch(db, rows, [f"X{i}" for i in range(int(rows * 0.2), int(rows * 1.4))], None, rng)
+    db.commit()
+    t0 = time.perf_counter()
+    size, first = 0, None
+    for chunk in stream_batch_diff(db, e.attrs["batch_id"], f.attrs["batch_id"]):
+        first = first or time.perf_counter()
+        size += len(chunk)
+    t1 = time.perf_counter()
+    print(f"{rows:,} + {rows:,} rows: first chunk {first - t0:.2f}s, total {t1 - t0:.2f}s, {size / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
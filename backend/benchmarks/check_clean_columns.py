@@ -0,0 +1,203 @@
+"""
+Correctness check + timing: the column-wise ingest cleaners vs the
+per-row pick()/clean_number() code they replace.
+
+    cd backend && python benchmarks/check_clean_columns.py [rows ...]
+
+Fuzzes custodian-style cells (currency signs, thousands separators,
+parentheses negatives, blanks, null tokens, odd whitespace, strings
+float() accepts or rejects in surprising ways, overflow) and asserts:
+clean_number_column() equals clean_number() per value bit for bit (NaN
+where it returns NaN, None where it returns None, same sign of zero),
+round2_column() equals round(x, 2), and the positions/prices/balances
+cleaners equal the previous per-row cleaners (reproduced below) on random
+header layouts, short rows and mappings. Then times the per-row and
+column-wise positions cleaners (default 200k rows).
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.dates import DateColumnParser  # noqa: E402
+from services.ingest import (  # noqa: E402
+    RowBlock, _clean_balances, _clean_positions, _clean_prices, clean_number, clean_number_column, pick,
+    round2_column,
+)
+
+ODD = ["", " ", "  ", "-", "—", "nan", "NaN", "-nan", "inf", "-Infinity", "1e400", "-1e400", "1_000", "0x10",
+       "(5)", "((5))", "$(5)", "(-5)", "( 1,234.50 )", "()", "(", ")", "$", ",", "$,", "(0)", "-0", "+.5", "5.",
+       "1.2.3", "N/A", "abc", "٣.٥", "1d5", " 12 ", "\t7\n", "12 %", "€5", "1,2,3", "$$1", "(1e3)", "1e-320"]
+
+def messy_cell(rng: np.random.Generator) -> str:
+    r = rng.random()
+    x = round(float(rng.normal(0, 1e5)), int(rng.integers(0, 5)))
+    if r < 0.35:
+        return str(x)
+    if r < 0.55:
+        return ODD[rng.integers(len(ODD))]
+    if r < 0.85:
+        text = f"{abs(x):,.2f}"
+        text = ("$" if rng.random() < 0.5 else "") + text
+        text = f"({text})" if x < 0 else text
+        return (" " if rng.random() < 0.3 else "") + text + (" " if rng.random() < 0.2 else "")
+    return str(int(x))
+
+def same(a, b) -> bool:
+    """Equal lists, floats compared by repr (NaN == NaN, -0.0 != 0.0, 1 != 1.0)."""
+    return len(a) == len(b) and all(repr(x) == repr(y) for x, y in zip(a, b))
+
+# ---- previous per-row cleaners (dates parsed column-wise as the current ones do) ----
+
+def reference_positions(rows, mapping):
+    cols = {c: [] for c in ("symbol", "name", "quantity", "price", "market_value", "cost_basis", "currency",
+                            "sector", "source_row")}
+    for i, row in rows:
+        symbol = pick(mapping, row, "symbol") or pick(mapping, row, "ticker")
+        if not symbol:
+            continue
+        qty = clean_number(pick(mapping, row, "quantity") or pick(mapping, row, "shares") or "0")
+        price = clean_number(pick(mapping, row, "price"))
+        mv = clean_number(pick(mapping, row, "market_value"))
+        if mv is None and qty is not None and price is not None:
+            mv = round(qty * price, 2)
+        cols["symbol"].append(symbol.strip())
+        cols["name"].append(pick(mapping, row, "name"))
+        cols["quantity"].append(qty)
+        cols["price"].append(price)
+        cols["market_value"].append(mv)
+        cols["cost_basis"].append(clean_number(pick(mapping, row, "cost_basis") or pick(mapping, row, "average cost")))
+        cols["currency"].append(pick(mapping, row, "currency") or "USD")
+        cols["sector"].append(pick(mapping, row, "sector"))
+        cols["source_row"].append(i)
+    return cols
+
+def reference_prices(rows, mapping):
+    kept = []
+    for i, row in rows:
+        symbol = pick(mapping, row, "symbol") or pick(mapping, row, "ticker")
+        date_s = pick(mapping, row, "date")
+        px = clean_number(pick(mapping, row, "close") or pick(mapping, row, "price"))
+        if symbol and date_s and px is not None:
+            kept.append((symbol.strip(), date_s, px, i))
+    dates = DateColumnParser().parse(np.array([k[1] for k in kept], dtype=object)).tolist() if kept else []
+    kept = [(s, d, px, i) for (s, _, px, i), d in zip(kept, dates) if d is not None]
+    return {c: [k[j] for k in kept] for j, c in enumerate(("symbol", "date", "price", "source_row"))}
+
+def reference_balances(rows, mapping):
+    kept = [(pick(mapping, row, "date"), row, i) for i, row in rows if pick(mapping, row, "date")]
+    dates = DateColumnParser().parse(np.array([k[0] for k in kept], dtype=object)).tolist() if kept else []
+    cols = {c: [] for c in ("date", "cash", "market_value", "source_row")}
+    for (_, row, i), d in zip(kept, dates):
+        if d is None:
+            continue
+        cols["date"].append(d)
+        cols["cash"].append(clean_number(pick(mapping, row, "cash")))
+        cols["market_value"].append(clean_number(pick(mapping, row, "market_value")))
+        cols["source_row"].append(i)
+    return cols
+
+CLEANERS = [
+    (_clean_positions, reference_positions,
+     ["symbol", "ticker", "name", "quantity", "shares", "price", "market_value", "cost_basis", "average cost",
+      "currency", "sector"]),
+    (_clean_prices, reference_prices, ["symbol", "ticker", "date", "close", "price"]),
+    (_clean_balances, reference_balances, ["date", "cash", "market_value"]),
+]
+
+def random_cell(rng: np.random.Generator, field: str) -> str:
+    r = rng.random()
+    if field in ("symbol", "ticker"):
+        return ["", " ", "AAPL", " msft ", "BRK.B", "0"][rng.integers(6)] if r < 0.5 else f"S{rng.integers(100)}"
+    if field == "date":
+        return ["2024-01-31", "01/31/2024", "1/5/2024", "2024-02-30", "", "junk", "2024-01-31 10:00"][rng.integers(7)]
+    if field in ("name", "sector", "currency"):
+        return ["", "Tech", " Energy ", "USD", "EUR"][rng.integers(5)]
+    return messy_cell(rng)
+
+def random_file(rng: np.random.Generator, fields, rows: int):
+    """Random layout: a subset of fields in random columns, junk columns, short rows, odd mapping entries."""
+    width = int(rng.integers(1, 9))
+    mapping, layout = {}, {}
+    for f in fields:
+        r = rng.random()
+        if r < 0.6:
+            mapping[f] = int(rng.integers(width))  # fields may share a column
+            layout.setdefault(mapping[f], f)
+        elif r < 0.7:
+            mapping[f] = int(rng.integers(width, width + 3))  # past the row end
+        elif r < 0.75:
+            mapping[f] = -1
+        elif r < 0.85:
+            mapping[f] = None
+    numbered = []
+    for i in range(rows):
+        n = width if rng.random() < 0.9 else int(rng.integers(0, width + 1))
+        numbered.append((i + 2, [random_cell(rng, layout.get(j, "junk")) for j in range(n)]))
+    return numbered, mapping
+
+def main(sizes):
+    # 1) numbers, value by value
+    for seed in range(30):
+        rng = np.random.default_rng(seed)
+        for values in (
+            [messy_cell(rng) for _ in range(3000)],
+            [str(v) for v in rng.normal(0, 1e4, 3000)],
+            [f"${v:,.2f}" for v in rng.lognormal(5, 2, 3000)],
+            [f"({v:,.2f})" for v in rng.lognormal(5, 2, 300)],
+            [None if rng.random() < 0.3 else messy_cell(rng) for _ in range(300)],
+            [None] * 10,
+            [],
+        ):
+            column = np.array(values, dtype=object)
+            got, null = clean_number_column(column)
+            assert same([None if n else v for v, n in zip(got.tolist(), null)], [clean_number(v) for v in values]), seed
+    for cell in ODD:
+        got, null = clean_number_column(np.array([cell], dtype=object))
+        assert same([None if null[0] else got[0]], [clean_number(cell)]), cell
+
+    # 2) rounding of derived market values
+    rng = np.random.default_rng(1)
+    products = np.concatenate([
+        rng.normal(0, 1e4, 50_000), np.round(rng.normal(0, 1e3, 50_000), 3), np.arange(50_000) / 1000 + 0.005,
+        [2.675, 1.005, -2.675, 0.125, 0.375, 1e16, -0.0, np.inf, -np.inf, np.nan, 5e-324],
+    ])
+    assert same(round2_column(products).tolist(), [round(float(v), 2) for v in products])
+    print("clean_number_column / round2_column identical to clean_number / round")
+
+    # 3) whole cleaners on random layouts
+    for seed in range(300):
+        rng = np.random.default_rng(seed)
+        for clean, reference, fields in CLEANERS:
+            numbered, mapping = random_file(rng, fields, int(rng.integers(0, 200)))
+            got = clean(RowBlock.from_rows(numbered), mapping, DateColumnParser())
+            expected = reference(numbered, mapping)
+            assert set(got) == set(expected), (seed, clean.__name__)
+            for c in expected:
+                assert same(list(got[c]), expected[c]), (seed, clean.__name__, c)
+    print("cleaners identical to the per-row cleaners")
+
+    mapping = {"symbol": 0, "name": 1, "quantity": 2, "price": 3, "market_value": 4, "sector": 5}
+    for rows in sizes:
+        syms = [f"S{i}" for i in rng.integers(0, 5000, rows)]
+        layouts = {
+            "clean": [[s, "Name", str(q), str(p), "", "Tech"] for s, q, p in
+                      zip(syms, np.round(rng.lognormal(4, 1, rows), 3), np.round(rng.lognormal(3, 1, rows), 2))],
+            "formatted": [[s, "Name", f"{q:,.3f}", f"${p:,.2f}", f"${q * p:,.2f}" if rng.random() < 0.5 else "",
+                           "Tech"] for s, q, p in zip(syms, rng.lognormal(8, 1, rows), rng.lognormal(3, 1, rows))],
+        }
+        for label, table in layouts.items():
+            numbered = list(enumerate(table, start=2))
+            t0 = time.perf_counter()
+            expected = reference_positions(numbered, mapping)
+            t1 = time.perf_counter()
+            got = _clean_positions(RowBlock.from_rows(numbered), mapping, DateColumnParser())
+            t2 = time.perf_counter()
+            assert all(same(list(got[c]), expected[c]) for c in expected), label
+            print(f"{rows:>10,} rows, {label:<10}  per-row {t1 - t0:7.3f}s   column-wise {t2 - t1:7.3f}s"
+                  f"   x{(t1 - t0) / (t2 - t1):.1f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [200_000])
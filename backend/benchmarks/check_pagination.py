@@ -0,0 +1,93 @@
+"""
+Correctness check + timing for the keyset-paginated list endpoints
+(/clients, /accounts, /batches, /mappings) against a scratch SQLite file.
+
+    cd backend && python benchmarks/check_pagination.py [rows]
+
+Walks every endpoint page by page through X-Next-Cursor and asserts the
+pages concatenate to exactly the filtered rows, newest first. Then fills
+`rows` clients (default 1M) over a few firms and times the first and the
+deepest page, printing SQLite's plan for the page query (it should be a
+search on the composite index, with no sort).
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+db_path = os.path.join(tempfile.mkdtemp(), "pagination.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+os.environ.setdefault("PRICE_STORE_DIR", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert, text  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+
+def walk(client: TestClient, path: str, params: dict, limit: int):
+    """Every item of a list endpoint, page by page, and the number of pages."""
+    items, pages, cursor = [], 0, None
+    while True:
+        r = client.get(path, params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200, r.text
+        items.extend(r.json())
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return items, pages
+        assert len(r.json()) == limit
+
+def main_check(rows: int):
+    client = TestClient(main.app)
+    db = SessionLocal()
+    db.add_all([models.Firm(id=1, name="One"), models.Firm(id=2, name="Two")])
+    db.flush()
+    db.execute(insert(models.Client), [{"firm_id": 1 + i % 2, "name": f"Client {i}"} for i in range(523)])
+    db.execute(insert(models.Account), [{"client_id": 1 + i % 3, "name": f"Account {i}"} for i in range(250)])
+    db.execute(insert(models.Batch), [
+        {"firm_id": 1, "client_id": 1 + i % 2, "as_of_date": date(2024, 1, 1), "status": "ingested"} for i in range(301)
+    ])
+    db.execute(insert(models.Mapping), [{"firm_id": 1 + i % 2, "header_signature": f"h{i}"} for i in range(77)])
+    db.commit()
+
+    cases = [
+        ("/clients", {"firm_id": 1}, models.Client, models.Client.firm_id == 1),
+        ("/accounts", {"client_id": 2}, models.Account, models.Account.client_id == 2),
+        ("/batches", {"firm_id": 1, "client_id": 1}, models.Batch,
+         (models.Batch.firm_id == 1) & (models.Batch.client_id == 1)),
+        ("/mappings", {"firm_id": 2}, models.Mapping, models.Mapping.firm_id == 2),
+    ]
+    for path, params, model, condition in cases:
+        expected = [r.id for r in db.query(model).filter(condition).order_by(model.id.desc())]
+        for limit in (1, 7, 100, 1000):
+            items, pages = walk(client, path, params, limit)
+            assert [i["id"] for i in items] == expected, (path, limit)
+            assert pages == max(1, -(-len(expected) // limit)), (path, limit, pages)
+    assert client.get("/clients", params={"firm_id": 1, "limit": 0}).status_code == 422
+    assert client.get("/clients", params={"firm_id": 1, "cursor": 0}).status_code == 422
+    print("pages concatenate to the full lists, newest first")
+
+    chunk = 100_000
+    for lo in range(0, rows, chunk):
+        db.execute(insert(models.Client), [{"firm_id": 1 + i % 4, "name": f"C{i}"} for i in range(lo, min(rows, lo + chunk))])
+    db.commit()
+    last = db.query(models.Client.id).filter(models.Client.firm_id == 1).order_by(models.Client.id).limit(101).all()[-1][0]
+    for label, cursor in (("first page", None), ("deepest page", last)):
+        params = {"firm_id": 1, "limit": 100, **({"cursor": cursor} if cursor else {})}
+        client.get("/clients", params=params)
+        t0 = time.perf_counter()
+        for _ in range(20):
+            r = client.get("/clients", params=params)
+        print(f"{rows:,} clients, {label:<12}: {(time.perf_counter() - t0) / 20 * 1e3:.1f} ms, {len(r.json())} rows")
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM clients WHERE firm_id = 1 AND id < 5000 ORDER BY id DESC LIMIT 101"
+        )).all()
+    print("plan:", "; ".join(row[-1] for row in plan))
+
+if __name__ == "__main__":
+    main_check(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
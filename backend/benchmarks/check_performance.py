@@ -0,0 +1,96 @@
+"""
+Correctness check + timing: price_metrics() (every symbol in one pass over
+the price matrix) vs the same metrics computed per symbol with pandas,
+against an in-memory SQLite.
+
+    cd backend && python benchmarks/check_performance.py [symbols]
+
+Prices have gaps, late starts and duplicate (symbol, date) rows from later
+files, which must win. Matrices are read from the table, not the price
+store (see check_price_store.py).
+"""
+import math
+import os
+import sys
+import time
+from datetime import date
+
+os.environ["PRICE_STORE_DIR"] = ""
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from services.performance import TRADING_DAYS, batch_performance, price_metrics  # noqa: E402
+from services.prices import load_price_matrix  # noqa: E402
+
+def fill_prices(db, batch_id: int, symbols, days, rng: np.random.Generator):
+    records = []
+    for j, symbol in enumerate(symbols):
+        first = int(rng.integers(0, len(days) // 2)) if j % 3 == 0 else 0
+        path = 100 * np.cumprod(1 + rng.normal(0, 0.02, len(days)))
+        for i in range(first, len(days)):
+            if rng.random() < 0.05:
+                continue
+            records.append(dict(batch_id=batch_id, symbol=symbol, date=days[i], price=round(float(path[i]), 6)))
+            if rng.random() < 0.01:
+                records.append(dict(batch_id=batch_id, symbol=symbol, date=days[i], price=round(float(path[i]) * 1.01, 6)))
+    db.execute(insert(models.Price), records)
+    return pd.DataFrame(records)
+
+def reference(prices: pd.DataFrame, symbols, last_day) -> pd.DataFrame:
+    wide = (
+        prices.drop_duplicates(["symbol", "date"], keep="last")
+        .pivot(index="date", columns="symbol", values="price")
+        .reindex(columns=symbols).sort_index().astype(float)
+    )
+    out = {}
+    for symbol in symbols:
+        p = wide[symbol].ffill()
+        base = p[p.index <= (pd.Timestamp(last_day) - pd.DateOffset(months=3)).date()]
+        out[symbol] = {
+            "volatility": p.pct_change(fill_method=None).std() * math.sqrt(TRADING_DAYS),
+            "total_return": p.iloc[-1] / p.dropna().iloc[0] - 1,
+            "max_drawdown": (p / p.cummax() - 1).min(),
+            "return_3m": p.iloc[-1] / base.iloc[-1] - 1 if len(base) else np.nan,
+        }
+    return pd.DataFrame(out).T
+
+def main(n_symbols: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.Firm(id=1, name="check"))
+    db.add(models.Client(id=1, firm_id=1, name="check"))
+    batch = models.Batch(firm_id=1, client_id=1, as_of_date=date(2024, 6, 28))
+    db.add(batch)
+    db.flush()
+
+    rng = np.random.default_rng(0)
+    symbols = [f"S{i:05d}" for i in range(n_symbols)]
+    days = list(pd.bdate_range("2023-06-01", "2024-06-28").date)
+    db.add_all(models.Position(batch_id=batch.id, symbol=s, market_value=float(rng.uniform(1, 1e6))) for s in symbols)
+    prices = fill_prices(db, batch.id, symbols, days, rng)
+    db.flush()
+
+    t0 = time.perf_counter()
+    matrix = load_price_matrix(db, batch.firm_id, symbols, use_cache=False)
+    t1 = time.perf_counter()
+    got = pd.DataFrame({k: v for k, v in price_metrics(matrix).items() if k != "observations"}, index=matrix.symbols)
+    t2 = time.perf_counter()
+    ref = reference(prices, matrix.symbols, days[-1])
+    t3 = time.perf_counter()
+    for col in ref.columns:
+        assert np.allclose(ref[col], got[col], rtol=1e-10, equal_nan=True), col
+    batch_performance(db, batch.id, batch.as_of_date)
+
+    print(f"{n_symbols:,} symbols x {len(matrix.dates)} dates: load {(t1 - t0) * 1000:.1f} ms, "
+          f"metrics {(t2 - t1) * 1000:.1f} ms, per-symbol pandas {(t3 - t2) * 1000:.1f} ms")
+    print("metrics identical")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,95 @@
+"""
+Correctness check + timing for the head-only /mappings/preview.
+
+    cd backend && python benchmarks/check_preview.py [megabytes]
+
+Posts a set of awkward CSVs (duplicate and blank headers, blank lines,
+CRLF, no trailing newline, NA cells, header only) and asserts the
+response matches the previous full-read implementation (reproduced
+below), with exact total_rows. Then times a file of the given size
+(default 256 MB) below and above PREVIEW_COUNT_MAX_BYTES.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'preview.db')}")
+os.environ.setdefault("PRICE_STORE_DIR", "")
+
+import pandas as pd  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services.preview import preview_csv  # noqa: E402
+
+CASES = {
+    "plain": "Symbol,Name,Quantity,Price\nAAPL,Apple,10,190.5\nMSFT,Microsoft,5,410\n",
+    "duplicates and blanks": "Symbol,,Symbol,Value\nA,x,B,1\nC,,D,\nE,y,F,3.25\nG,z,H,4\nI,w,J,5\nK,v,L,6\n",
+    "blank lines": "\nSymbol,Qty\n\nA,1\n\n\nB,2\n\n",
+    "crlf": "Symbol,Qty\r\nA,1\r\n\r\nB,2\r\nC,3",
+    "no trailing newline": "Symbol,Qty\nA,1\nB,2",
+    "na cells": "Symbol,Qty,Notes\nA,,NA\nB,2,null\n,3,x\n",
+    "quoted commas": 'Symbol,Value\nA,"1,000.50"\nB,"$2,000"\n',
+    "header only": "Symbol,Qty\n",
+}
+MAPPING = {"symbol": 0, "quantity": 1, "name": 2, "missing": None, "last": -1, "out": 9}
+
+def previous_preview(content: bytes, mapping: dict) -> dict:
+    df = pd.read_csv(io.BytesIO(content))
+    headers = df.columns.tolist()
+    sample_rows = []
+    for _, row in df.head(5).iterrows():
+        mapped_row = {}
+        for field, col_idx in mapping.items():
+            if col_idx is not None and col_idx < len(headers):
+                mapped_row[field] = str(row.iloc[col_idx])
+        sample_rows.append(mapped_row)
+    return {"headers": headers, "sample_rows": sample_rows, "total_rows": len(df)}
+
+def post(client: TestClient, content: bytes, **form) -> dict:
+    r = client.post("/mappings/preview", files={"file": ("x.csv", content, "text/csv")},
+                    data={"mapping": json.dumps(MAPPING), **form})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def main_check(megabytes: int):
+    client = TestClient(main.app)
+    for label, text in CASES.items():
+        content = text.encode()
+        got = post(client, content)
+        assert got.pop("total_rows_approximate") is False, label
+        assert got == previous_preview(content, MAPPING), (label, got)
+        for budget in (1, 7, 16):  # scans cut short: flagged, estimated
+            sampled = preview_csv(io.BytesIO(content), MAPPING, max_bytes=budget)
+            assert sampled["total_rows_approximate"] is (budget < len(content)), label
+    assert len(post(client, CASES["duplicates and blanks"].encode(), rows=2)["sample_rows"]) == 2
+    print("identical to the previous preview, exact total_rows")
+
+    row = b"AAPL,Apple Inc.,Information Technology,123.456789,190.12,23471.55,USD\n"
+    with tempfile.TemporaryFile() as f:
+        f.write(b"Symbol,Name,Sector,Quantity,Price,Market Value,Currency\n")
+        block = row * ((1 << 20) // len(row))
+        for _ in range(megabytes):
+            f.write(block)
+        size, rows = f.tell(), megabytes * (len(block) // len(row))
+        for budget in (size + 1, 64 << 20):
+            f.seek(0)
+            t0 = time.perf_counter()
+            got = preview_csv(f, MAPPING, max_bytes=budget)
+            elapsed = time.perf_counter() - t0
+            assert got["total_rows_approximate"] is (budget <= size)
+            assert abs(got["total_rows"] - rows) <= rows * 0.01, (got["total_rows"], rows)
+            print(f"{size / 1e6:,.0f} MB, count budget {budget / 1e6:,.0f} MB: {elapsed * 1e3:,.0f} ms, "
+                  f"total_rows {got['total_rows']:,} (actual {rows:,}, approximate={got['total_rows_approximate']})")
+        f.seek(0)
+        t0 = time.perf_counter()
+        previous_preview(f.read(), MAPPING)
+        print(f"{size / 1e6:,.0f} MB, previous full read: {(time.perf_counter() - t0) * 1e3:,.0f} ms")
+
+if __name__ == "__main__":
+    main_check(int(sys.argv[1]) if len(sys.argv) > 1 else 256)
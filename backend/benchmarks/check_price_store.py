@@ -0,0 +1,129 @@
+"""
+Correctness check + timing: price matrices cut from the memory-mapped
+store (services/price_store.py) vs read from the prices table, through the
+store's whole life: first build, incremental appends that add symbols and
+extend the grid on either side, overlapping files where the later row must
+win, another firm's prices for the same symbols (never visible to the first
+firm), prices dated far outside the grid's window (left to the table),
+files applied out of order, and a file removal.
+
+    cd backend && python benchmarks/check_price_store.py
+
+Runs against a throwaway SQLite database and store directory.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+STORE_DIR = tempfile.mkdtemp()
+os.environ["PRICE_STORE_DIR"] = STORE_DIR
+
+import numpy as np  # noqa: E402
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from services.ingest import remove_batch_file  # noqa: E402
+from services.price_store import PriceStore, price_store  # noqa: E402
+from services.prices import clear_price_caches, load_price_matrix  # noqa: E402
+
+RANGES = [(None, None), (date(2020, 1, 1), date(2020, 3, 1)), (date(2019, 12, 20), None), (None, date(2018, 1, 1))]
+
+def add_file(db, batch_id, symbols, first, last, rng):
+    f = models.File(firm_id=db.get(models.Batch, batch_id).firm_id)
+    db.add(f)
+    db.flush()
+    records = [
+        dict(batch_id=batch_id, symbol=s, date=first + timedelta(k), price=float(rng.uniform(1, 100)), source_file_id=f.id)
+        for s in symbols for k in range((last - first).days + 1) if rng.random() < 0.5
+    ]
+    db.execute(insert(models.Price), records)
+    db.commit()
+    price_store.add_files(db, [f.id])
+    clear_price_caches()  # as ingest does
+    return f.id
+
+def check(db, step, rng):
+    symbols = sorted({s for (s,) in db.query(models.Price.symbol).distinct()} | {"NOPRICE"})
+    some = sorted(rng.choice(symbols, min(len(symbols), 5), replace=False).tolist() + ["NOPRICE"])
+    for firm_id in (1, 2):
+        for start, end in RANGES:
+            for subset in (symbols, some):
+                want = load_price_matrix(db, firm_id, subset, start, end, use_cache=False)
+                direct = PriceStore(STORE_DIR).matrix(db, firm_id, want.symbols, start, end)  # None: read from the table
+                for got in [load_price_matrix(db, firm_id, subset, start, end)] + [direct] * (direct is not None):
+                    assert got.dates.tolist() == want.dates.tolist(), (step, firm_id, start, end)
+                    assert np.array_equal(got.values, want.values, equal_nan=True), (step, firm_id, start, end)
+
+def main():
+    engine = create_engine(f"sqlite:///{os.path.join(STORE_DIR, 'check.db')}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.Firm(id=1, name="check"), models.Firm(id=2, name="other")])
+    db.add_all([models.Client(id=1, firm_id=1, name="check"), models.Client(id=2, firm_id=2, name="other")])
+    batch = models.Batch(firm_id=1, client_id=1, as_of_date=date(2024, 6, 28))
+    other = models.Batch(firm_id=2, client_id=2, as_of_date=date(2024, 6, 28))
+    db.add_all([batch, other])
+    db.flush()
+    rng = np.random.default_rng(0)
+
+    check(db, "empty", rng)
+    add_file(db, batch.id, ["A", "B"], date(2020, 1, 1), date(2020, 2, 1), rng)
+    check(db, "first prices", rng)
+    add_file(db, batch.id, ["A", "C"], date(2020, 1, 15), date(2020, 3, 1), rng)
+    check(db, "overlapping file", rng)
+    add_file(db, batch.id, [f"S{i}" for i in range(100)], date(2020, 1, 1), date(2020, 1, 10), rng)
+    check(db, "new symbols", rng)
+    add_file(db, other.id, ["A", "C", "ONLY2"], date(2020, 1, 5), date(2020, 2, 10), rng)
+    check(db, "another firm", rng)
+    assert not len(load_price_matrix(db, 1, ["ONLY2"], use_cache=False).dates)
+    assert not len(PriceStore(STORE_DIR).matrix(db, 1, ["ONLY2"], None, None).dates)
+    add_file(db, batch.id, ["A"], date(2019, 12, 1), date(2019, 12, 31), rng)
+    check(db, "earlier days", rng)
+    add_file(db, batch.id, ["B"], date(2022, 1, 1), date(2022, 1, 5), rng)
+    check(db, "later days", rng)
+    add_file(db, batch.id, ["A"], date(1900, 1, 1), date(1900, 1, 3), rng)
+    add_file(db, batch.id, ["B"], date(2204, 1, 1), date(2204, 1, 3), rng)
+    check(db, "outlier dates", rng)
+    store = PriceStore(STORE_DIR)
+    assert store.matrix(db, 1, ["A"], None, None) is None
+    assert store.matrix(db, 1, ["A"], date(2020, 1, 1), date(2020, 3, 1)) is not None
+    assert store._current(db).values.shape[1] < 4000, store._current(db).values.shape  # not 300 years of days
+    file_id = add_file(db, batch.id, ["A", "B"], date(2020, 1, 10), date(2020, 1, 20), rng)
+    remove_batch_file(db, batch.id, file_id)
+    check(db, "file removed", rng)
+
+    older, newer = models.File(firm_id=1), models.File(firm_id=1)
+    db.add_all([older, newer])
+    db.flush()
+    for f, price in ((older, 1.0), (newer, 2.0)):
+        db.execute(insert(models.Price), [dict(batch_id=batch.id, symbol="A", date=date(2020, 1, 1), price=price, source_file_id=f.id)])
+    db.commit()
+    price_store.add_files(db, [newer.id])
+    price_store.add_files(db, [older.id])
+    clear_price_caches()
+    check(db, "applied out of order", rng)
+
+    price_store.invalidate()
+    check(db, "rebuilt", rng)
+
+    symbols = sorted({s for (s,) in db.query(models.Price.symbol).distinct()})
+    span = (date(2019, 1, 1), date(2022, 12, 31))  # clear of the outliers
+    t0 = time.perf_counter()
+    load_price_matrix(db, 1, symbols, *span, use_cache=False)
+    t1 = time.perf_counter()
+    assert PriceStore(STORE_DIR).matrix(db, 1, symbols, *span) is not None
+    t2 = time.perf_counter()
+    print(f"{len(symbols)} symbols: table {(t1 - t0) * 1000:.1f} ms, store (cold process) {(t2 - t1) * 1000:.1f} ms")
+    print("store matrices identical")
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(STORE_DIR, ignore_errors=True)
@@ -0,0 +1,92 @@
+"""
+Correctness check + timing: the vectorized _smart_numeric vs
+series.apply(_to_number), the per-cell reference it replaces.
+
+    cd backend && python benchmarks/check_smart_numeric.py [rows ...]
+
+Fuzzes columns of custodian-style cells (currency signs, thousands
+separators, parentheses, percents, dashes, null tokens, odd whitespace,
+strings float() accepts or rejects in surprising ways, mixed Python
+types) and asserts the results are identical bit for bit (NaN where the
+reference has NaN, same sign of zero). Then times both on clean, mostly
+clean and dirty text columns (default 1M rows).
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.utils import _smart_numeric, _to_number  # noqa: E402
+
+ODD = ["", " ", "—", "-", "nan", "NaN", "None", "NULL", "null", "inf", "-Infinity", "-nan", "1_000", "1e3%",
+       "(5%)", "$(5)", "( 1,234.50 )", "()", "(", "%", "12.5 %", "  42 ", "€1.234,5", "¥ 7", "£-3",
+       "0x10", "1e400", "(0)", "(0%)", "+.5", "5.", "1.2.3", "N/A", "abc", "٣.٥", "1d5", "$", "( )"]
+
+def reference(series: pd.Series) -> np.ndarray:
+    return series.apply(_to_number).astype(float).to_numpy()
+
+def identical(a: np.ndarray, b: np.ndarray) -> bool:
+    return a.shape == b.shape and bool(np.all((a.view(np.int64) == b.view(np.int64)) | (np.isnan(a) & np.isnan(b))))
+
+def messy_cell(rng: np.random.Generator):
+    r = rng.random()
+    x = round(float(rng.normal(0, 1e5)), int(rng.integers(0, 5)))
+    if r < 0.3:
+        return str(x)
+    if r < 0.5:
+        return ODD[rng.integers(len(ODD))]
+    if r < 0.7:
+        text = f"{abs(x):,.2f}"
+        text = ("$" if rng.random() < 0.5 else "") + text
+        text = f"({text})" if x < 0 else text
+        return (" " if rng.random() < 0.3 else "") + text + ("%" if rng.random() < 0.1 else "")
+    if r < 0.8:
+        return None if rng.random() < 0.5 else np.nan
+    if r < 0.9:
+        return x
+    return [int(x), True, np.float32(x), np.int64(7)][rng.integers(4)]
+
+def columns(rng: np.random.Generator, rows: int):
+    cells = [messy_cell(rng) for _ in range(rows)]
+    strings = [c if isinstance(c, str) else None for c in cells]
+    yield pd.Series(cells, dtype=object)
+    yield pd.Series(strings, dtype=object)
+    yield pd.Series(strings, dtype="string")
+    yield pd.Series([str(v) for v in rng.normal(0, 1e4, rows)], dtype=object)
+    yield pd.Series(rng.normal(0, 1e4, rows))
+    yield pd.Series(rng.integers(-5, 5, rows))
+    yield pd.Series(rng.integers(-5, 5, rows)).astype("Int64").where(rng.random(rows) < 0.8)
+    yield pd.Series(rng.random(rows) < 0.5)
+    yield pd.Series([x for x in (1, 2.5, True, None)] * (rows // 4), dtype=object)
+    yield pd.Series([], dtype=object)
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    for seed in range(20):
+        for series in columns(np.random.default_rng(seed), 2000):
+            assert identical(_smart_numeric(series).to_numpy(), reference(series)), (seed, series.dtype)
+    for cell in ODD:
+        series = pd.Series([cell], dtype=object)
+        assert identical(_smart_numeric(series).to_numpy(), reference(series)), cell
+    print("identical to series.apply(_to_number)")
+
+    for rows in sizes:
+        clean = pd.Series(np.round(rng.lognormal(5, 2, rows), 2).astype(str), dtype=object)
+        formatted = pd.Series([f"${v:,.2f}" for v in rng.lognormal(5, 2, rows)], dtype=object)
+        mostly = clean.copy()
+        mostly[rng.random(rows) < 0.05] = formatted
+        for label, series in (("clean", clean), ("5% formatted", mostly), ("all formatted", formatted)):
+            t0 = time.perf_counter()
+            expected = reference(series)
+            t1 = time.perf_counter()
+            got = _smart_numeric(series).to_numpy()
+            t2 = time.perf_counter()
+            assert identical(got, expected), label
+            print(f"{rows:>10,} rows, {label:<14}  apply {t1 - t0:7.3f}s   vectorized {t2 - t1:7.3f}s"
+                  f"   x{(t1 - t0) / (t2 - t1):.1f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000_000])
@@ -0,0 +1,91 @@
+"""
+Correctness check + timing: analyze_batch_sql (aggregated in the database)
+vs compute_batch_analysis on the pandas path, against an in-memory SQLite.
+
+    cd backend && python benchmarks/check_sql_analytics.py [seeds]
+
+Fills batches with messy positions (NULL / "nan" / blank text, zero or
+missing MV, the same symbol across several holdings, negative values) and
+asserts both engines return the same analysis. Values are drawn without
+exact ties, where the engines may order equal holdings differently (see
+services/sql_analytics.py); duplicate_symbols, where equal counts are
+common, is compared as a set.
+"""
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from services.batch_analysis import compute_batch_analysis  # noqa: E402
+
+TEXT = ["Tech", "Energy", "", None, "nan", "None", " Health ", "NaN"]
+
+def fill_batch(db, batch_id: int, rows: int, rng: np.random.Generator) -> None:
+    n_symbols = max(2, rows // 3)
+    symbols = [f"S{i:05d}" for i in range(n_symbols)] + ["", "nan"]
+
+    def maybe(values, null_share):
+        return [None if rng.random() < null_share else v for v in values]
+
+    qty = maybe(np.round(rng.uniform(-50, 5000, rows), 4).tolist(), 0.1)
+    price = maybe(np.round(rng.lognormal(3, 1, rows), 4).tolist(), 0.1)
+    mv = maybe(np.round(rng.uniform(-1e3, 1e7, rows), 2).tolist(), 0.2)
+    for i in rng.choice(rows, rows // 10, replace=False):
+        mv[i] = 0.0
+    db.add_all(
+        models.Position(
+            batch_id=batch_id,
+            symbol=symbols[rng.integers(len(symbols))],
+            name=f"Name {rng.integers(3)}" if rng.random() < 0.9 else None,
+            quantity=qty[i],
+            price=price[i],
+            market_value=mv[i],
+            sector=TEXT[rng.integers(len(TEXT))],
+            currency="USD" if rng.random() < 0.9 else None,
+        )
+        for i in range(rows)
+    )
+
+def canonical(analysis) -> str:
+    diagnostics = dict(analysis["diagnostics"], duplicate_symbols=sorted(analysis["diagnostics"]["duplicate_symbols"]))
+    return json.dumps(dict(analysis, diagnostics=diagnostics))
+
+def main(seeds):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.Firm(id=1, name="check"))
+    db.add(models.Client(id=1, firm_id=1, name="check"))
+    db.flush()
+
+    checked = 0
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        for rows in (0, 1, 2, 5, 12, 100, 1_000, 20_000):
+            batch = models.Batch(firm_id=1, client_id=1, as_of_date=date.today())
+            db.add(batch)
+            db.flush()
+            fill_batch(db, batch.id, rows, rng)
+            db.flush()
+
+            t0 = time.perf_counter()
+            ref = compute_batch_analysis(db, batch.id, engine="pandas")
+            t1 = time.perf_counter()
+            got = compute_batch_analysis(db, batch.id, engine="sql")
+            t2 = time.perf_counter()
+            assert canonical(ref) == canonical(got), f"seed {seed}, {rows} rows:\n{ref}\n{got}"
+            checked += 1
+            if rows >= 1_000:
+                print(f"{rows:>7,} rows  pandas {(t1 - t0) * 1000:8.1f} ms  sql {(t2 - t1) * 1000:8.1f} ms")
+    print(f"{checked} batches identical")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [0, 1, 2])
@@ -1,19 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import date
-import pandas as pd
-import io
 import json
 
-from config import CORS_ORIGINS
-from database import Base, engine, get_db
+from config import (
+    COMPACT_HOLDINGS_FRAMES, CORS_ORIGINS, LIST_PAGE_MAX, LIST_PAGE_SIZE, MONTE_CARLO_MAX_HORIZONS,
+    MONTE_CARLO_MAX_PATHS, PREVIEW_SAMPLE_ROWS,
+)
+from database import Base, SessionLocal, engine, get_db
 import models
 import schemas
 from services.utils import normalize_custodian_csv
 from services.analytics import analyze_portfolio
-from services.ingest import ingest_batch, header_signature
+from services.ingest import ingest_batch, header_signature, remove_batch_file, ParsedFile
+from services.mapping_cache import mapping_cache
+from services.jobs import enqueue_ingest, job_status, resume_jobs
+from services.batch_analysis import analyze_batches, get_batch_analysis, latest_batch_ids
+from services.performance import TRADING_DAYS, batch_performance
+from services.risk import ESTIMATORS, batch_risk
+from services.montecarlo import CONFIDENCES, HORIZONS, MIN_CONFIDENCE, MODELS, batch_monte_carlo
+from services.batch_diff import stream_batch_diff
+from services.preview import preview_csv
 
 app = FastAPI(title="CapX100 API", version="0.1.0")
 
@@ -23,55 +33,97 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Create tables at startup for dev
 Base.metadata.create_all(bind=engine)
 
+@app.on_event("startup")
+def resume_ingest_jobs():
+    # background ingests queued before a restart
+    resume_jobs()
+
+# ---- Keyset pagination (list endpoints) ----
+def keyset_page(query, model, cursor: int | None, limit: int, response: Response) -> list:
+    """
+    One page of query, newest first (id descending), starting after `cursor`
+    (the last id of the previous page). When more rows follow, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    """
+    if cursor is not None:
+        query = query.filter(model.id < cursor)
+    rows = query.order_by(model.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 # ---- Upload Endpoint (Modified to Save AND Display) ----
 @app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
-    # Read all files into memory once
-    file_contents = []
-    for file in files:
-        content = await file.read()
-        file_contents.append((file.filename, content))
-    
-    # Save to database with full provenance tracking
-    batch_result = ingest_batch(
-        db,
-        firm_id=1,  # Default firm for testing
-        client_id=1,  # Default client for testing
-        as_of=date.today(),
-        created_by=None,
-        files=[(f[0], f[1], None) for f in file_contents]
-    )
-    
-    # Process first file for immediate display (existing logic)
-    if file_contents:
-        df = pd.read_csv(io.BytesIO(file_contents[0][1]))
-        normalized_df = normalize_custodian_csv(df)
-        analysis = analyze_portfolio(normalized_df)
-        
-        # Add batch info to the analysis
-        analysis['batch_id'] = batch_result['batch_id']
-        analysis['files_saved'] = len(batch_result['files'])
-        analysis['positions_saved'] = batch_result['positions']
-        
-        return {
-            "message": f"Files uploaded and saved as batch {batch_result['batch_id']}",
-            "rows": len(normalized_df),
-            "columns": list(normalized_df.columns),
-            "performance": analysis,
-            "batch_id": batch_result['batch_id'],
-            "saved_to_database": True
-        }
-    
-    return {"message": "No files uploaded", "saved_to_database": False}
+def upload_files(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    if not files:
+        return {"message": "No files uploaded", "saved_to_database": False}
+
+    # Each file in turn: parsed once, persisted into the batch, analyzed from the same frame and released,
+    # so memory is bounded by the largest file rather than the whole request. A plain def, run in the
+    # threadpool: parsing and ingest block
+    batch, saved, analyses, headline_error = None, {"files": 0, "positions": 0}, [], None
+    for f in files:
+        try:
+            parsed, parse_error = ParsedFile(f.file), None
+        except Exception as e:
+            f.file.seek(0)
+            parsed, parse_error = None, e  # ingest streams it instead, and records it as failed
+        result = ingest_batch(
+            db,
+            firm_id=1,  # Default firm for testing
+            client_id=1,  # Default client for testing
+            as_of=date.today(),
+            created_by=None,
+            files=[(f.filename, parsed or f.file, None)],
+            batch=batch,  # the first file creates the batch, the rest are appended to it
+        )
+        batch = batch or db.get(models.Batch, result["batch_id"])
+        saved["files"] += len(result["files"])
+        saved["positions"] += result["positions"]
+        try:
+            if parse_error is not None:
+                raise parse_error
+            normalized_df = normalize_custodian_csv(parsed.table(), compact=COMPACT_HOLDINGS_FRAMES)
+            analyses.append({
+                "filename": f.filename,
+                "rows": len(normalized_df),
+                "columns": list(normalized_df.columns),
+                "performance": analyze_portfolio(normalized_df),
+            })
+        except Exception as e:
+            if not analyses:
+                headline_error = e  # the headline file failing is still an error, once every file is saved
+            analyses.append({"filename": f.filename, "error": str(e)})
+        parsed = normalized_df = None  # released before the next file is parsed
+    if headline_error is not None:
+        raise headline_error
+
+    # First file stays the headline result (existing response shape)
+    analysis = dict(analyses[0]["performance"])
+    analysis['batch_id'] = batch.id
+    analysis['files_saved'] = saved["files"]
+    analysis['positions_saved'] = saved["positions"]
+
+    return {
+        "message": f"Files uploaded and saved as batch {batch.id}",
+        "rows": analyses[0]["rows"],
+        "columns": analyses[0]["columns"],
+        "performance": analysis,
+        "files": analyses,
+        "batch_id": batch.id,
+        "saved_to_database": True
+    }
 
 # ---- Clients ----
 @app.post("/clients", response_model=schemas.ClientOut)
@@ -83,8 +135,10 @@ def create_client(payload: schemas.ClientCreate, db: Session = Depends(get_db)):
     return client
 
 @app.get("/clients", response_model=List[schemas.ClientOut])
-def list_clients(firm_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Client).filter(models.Client.firm_id == firm_id).order_by(models.Client.id.desc()).all()
+def list_clients(response: Response, firm_id: int, cursor: int | None = Query(None, ge=1),
+                 limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX), db: Session = Depends(get_db)):
+    q = db.query(models.Client).filter(models.Client.firm_id == firm_id)
+    return keyset_page(q, models.Client, cursor, limit, response)
 
 # ---- Accounts ----
 @app.post("/accounts", response_model=schemas.AccountOut)
@@ -99,17 +153,20 @@ def create_account(payload: schemas.AccountCreate, db: Session = Depends(get_db)
     return acct
 
 @app.get("/accounts", response_model=List[schemas.AccountOut])
-def list_accounts(client_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Account).filter(models.Account.client_id == client_id).order_by(models.Account.id.desc()).all()
+def list_accounts(response: Response, client_id: int, cursor: int | None = Query(None, ge=1),
+                  limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX), db: Session = Depends(get_db)):
+    q = db.query(models.Account).filter(models.Account.client_id == client_id)
+    return keyset_page(q, models.Account, cursor, limit, response)
 
 # ---- Batches: list/get ----
 @app.get("/batches", response_model=List[schemas.BatchOut])
-def list_batches(firm_id: int, client_id: int, db: Session = Depends(get_db)):
+def list_batches(response: Response, firm_id: int, client_id: int, cursor: int | None = Query(None, ge=1),
+                 limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX), db: Session = Depends(get_db)):
     q = db.query(models.Batch).filter(
         models.Batch.firm_id == firm_id,
         models.Batch.client_id == client_id
-    ).order_by(models.Batch.id.desc())
-    return q.all()
+    )
+    return keyset_page(q, models.Batch, cursor, limit, response)
 
 @app.get("/batches/{batch_id}", response_model=schemas.BatchOut)
 def get_batch(batch_id: int, db: Session = Depends(get_db)):
@@ -118,21 +175,160 @@ def get_batch(batch_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Batch not found")
     return b
 
+@app.get("/batches/{batch_id}/analysis", response_model=schemas.BatchAnalysisOut)
+def get_batch_analysis_endpoint(batch_id: int, db: Session = Depends(get_db)):
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if b.status != "ingested":
+        raise HTTPException(status_code=409, detail=f"Batch is {b.status}, not ingested")
+    return get_batch_analysis(db, batch_id)
+
+@app.get("/batches/{batch_id}/performance", response_model=schemas.BatchPerformanceOut)
+def get_batch_performance(batch_id: int, start: date | None = None, end: date | None = None,
+                          db: Session = Depends(get_db)):
+    # holdings weighted by market value over stored prices; defaults to the year up to as_of_date
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if b.status != "ingested":
+        raise HTTPException(status_code=409, detail=f"Batch is {b.status}, not ingested")
+    if start and end and start > end:
+        raise HTTPException(status_code=422, detail="start is after end")
+    return batch_performance(db, batch_id, b.as_of_date, start, end)
+
+@app.get("/batches/{batch_id}/risk", response_model=schemas.BatchRiskOut)
+def get_batch_risk(batch_id: int, estimator: str = "shrinkage", start: date | None = None,
+                   end: date | None = None, db: Session = Depends(get_db)):
+    # covariance of daily returns over the window (default: the year up to as_of_date)
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if b.status != "ingested":
+        raise HTTPException(status_code=409, detail=f"Batch is {b.status}, not ingested")
+    if estimator not in ESTIMATORS:
+        raise HTTPException(status_code=422, detail=f"estimator must be one of {', '.join(ESTIMATORS)}")
+    if start and end and start > end:
+        raise HTTPException(status_code=422, detail="start is after end")
+    return batch_risk(db, batch_id, b.as_of_date, start, end, estimator)
+
+@app.get("/batches/{batch_id}/montecarlo", response_model=schemas.BatchMonteCarloOut)
+def get_batch_monte_carlo(
+    batch_id: int,
+    paths: int = 100_000,
+    model: str = "bootstrap",
+    horizons: List[int] = Query(list(HORIZONS)),
+    confidences: List[float] = Query(list(CONFIDENCES)),
+    seed: int | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    db: Session = Depends(get_db),
+):
+    # simulated VaR/CVaR; pass the returned seed back to reproduce a run
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if b.status != "ingested":
+        raise HTTPException(status_code=409, detail=f"Batch is {b.status}, not ingested")
+    if model not in MODELS:
+        raise HTTPException(status_code=422, detail=f"model must be one of {', '.join(MODELS)}")
+    if not 1 <= paths <= MONTE_CARLO_MAX_PATHS:
+        raise HTTPException(status_code=422, detail=f"paths must be between 1 and {MONTE_CARLO_MAX_PATHS}")
+    if not horizons or not all(1 <= h <= TRADING_DAYS for h in horizons):
+        raise HTTPException(status_code=422, detail=f"horizons must be between 1 and {TRADING_DAYS} days")
+    if len(horizons) > MONTE_CARLO_MAX_HORIZONS:
+        raise HTTPException(status_code=422, detail=f"at most {MONTE_CARLO_MAX_HORIZONS} horizons per request")
+    if not confidences or not all(MIN_CONFIDENCE <= c < 1 for c in confidences):
+        raise HTTPException(status_code=422, detail=f"confidences must be at least {MIN_CONFIDENCE} and below 1")
+    if seed is not None and seed < 0:
+        raise HTTPException(status_code=422, detail="seed must be non-negative")
+    if start and end and start > end:
+        raise HTTPException(status_code=422, detail="start is after end")
+    return batch_monte_carlo(db, batch_id, b.as_of_date, paths=paths, model=model, horizons=horizons,
+                             confidences=confidences, seed=seed, start=start, end=end)
+
+@app.get("/batches/{batch_a}/diff/{batch_b}")
+def diff_batches(batch_a: int, batch_b: int, by_account: bool | None = None, include_unchanged: bool = False,
+                 db: Session = Depends(get_db)):
+    # holdings of batch_b against batch_a, streamed; by_account defaults to "both batches have accounts"
+    found = {b.id: b for b in db.query(models.Batch).filter(models.Batch.id.in_([batch_a, batch_b]))}
+    for batch_id in (batch_a, batch_b):
+        if batch_id not in found:
+            raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+        if found[batch_id].status != "ingested":
+            raise HTTPException(status_code=409, detail=f"Batch {batch_id} is {found[batch_id].status}, not ingested")
+    if found[batch_a].firm_id != found[batch_b].firm_id:
+        raise HTTPException(status_code=422, detail="Batches belong to different firms")
+
+    def stream():
+        # own session: the request's may be closed before the body is sent
+        session = SessionLocal()
+        try:
+            yield from stream_batch_diff(session, batch_a, batch_b, by_account, include_unchanged)
+        finally:
+            session.close()
+    return StreamingResponse(stream(), media_type="application/json")
+
+@app.get("/batches/{batch_id}/status", response_model=schemas.IngestJobOut)
+def get_batch_status(batch_id: int, db: Session = Depends(get_db)):
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return job_status(db, b)
+
+@app.delete("/batches/{batch_id}/files/{file_id}", response_model=schemas.BatchFileRemoved)
+def remove_file_from_batch(batch_id: int, file_id: int, db: Session = Depends(get_db)):
+    # e.g. before re-ingesting a corrected file into the same batch (/ingest/batch with batch_id)
+    b = db.query(models.Batch).filter_by(id=batch_id).first()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if b.status != "ingested":
+        raise HTTPException(status_code=409, detail=f"Batch is {b.status}, not ingested")
+    removed = remove_batch_file(db, batch_id, file_id)
+    return schemas.BatchFileRemoved(batch_id=batch_id, file_id=file_id, **removed)
+
+# ---- Firm-wide analytics ----
+@app.get("/firms/{firm_id}/analysis", response_model=List[schemas.BatchAnalysisOut])
+def get_firm_analysis(firm_id: int, db: Session = Depends(get_db)):
+    # latest ingested batch of every client, analyzed together (cached per batch)
+    return analyze_batches(db, latest_batch_ids(db, firm_id))
+
 # ---- Ingest: multi-file ----
-@app.post("/ingest/batch", response_model=schemas.BatchIngestResult)
-async def ingest_batch_endpoint(
+@app.post("/ingest/batch", response_model=schemas.BatchIngestResult | schemas.IngestJobOut)
+def ingest_batch_endpoint(
+    response: Response,
     firm_id: int = Form(...),
     client_id: int = Form(...),
     as_of_date: date = Form(...),
     created_by: int | None = Form(None),
+    background: bool = Form(False),
+    batch_id: int | None = Form(None),
     files: list[UploadFile] = File(...),
     db: Session = Depends(get_db),
 ):
-    # Read all files into memory (v1). For very large files, stream chunk-by-chunk in v2.
-    payload = []
-    for up in files:
-        content = await up.read()
-        payload.append((up.filename, content, None))  # custodian_hint=None v1
+    # Stream each upload (spooled by Starlette) chunk-by-chunk straight into ingest. A plain def: spooling and
+    # ingest block, so FastAPI runs this in its threadpool rather than on the event loop
+    payload = [(up.filename, up.file, None) for up in files]  # custodian_hint=None v1
+    batch = None
+    if batch_id is not None:
+        # append to an existing batch
+        batch = db.query(models.Batch).filter_by(id=batch_id, firm_id=firm_id, client_id=client_id).first()
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if batch.status != "ingested" or background:
+            raise HTTPException(status_code=409, detail="Only ingested batches can be appended to, inline")
+    if background:
+        # store the files, queue the batch and return; poll GET /batches/{id}/status
+        job = enqueue_ingest(
+            db,
+            firm_id=firm_id,
+            client_id=client_id,
+            as_of=as_of_date,
+            created_by=created_by,
+            files=payload,
+        )
+        response.status_code = 202
+        return schemas.IngestJobOut(batch_id=job.batch_id, status=job.status, files_total=job.files_total)
     res = ingest_batch(
         db,
         firm_id=firm_id,
@@ -140,15 +336,17 @@ async def ingest_batch_endpoint(
         as_of=as_of_date,
         created_by=created_by,
         files=payload,
+        batch=batch,
     )
     return schemas.BatchIngestResult(**res)
 
 # ---- Mappings Management ----
 @app.get("/mappings")
-def list_mappings(firm_id: int, db: Session = Depends(get_db)):
-    mappings = db.query(models.Mapping).filter(
-        models.Mapping.firm_id == firm_id
-    ).order_by(models.Mapping.id.desc()).all()
+def list_mappings(response: Response, firm_id: int, cursor: int | None = Query(None, ge=1),
+                  limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX), db: Session = Depends(get_db)):
+    mappings = keyset_page(
+        db.query(models.Mapping).filter(models.Mapping.firm_id == firm_id), models.Mapping, cursor, limit, response
+    )
     
     result = []
     for m in mappings:
@@ -182,7 +380,9 @@ def save_mapping(
     if existing:
         existing.json_mapping = json.dumps(mapping_dict)
         existing.custodian_hint = custodian_hint
+        existing.version = (existing.version or 1) + 1  # files parsed with the old version are not deduped against
         db.commit()
+        mapping_cache.invalidate(firm_id, sig)
         return {"message": "Mapping updated", "id": existing.id}
     else:
         new_mapping = models.Mapping(
@@ -194,32 +394,24 @@ def save_mapping(
         )
         db.add(new_mapping)
         db.commit()
+        mapping_cache.invalidate(firm_id, sig)
         return {"message": "Mapping created", "id": new_mapping.id}
 
+@app.get("/mappings/cache")
+def mapping_cache_stats():
+    """Hit/miss counters of the in-process mapping cache used by ingest"""
+    return mapping_cache.stats()
+
 @app.post("/mappings/preview")
-async def preview_with_mapping(
+def preview_with_mapping(
     file: UploadFile = File(...),
-    mapping: str = Form(...)  # JSON mapping
+    mapping: str = Form(...),  # JSON mapping
+    rows: int = Form(PREVIEW_SAMPLE_ROWS, ge=1, le=1000),
 ):
-    """Preview how a file would look with a specific mapping"""
-    content = await file.read()
-    mapping_dict = json.loads(mapping)
-    
-    # Parse CSV
-    df = pd.read_csv(io.BytesIO(content))
-    headers = df.columns.tolist()
-    
-    # Apply mapping to get sample data
-    sample_rows = []
-    for _, row in df.head(5).iterrows():
-        mapped_row = {}
-        for field, col_idx in mapping_dict.items():
-            if col_idx is not None and col_idx < len(headers):
-                mapped_row[field] = str(row.iloc[col_idx])
-        sample_rows.append(mapped_row)
-    
-    return {
-        "headers": headers,
-        "sample_rows": sample_rows,
-        "total_rows": len(df)
-    }
\ No newline at end of file
+    """
+    Preview how a file would look with a specific mapping: headers, the
+    first `rows` rows and total_rows. Only the head of the file is parsed,
+    and total_rows is a newline count, estimated (total_rows_approximate)
+    for files past PREVIEW_COUNT_MAX_BYTES.
+    """
+    return preview_csv(file.file, json.loads(mapping), rows)
\ No newline at end of file
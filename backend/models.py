@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Numeric, Date, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Numeric, Date, Boolean, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -28,6 +28,8 @@ class Client(Base):
     external_id = Column(String(200))
     created_at = Column(DateTime, server_default=func.now())
     firm = relationship("Firm")
+    # (filter, id) composite indexes serve the id-descending keyset pages of the list endpoints
+    __table_args__ = (Index("ix_clients_firm_id_id", "firm_id", "id"),)
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -39,6 +41,7 @@ class Account(Base):
     currency = Column(String(10), default="USD")
     created_at = Column(DateTime, server_default=func.now())
     client = relationship("Client")
+    __table_args__ = (Index("ix_accounts_client_id_id", "client_id", "id"),)
 
 class Batch(Base):
     __tablename__ = "batches"
@@ -50,16 +53,70 @@ class Batch(Base):
     status = Column(String(50), default="ingested")
     notes = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
+    __table_args__ = (Index("ix_batches_firm_client_id", "firm_id", "client_id", "id"),)
 
 class File(Base):
     __tablename__ = "files"
     id = Column(Integer, primary_key=True)
     firm_id = Column(Integer, ForeignKey("firms.id"), nullable=False)
     sha256 = Column(String(64))
+    # mapping (and its version) the file was parsed with; content dedup only links files parsed the same way
+    mapping_id = Column(Integer, ForeignKey("mappings.id"))
+    mapping_version = Column(Integer)
     storage_path = Column(Text)
     size_bytes = Column(Integer)
     mime = Column(String(120))
     created_at = Column(DateTime, server_default=func.now())
+    __table_args__ = (
+        Index("ix_files_firm_sha256", "firm_id", "sha256"),
+        Index("ix_files_firm_size", "firm_id", "size_bytes"),  # dedup: only same-size uploads are hashed up front
+    )
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"), nullable=False, unique=True)
+    status = Column(String(50), default="queued")  # queued / running / ingested / failed
+    payload_json = Column(Text)  # spooled files: [{filename, path, custodian_hint}]
+    files_total = Column(Integer, default=0)
+    files_done = Column(Integer, default=0)
+    rows_processed = Column(Integer, default=0)
+    result_json = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # last progress write while running; resume_jobs() requeues stale ones
+    finished_at = Column(DateTime)
+
+class BatchAnalysis(Base):
+    __tablename__ = "batch_analyses"
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"), nullable=False)
+    analytics_version = Column(String(40), nullable=False)
+    result_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    __table_args__ = (UniqueConstraint("batch_id", "analytics_version", name="uq_batch_analyses_batch_version"),)
+
+class HoldingAggregate(Base):
+    # running analytics state: one row per (batch, source file, holding), see services/batch_state.py
+    __tablename__ = "holding_aggregates"
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"), nullable=False)
+    file_id = Column(Integer, ForeignKey("files.id"))
+    symbol = Column(String(40), nullable=False)  # normalized: stripped, "" when missing
+    name = Column(String(255), nullable=False)
+    sector = Column(String(120), nullable=False)
+    currency = Column(String(10), nullable=False)
+    market_value = Column(Float, nullable=False)  # sum, as groupby().sum() computes it
+    market_value_residual = Column(Float, nullable=False, default=0.0)  # exact sum - market_value
+    rows = Column(Integer, nullable=False)
+    priced_rows = Column(Integer, nullable=False)  # price > 0
+    mv_positive_rows = Column(Integer, nullable=False)
+    mv_zero_rows = Column(Integer, nullable=False)
+    quantity_set_rows = Column(Integer, nullable=False)  # non-zero
+    price_set_rows = Column(Integer, nullable=False)
+    mv_set_rows = Column(Integer, nullable=False)
+    __table_args__ = (Index("ix_holding_aggregates_batch_file", "batch_id", "file_id"),)
 
 class Mapping(Base):
     __tablename__ = "mappings"
@@ -70,6 +127,7 @@ class Mapping(Base):
     json_mapping = Column(Text)
     version = Column(Integer, default=1)
     created_at = Column(DateTime, server_default=func.now())
+    __table_args__ = (Index("ix_mappings_firm_id_id", "firm_id", "id"),)
 
 class Position(Base):
     __tablename__ = "positions"
@@ -87,6 +145,7 @@ class Position(Base):
     as_of_date = Column(Date)
     source_file_id = Column(Integer, ForeignKey("files.id"))
     source_row = Column(Integer)
+    __table_args__ = (Index("ix_positions_batch_id", "batch_id"),)
 
 class Price(Base):
     __tablename__ = "prices"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import date as _date
 
 # Clients / Accounts
@@ -44,6 +44,9 @@ class BatchFileInfo(BaseModel):
     file_id: int
     kind: str
     rows: int
+    unparsed_dates: int = 0
+    error: str | None = None
+    deduplicated: bool = False
 
 class BatchIngestResult(BaseModel):
     batch_id: int
@@ -51,6 +54,23 @@ class BatchIngestResult(BaseModel):
     positions: int
     prices: int
     balances: int
+    deduplicated: int = 0
+
+class BatchFileRemoved(BaseModel):
+    batch_id: int
+    file_id: int
+    positions: int
+    prices: int
+    balances: int
+
+class IngestJobOut(BaseModel):
+    batch_id: int
+    status: str
+    files_total: int = 0
+    files_done: int = 0
+    rows_processed: int = 0
+    error: str | None = None
+    result: BatchIngestResult | None = None
 
 class BatchOut(BaseModel):
     id: int
@@ -60,4 +80,46 @@ class BatchOut(BaseModel):
     status: str
     notes: str | None = None
     class Config: 
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BatchAnalysisOut(BaseModel):
+    batch_id: int
+    analytics_version: str
+    cached: bool
+    analysis: Dict[str, Any]
+
+class BatchPerformanceOut(BaseModel):
+    batch_id: int
+    start: _date
+    end: _date
+    trading_days: int
+    priced_weight: float
+    unpriced_symbols: List[str]
+    portfolio: Dict[str, Any]
+    holdings: List[Dict[str, Any]]
+
+class BatchRiskOut(BaseModel):
+    batch_id: int
+    start: _date
+    end: _date
+    estimator: str
+    shrinkage: float
+    trading_days: int
+    modeled_value: float
+    modeled_weight: float
+    excluded_symbols: List[str]
+    daily_volatility: float
+    annual_volatility: float
+    var: List[Dict[str, Any]]
+    contributions: List[Dict[str, Any]]
+
+class BatchMonteCarloOut(BaseModel):
+    batch_id: int
+    start: _date
+    end: _date
+    model: str
+    paths: int
+    seed: int
+    history_days: int
+    modeled_value: float
+    results: List[Dict[str, Any]]
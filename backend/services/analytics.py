@@ -1,6 +1,11 @@
+import math
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+# Bump whenever analyze_portfolio's output changes; cached batch analyses
+# computed under another version are recomputed on next read.
+ANALYTICS_VERSION = "1"
 
 # --------- Helpers ---------
 
@@ -45,10 +50,593 @@ def _round4(x: float) -> float:
     except Exception:
         return 0.0
 
+# --------- Single-pass kernel ---------
+
+KEY_COLUMNS = ["symbol", "name", "sector", "currency"]
+
+def _nansum(values: np.ndarray) -> float:
+    """Series.sum(): NaN skipped, same (pairwise) summation order."""
+    return float(np.where(np.isnan(values), 0.0, values).sum())
+
+def _nargsort_desc(values: np.ndarray) -> np.ndarray:
+    """Series.sort_values(ascending=False)'s order (default quicksort, NaN last), tie order included."""
+    mask = np.isnan(values) if values.dtype.kind == "f" else np.zeros(len(values), dtype=bool)
+    idx = np.arange(len(values))
+    non_nans = values[~mask][::-1]
+    indexer = idx[~mask][::-1][non_nans.argsort(kind="quicksort")][::-1]
+    return np.concatenate([indexer, np.flatnonzero(mask)])
+
+def _fsum(values: np.ndarray) -> float:
+    """
+    math.fsum, the exactly rounded sum, where every value is finite and the
+    sum does not overflow; otherwise (inf, NaN) the plain float sum, as
+    fsum raises on inf - inf and on overflow.
+    """
+    if np.isfinite(values).all():
+        try:
+            return math.fsum(values)
+        except OverflowError:
+            pass
+    return float(np.sum(values))
+
+def _residual(values: np.ndarray, total: float) -> float:
+    """Exact sum of the finite values minus total; 0.0 where total is not finite (or fsum overflows)."""
+    if not math.isfinite(total):
+        return 0.0
+    try:
+        return math.fsum(np.append(values[np.isfinite(values)], -total))
+    except OverflowError:
+        return 0.0
+
+def _group_sum(values: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Per-code sums for dense codes 0..n-1, with groupby().sum()'s compensated summation."""
+    return pd.Series(values, copy=False).groupby(codes, sort=True).sum().to_numpy()
+
+def _all_strings(uniques: np.ndarray) -> bool:
+    return pd.api.types.infer_dtype(uniques, skipna=False) == "string"
+
+def _compact(codes: np.ndarray, uniques: np.ndarray):
+    """Drop uniques no code refers to (pd.factorize of a subset); -1 stays -1."""
+    used = np.bincount(codes[codes >= 0], minlength=len(uniques)) > 0
+    if used.all():
+        return codes, uniques
+    remap = np.append(np.cumsum(used) - 1, -1)
+    return remap[codes], uniques[used]
+
+_WHITESPACE = np.array([c for c in range(0x3000 + 1) if chr(c).isspace()], dtype=np.uint32)
+
+def _blank_strings(uniques: np.ndarray) -> np.ndarray:
+    """isinstance(u, str) and not u.strip(), per unique."""
+    if _all_strings(uniques) and len(uniques):
+        fixed = uniques.astype(str)
+        # only strings that are empty or start with whitespace need the real check
+        first = fixed.view(np.uint32).reshape(len(fixed), -1)[:, 0] if fixed.itemsize else np.zeros(len(fixed), np.uint32)
+        candidates = np.flatnonzero((first == 0) | np.isin(first, _WHITESPACE))
+        out = np.zeros(len(uniques), dtype=bool)
+        out[candidates] = [not uniques[i].strip() for i in candidates]
+        return out
+    return np.fromiter((isinstance(u, str) and not u.strip() for u in uniques), dtype=bool, count=len(uniques))
+
+def _factorize(series: pd.Series):
+    """pd.factorize(series): a categorical's own codes (unused categories dropped) instead of rehashing."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _compact(series.cat.codes.to_numpy(dtype=np.intp), series.cat.categories.to_numpy(dtype=object))
+    return pd.factorize(series.to_numpy())
+
+def _factorize_sorted(values: np.ndarray, factorized=None):
+    """
+    pd.factorize(values, sort=True, use_na_sentinel=False): codes numbered in
+    sorted order, NaN last. All-string columns sort their uniques as a
+    fixed-width unicode array (same code-point order, no Python comparisons).
+    `factorized` reuses an unsorted pd.factorize(values) result.
+    """
+    codes, uniques = pd.factorize(values) if factorized is None else factorized
+    if not _all_strings(uniques):
+        return pd.factorize(values, sort=True, use_na_sentinel=False)
+    fixed = uniques.astype(str)
+    order = np.argsort(fixed, kind="stable")
+    ordered = fixed[order]
+    if (ordered[1:] == ordered[:-1]).any():  # numpy drops trailing NULs: "a" vs "a\0" collide
+        return pd.factorize(values, sort=True, use_na_sentinel=False)
+    rank = np.empty(len(uniques) + 1, dtype=np.intp)
+    rank[order] = np.arange(len(uniques))
+    rank[-1] = len(uniques)  # code -1 (NaN) goes last
+    uniques = uniques[order]
+    if (codes == -1).any():
+        uniques = np.append(uniques, np.nan)
+    return rank[codes], uniques
+
+def _factorize_keys(columns: List[np.ndarray], factorized: Dict[int, tuple]):
+    """
+    Codes for the combined key, numbered in groupby(keys, dropna=False)
+    order (lexicographic, NaN last per key), plus per-key (codes, uniques).
+    """
+    combined, span, per_key = None, 1, []
+    for i, col in enumerate(columns):
+        codes, uniques = _factorize_sorted(col, factorized.get(i))
+        per_key.append((codes, uniques))
+        size = max(len(uniques), 1)
+        if span * size >= 2 ** 62:  # compact before the mixed-radix code could overflow
+            combined, _ = pd.factorize(combined, sort=True)
+            span = int(combined.max()) + 1
+        combined = codes.astype(np.int64) if combined is None else combined * size + codes
+        span *= size
+    combined, _ = pd.factorize(combined, sort=True)
+    return combined, per_key
+
+def _first_rows(codes: np.ndarray, n_groups: int) -> np.ndarray:
+    first = np.empty(n_groups, dtype=np.int64)
+    first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    return first
+
+def _native(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return np.nan if value is None or value is pd.NA else value
+
+def _top_k_sorted(weights_sorted: np.ndarray, k: int) -> float:
+    """_top_k_weight() for weights already in descending order."""
+    head = weights_sorted[:k]
+    if len(head) and (np.isnan(head).any() or (head == 0).any()):
+        # NaNs / signed zeros: let the exact sort decide which values are summed
+        head = weights_sorted[_nargsort_desc(weights_sorted)][:k]
+    return _nansum(head) if len(weights_sorted) else 0.0
+
+def portfolio_kernel(df: pd.DataFrame) -> Dict:
+    """
+    analyze_portfolio() on factorized NumPy arrays, without copying the frame:
+    one factorization of the holding keys feeds the per-holding sums, sector
+    sums, HHI, top-k and duplicate checks; the only sort is over holdings
+    (top-k reads its prefix). Results are bit-identical to
+    analyze_portfolio_pandas(), including float summation order and tie order.
+    """
+    return _kernel(df, None, 1)[0]
+
+def portfolios_kernel(df: pd.DataFrame, by: str) -> Dict:
+    """
+    portfolio_kernel() for many portfolios in one frame, keyed by column `by`
+    (e.g. batch_id): {key: analysis}, each equal to analyze_portfolio() of
+    that portfolio's rows. Numeric coercion, key factorization and the
+    holding/sector sums run once over all rows, with the portfolio as the
+    leading group key; only the per-portfolio ordering (holdings by value,
+    top-k, duplicates) is done portfolio by portfolio, on their group sums.
+    """
+    labels, uniques = pd.factorize(df[by], sort=True)
+    if (labels == -1).any():
+        raise ValueError(f"{by} has missing values")
+    results = _kernel(df, labels, len(uniques))
+    return {_native(k): r for k, r in zip(uniques, results)}
+
+def _kernel(df: pd.DataFrame, portfolio: Optional[np.ndarray], n_portfolios: int) -> List[Dict]:
+    """
+    Shared body of portfolio_kernel/portfolios_kernel. `portfolio` holds a
+    dense code 0..n_portfolios-1 per row (None: a single portfolio).
+    """
+    def column(c: str) -> pd.Series:
+        return df[c] if c in df.columns else pd.Series(np.nan, index=df.index)
+
+    def per_portfolio(codes: np.ndarray) -> np.ndarray:
+        return np.bincount(codes, minlength=n_portfolios)
+
+    qty = _safe_num(column("quantity")).to_numpy()
+    price = _safe_num(column("price")).to_numpy()
+    mv = _safe_num(column("market_value")).to_numpy(copy=True)
+    mv0 = mv == 0
+    mv[mv0] = (qty * price)[mv0]
+    if portfolio is None:
+        portfolio = np.zeros(len(mv), dtype=np.intp)
+
+    # noise rows: no symbol and zero MV
+    sym_codes, sym_uniques = _factorize(column("symbol"))
+    sym_blank = np.append(_blank_strings(sym_uniques), False)[sym_codes]  # code -1 (NaN) reads as "nan", not blank
+    sym_missing = (sym_codes == -1) | sym_blank
+    keep = ~(sym_missing & (mv == 0))
+    all_kept = bool(keep.all())
+
+    def kept(a: np.ndarray) -> np.ndarray:
+        return a if all_kept else a[keep]
+
+    mv_k, price_k, qty_k, port_k = kept(mv), kept(price), kept(qty), kept(portfolio)
+    rows = per_portfolio(port_k)
+    row_end = np.cumsum(rows)
+    if n_portfolios > 1:
+        # each portfolio's rows contiguous, in frame order (sums depend on order)
+        mv_rows = mv_k[np.argsort(port_k, kind="stable")]
+    else:
+        mv_rows = mv_k
+
+    # holdings: groupby(symbol, name, sector, currency), portfolio as the leading key
+    key_cols = [kept(column(c).to_numpy()) for c in KEY_COLUMNS]
+    lead = 1 if n_portfolios > 1 else 0
+    factorized = {lead: _compact(kept(sym_codes), sym_uniques)}  # symbol already hashed above
+    for j, c in enumerate(KEY_COLUMNS[1:], 1):
+        if isinstance(column(c).dtype, pd.CategoricalDtype):  # compact frames: codes as they are
+            codes, uniques = _factorize(column(c))
+            factorized[lead + j] = _compact(kept(codes), uniques)
+    codes, per_key = _factorize_keys([port_k] * lead + key_cols, factorized)
+    per_key = per_key[lead:]
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+    group_mv = _group_sum(mv_k, codes) if n_groups else np.zeros(0)
+    first = _first_rows(codes, n_groups)
+    group_end = np.cumsum(per_portfolio(port_k[first]))
+
+    # sectors: same codes as the sector key above, split by portfolio
+    sec_codes, sec_uniques = per_key[2]
+    if n_portfolios > 1 and len(sec_codes):
+        port_sec, port_sec_keys = pd.factorize(port_k * len(sec_uniques) + sec_codes, sort=True)
+        sec_sum = _group_sum(mv_k, port_sec)
+        sec_of = port_sec_keys % len(sec_uniques)
+        sec_end = np.cumsum(per_portfolio(port_sec_keys // len(sec_uniques)))
+    else:
+        sec_sum = _group_sum(mv_k, sec_codes) if len(sec_codes) else np.zeros(0)
+        sec_of = np.arange(len(sec_sum))
+        sec_end = np.full(n_portfolios, len(sec_sum))
+
+    # transparency / diagnostics counts
+    priced = per_portfolio(port_k[price_k > 0])
+    mv_pos = per_portfolio(port_k[mv_k > 0])
+    present = (per_portfolio(port_k[~kept(sym_blank)]) > 0).astype(int)
+    for a in (qty_k, price_k, mv_k):
+        present += per_portfolio(port_k[(a != 0) & ~np.isnan(a)]) > 0
+    missing_rows = per_portfolio(portfolio[sym_missing])
+    zero_mv_rows = per_portfolio(port_k[mv_k == 0])
+
+    # duplicates: str(symbol) is the symbol itself (NaN -> "nan") unless both occur
+    sym_codes_k, sym_sorted = per_key[0]
+    sym_na = pd.isna(sym_sorted)
+    sym_labels = sym_sorted[~sym_na]
+    count_codes = _all_strings(sym_labels) and not (sym_na.any() and "nan" in set(sym_labels))
+    sym_labels = np.append(sym_labels, "nan")
+    sym_group = sym_codes_k[first]
+    # groups are sorted by (portfolio, symbol, ...): repeated symbols are adjacent
+    repeats = (sym_group[1:] == sym_group[:-1]) & (port_k[first][1:] == port_k[first][:-1])
+    has_dupes = per_portfolio(port_k[first][1:][repeats]) > 0
+
+    results = []
+    for p in range(n_portfolios):
+        r0, r1 = row_end[p] - rows[p], row_end[p]
+        g0, g1 = (group_end[p - 1] if p else 0), group_end[p]
+        s0, s1 = (sec_end[p - 1] if p else 0), sec_end[p]
+        n = int(rows[p])
+        total_value = _nansum(mv_rows[r0:r1])
+
+        order = _nargsort_desc(group_mv[g0:g1])
+        mv_s = group_mv[g0:g1][order]
+        total_w = _nansum(mv_s)
+        w_s = mv_s * 0.0 if total_w <= 0 else mv_s / total_w
+        first_s = first[g0:g1][order]
+        keys_s = [u[c[first_s]] for c, u in per_key]  # key values per holding, sorted
+
+        w_pos = w_s[w_s > 0]
+        div_score = 0.0
+        if len(w_pos) > 1:
+            hhi = float((w_pos ** 2).sum())
+            div_score = float(max(0.0, min(1.0, (1.0 - hhi) / (1.0 - 1.0 / len(w_pos)))))
+
+        top_holdings = [
+            {
+                **{c: _native(keys_s[j][i]) for j, c in enumerate(KEY_COLUMNS)},
+                "market_value": _round2(mv_s[i]),
+                "weight": _round4(w_s[i]),
+            }
+            for i in range(min(10, len(mv_s)))
+        ]
+
+        sector_val_json, sector_wt_json = {}, {}
+        if n:
+            sec_order = _nargsort_desc(sec_sum[s0:s1])
+            sv = sec_sum[s0:s1][sec_order]
+            total_s = _nansum(sv)
+            sw = sv * 0.0 if total_s <= 0 else sv / total_s
+            labels = [str(k if pd.notna(k) else "Unclassified") for k in sec_uniques[sec_of[s0:s1][sec_order]]]
+            sector_val_json = {k: _round2(v) for k, v in zip(labels, sv)}
+            sector_wt_json = {k: _round4(w) for k, w in zip(labels, sw)}
+
+        priced_ratio = float(priced[p] / n) if n else 0.0
+        mv_ratio = float(mv_pos[p] / n) if n else 0.0
+        mapped_ratio = int(present[p]) / 4
+        transparency_score = 100.0 * (0.5 * mv_ratio + 0.3 * priced_ratio + 0.2 * mapped_ratio)
+
+        # diagnostics: symbols spread over several holdings, in value_counts() order
+        holding_syms = sym_group[g0:g1]
+        if count_codes and not has_dupes[p]:
+            vc_labels, counts = np.array([], dtype=object), np.zeros(0, dtype=np.int64)
+        elif count_codes:
+            vc_codes, vc_keys = pd.factorize(holding_syms[order])
+            vc_labels = sym_labels[np.where(sym_na[vc_keys], -1, vc_keys)]
+            counts = np.bincount(vc_codes, minlength=len(vc_labels))
+        else:
+            # value_counts() hashes Python objects; pd.factorize of an all-str array would
+            # hash C strings, where "a" and "a\0" collide
+            vc = pd.Series([str(v) for v in keys_s[0]], dtype=object).value_counts(sort=False)
+            vc_labels, counts = vc.index.to_numpy(), vc.to_numpy()
+        vc_order = _nargsort_desc(counts)
+        dupes = vc_labels[vc_order[counts[vc_order] > 1]].tolist()
+        held = np.unique(holding_syms)
+
+        results.append({
+            "total_value": _round2(total_value),
+            "holdings": int(len(held) - sym_na[held].sum()),
+            "sector_allocation_value": sector_val_json,
+            "sector_allocation_weight": sector_wt_json,
+            "top_holdings": top_holdings,
+            "top1_weight": _round4(_top_k_sorted(w_s, 1)),
+            "top3_weight": _round4(_top_k_sorted(w_s, 3)),
+            "top5_weight": _round4(_top_k_sorted(w_s, 5)),
+            "diversification_score": _round4(div_score),
+            "transparency": {
+                "priced_ratio": _round4(priced_ratio),
+                "mv_ratio": _round4(mv_ratio),
+                "mapped_ratio": _round4(mapped_ratio),
+                "score": _round2(transparency_score),
+            },
+            "diagnostics": {
+                "missing_symbol_rows": int(missing_rows[p]),
+                "zero_mv_rows": int(zero_mv_rows[p]),
+                "duplicate_symbols": dupes,
+            },
+        })
+    return results
+
 # --------- Public API ---------
 
+def _empty_result() -> Dict:
+    return {
+        "total_value": 0.0,
+        "holdings": 0,
+        "sector_allocation_value": {},
+        "sector_allocation_weight": {},
+        "top_holdings": [],
+        "top1_weight": 0.0,
+        "top3_weight": 0.0,
+        "top5_weight": 0.0,
+        "diversification_score": 0.0,
+        "transparency": {
+            "priced_ratio": 0.0,
+            "mv_ratio": 0.0,
+            "mapped_ratio": 0.0,
+            "score": 0.0
+        },
+        "diagnostics": {
+            "missing_symbol_rows": 0,
+            "zero_mv_rows": 0,
+            "duplicate_symbols": [],
+        }
+    }
+
 def analyze_portfolio(df: pd.DataFrame) -> Dict:
     """
+    Portfolio metrics for a normalized holdings frame (see
+    analyze_portfolio_pandas for the definitions); computed by
+    portfolio_kernel, with identical output.
+    """
+    if df is None or df.empty:
+        return _empty_result()
+    return portfolio_kernel(df)
+
+def analyze_portfolios(df: pd.DataFrame, by: str, keys: Optional[List] = None) -> Dict:
+    """
+    analyze_portfolio() for every portfolio in a frame of many, keyed by
+    column `by`, in one vectorized pass (portfolios_kernel). `keys` lists
+    portfolios expected in the result even when they have no rows.
+    """
+    results = portfolios_kernel(df, by) if df is not None and not df.empty else {}
+    for k in keys or []:
+        if k not in results:
+            results[k] = _empty_result()
+    return results
+
+HOLDING_COUNTS = [
+    "rows", "priced_rows", "mv_positive_rows", "mv_zero_rows",
+    "quantity_set_rows", "price_set_rows", "mv_set_rows",
+]
+HOLDING_COLUMNS = KEY_COLUMNS + ["market_value", "market_value_residual"] + HOLDING_COUNTS
+
+def holding_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-holding running state of a normalized holdings frame: one row per
+    (symbol, name, sector, currency) with the market_value sum (as
+    groupby().sum() gives it, plus the residual to the exact sum) and the
+    row counts (HOLDING_COUNTS) the transparency/diagnostic metrics need.
+    Aggregates of disjoint row sets combine with merge_holdings();
+    analyze_holdings() turns them back into analyze_portfolio()'s output.
+    """
+    aggregator = HoldingAggregator()
+    aggregator.add(df)
+    return aggregator.result()
+
+class HoldingAggregator:
+    """
+    holding_aggregates() of a frame fed in chunks (e.g. as ingest writes a
+    file), equal to it over their concatenation. Until result(), a row
+    costs only its holding's code and market value: the sums then come from
+    one compensated groupby sum in row order, as over the whole frame, and
+    the counts are added up per chunk.
+    """
+
+    def __init__(self):
+        self._codes: Dict[tuple, int] = {}  # holding key -> code, in order of first appearance
+        self._row_codes: List[np.ndarray] = []
+        self._row_mv: List[np.ndarray] = []
+        self._counts = np.zeros((0, len(HOLDING_COUNTS)), dtype=np.int64)
+
+    def add(self, df: pd.DataFrame) -> None:
+        """Add a normalized holdings frame (normalize_custodian_csv output)."""
+        if df is None or df.empty:
+            return
+        qty = _safe_num(df["quantity"])
+        price = _safe_num(df["price"])
+        mv = _safe_num(df["market_value"])
+        mv = mv.where(mv != 0, qty * price)
+        keys = df[KEY_COLUMNS].astype(str)
+        blank = keys["symbol"].str.strip() == ""
+        rows = pd.DataFrame({
+            **{c: keys[c] for c in KEY_COLUMNS},
+            "market_value": mv,
+            "rows": 1,
+            "priced_rows": (price > 0).astype(int),
+            "mv_positive_rows": (mv > 0).astype(int),
+            "mv_zero_rows": (mv == 0).astype(int),
+            "quantity_set_rows": (qty != 0).astype(int),
+            "price_set_rows": (price != 0).astype(int),
+            "mv_set_rows": (mv != 0).astype(int),
+        })[~(blank & (mv == 0))]  # noise rows, as analyze_portfolio drops them
+        if rows.empty:
+            return
+        grouped = rows.groupby(KEY_COLUMNS, sort=False)
+        local = grouped.ngroup().to_numpy()
+        first = rows[KEY_COLUMNS].to_numpy()[_first_rows(local, grouped.ngroups)]
+        codes = np.array([self._codes.setdefault(tuple(k), len(self._codes)) for k in first], dtype=np.int64)
+        if len(self._codes) > len(self._counts):
+            grown = np.zeros((len(self._codes), len(HOLDING_COUNTS)), dtype=np.int64)
+            grown[:len(self._counts)] = self._counts
+            self._counts = grown
+        self._counts[codes] += grouped[HOLDING_COUNTS].sum().to_numpy()
+        self._row_codes.append(codes[local])
+        self._row_mv.append(rows["market_value"].to_numpy(dtype=float))
+
+    def result(self) -> pd.DataFrame:
+        if not self._codes:
+            return pd.DataFrame(columns=HOLDING_COLUMNS)
+        codes = np.concatenate(self._row_codes)
+        values = np.concatenate(self._row_mv)
+        totals = _group_sum(values, codes)
+        # residuals over the finite values of holdings with several rows; a single value is its own exact sum
+        sizes = np.bincount(codes, minlength=len(totals))
+        residual = np.zeros(len(totals))
+        multi = np.flatnonzero(sizes > 1)
+        if len(multi):
+            values = values[np.argsort(codes, kind="stable")]
+            starts = np.concatenate([[0], np.cumsum(sizes)])
+            for g in multi:
+                residual[g] = _residual(values[starts[g]:starts[g + 1]], totals[g])
+        out = pd.DataFrame(list(self._codes), columns=KEY_COLUMNS)
+        out["market_value"] = totals
+        out["market_value_residual"] = residual
+        for j, c in enumerate(HOLDING_COUNTS):
+            out[c] = self._counts[:, j]
+        return out[HOLDING_COLUMNS]
+
+def merge_holdings(parts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Combine holding_aggregates() of several row sets (e.g. one per file)
+    into one row per holding. A holding present once keeps its sum as is;
+    sums of several parts are exact (math.fsum over sums and residuals)
+    unless one of them is not finite.
+    """
+    if parts.empty:
+        return pd.DataFrame(columns=HOLDING_COLUMNS)
+    grouped = parts.groupby(KEY_COLUMNS, sort=False)
+    out = grouped[HOLDING_COUNTS].sum().reset_index()
+    mv, residual = [], []
+    for total, rest in zip(grouped["market_value"].agg(list), grouped["market_value_residual"].agg(list)):
+        if len(total) == 1:
+            mv.append(total[0])
+            residual.append(rest[0])
+        else:
+            values = np.array(total + rest, dtype=float)
+            exact = _fsum(values)
+            mv.append(exact)
+            residual.append(_residual(values, exact))
+    out["market_value"] = mv
+    out["market_value_residual"] = residual
+    return out[HOLDING_COLUMNS]
+
+def analyze_holdings(holdings: pd.DataFrame) -> Dict:
+    """
+    analyze_portfolio() from per-holding aggregates (merge_holdings()
+    output, one row per holding key) in O(holdings) instead of O(rows).
+    Orderings and tie-breaks are analyze_portfolio()'s. Totals over several
+    holdings are the exactly rounded sums, where analyze_portfolio() sums
+    rows in floating point, so they can differ in the last bit (visible
+    only when a sum of sub-cent values sits on a rounding boundary).
+    """
+    if holdings is None or holdings.empty or not holdings["rows"].sum():
+        return _empty_result()
+    h = holdings.sort_values(KEY_COLUMNS, kind="stable")  # groupby order
+    symbols = h["symbol"].to_numpy()
+    group_mv = h["market_value"].to_numpy(dtype=float)
+    residual = h["market_value_residual"].to_numpy(dtype=float)
+    n = int(h["rows"].sum())
+
+    def exact_sum(idx: np.ndarray) -> float:
+        if len(idx) == 1:
+            return float(group_mv[idx[0]])
+        return _fsum(np.concatenate([group_mv[idx], residual[idx]]))
+
+    order = _nargsort_desc(group_mv)
+    mv_s = group_mv[order]
+    total_w = _nansum(mv_s)
+    w_s = mv_s * 0.0 if total_w <= 0 else mv_s / total_w
+    w_pos = w_s[w_s > 0]
+    div_score = 0.0
+    if len(w_pos) > 1:
+        hhi = float((w_pos ** 2).sum())
+        div_score = float(max(0.0, min(1.0, (1.0 - hhi) / (1.0 - 1.0 / len(w_pos)))))
+    keys_s = [h[c].to_numpy()[order] for c in KEY_COLUMNS]
+    top_holdings = [
+        {
+            **{c: keys_s[j][i] for j, c in enumerate(KEY_COLUMNS)},
+            "market_value": _round2(mv_s[i]),
+            "weight": _round4(w_s[i]),
+        }
+        for i in range(min(10, len(mv_s)))
+    ]
+
+    sec_codes, sec_uniques = pd.factorize(h["sector"].to_numpy(), sort=True)
+    sec_rows = np.argsort(sec_codes, kind="stable")
+    sec_sum = np.array([
+        exact_sum(idx) for idx in np.split(sec_rows, np.cumsum(np.bincount(sec_codes))[:-1])
+    ], dtype=float)
+    sec_order = _nargsort_desc(sec_sum)
+    sv = sec_sum[sec_order]
+    total_s = _nansum(sv)
+    sw = sv * 0.0 if total_s <= 0 else sv / total_s
+    labels = [str(k) for k in sec_uniques[sec_order]]
+
+    count = {c: int(h[c].sum()) for c in HOLDING_COUNTS}
+    priced_ratio = count["priced_rows"] / n
+    mv_ratio = count["mv_positive_rows"] / n
+    blank = np.array([not str(s).strip() for s in symbols], dtype=bool)
+    present = int(bool((~blank).any()))
+    for c in ("quantity_set_rows", "price_set_rows", "mv_set_rows"):
+        present += int(count[c] > 0)
+    mapped_ratio = present / 4
+    transparency_score = 100.0 * (0.5 * mv_ratio + 0.3 * priced_ratio + 0.2 * mapped_ratio)
+
+    vc_codes, vc_labels = pd.factorize(pd.Series(symbols[order], dtype=object))
+    counts = np.bincount(vc_codes, minlength=len(vc_labels))
+    vc_order = _nargsort_desc(counts)
+    dupes = np.asarray(vc_labels, dtype=object)[vc_order[counts[vc_order] > 1]].tolist()
+
+    return {
+        "total_value": _round2(exact_sum(np.arange(len(group_mv)))),
+        "holdings": int(pd.unique(symbols).size),
+        "sector_allocation_value": {k: _round2(v) for k, v in zip(labels, sv)},
+        "sector_allocation_weight": {k: _round4(w) for k, w in zip(labels, sw)},
+        "top_holdings": top_holdings,
+        "top1_weight": _round4(_top_k_sorted(w_s, 1)),
+        "top3_weight": _round4(_top_k_sorted(w_s, 3)),
+        "top5_weight": _round4(_top_k_sorted(w_s, 5)),
+        "diversification_score": _round4(div_score),
+        "transparency": {
+            "priced_ratio": _round4(priced_ratio),
+            "mv_ratio": _round4(mv_ratio),
+            "mapped_ratio": _round4(mapped_ratio),
+            "score": _round2(transparency_score),
+        },
+        "diagnostics": {
+            "missing_symbol_rows": int(h["rows"].to_numpy()[blank].sum()),
+            "zero_mv_rows": count["mv_zero_rows"],
+            "duplicate_symbols": dupes,
+        },
+    }
+
+def analyze_portfolio_pandas(df: pd.DataFrame) -> Dict:
+    """
+    Reference implementation (pandas, step by step); analyze_portfolio
+    must match it exactly.
+
     Enhanced minimal analysis (Step B):
       - Cleans numeric columns
       - Computes per-holding weights
@@ -61,28 +649,7 @@ def analyze_portfolio(df: pd.DataFrame) -> Dict:
       ['symbol','name','quantity','price','market_value','sector','currency']
     """
     if df is None or df.empty:
-        return {
-            "total_value": 0.0,
-            "holdings": 0,
-            "sector_allocation_value": {},
-            "sector_allocation_weight": {},
-            "top_holdings": [],
-            "top1_weight": 0.0,
-            "top3_weight": 0.0,
-            "top5_weight": 0.0,
-            "diversification_score": 0.0,
-            "transparency": {
-                "priced_ratio": 0.0,
-                "mv_ratio": 0.0,
-                "mapped_ratio": 0.0,
-                "score": 0.0
-            },
-            "diagnostics": {
-                "missing_symbol_rows": 0,
-                "zero_mv_rows": 0,
-                "duplicate_symbols": [],
-            }
-        }
+        return _empty_result()
 
     # Basic cleanup
     df = df.copy()
@@ -109,9 +676,10 @@ def analyze_portfolio(df: pd.DataFrame) -> Dict:
 
     # totals & weights
     total_value = float(df["market_value"].sum())
-    # group by symbol to consolidate duplicates
+    # group by symbol to consolidate duplicates (observed=True: categorical keys, as
+    # compact_holdings() makes them, group like the object ones)
     by_symbol = (
-        df.groupby(["symbol","name","sector","currency"], dropna=False)["market_value"]
+        df.groupby(["symbol","name","sector","currency"], dropna=False, observed=True)["market_value"]
           .sum()
           .reset_index()
           .sort_values("market_value", ascending=False)
@@ -136,7 +704,7 @@ def analyze_portfolio(df: pd.DataFrame) -> Dict:
 
     # sector allocation (value & weight)
     if "sector" in df.columns:
-        sector_val = df.groupby("sector", dropna=False)["market_value"].sum().sort_values(ascending=False)
+        sector_val = df.groupby("sector", dropna=False, observed=True)["market_value"].sum().sort_values(ascending=False)
         sector_wt = _weights(sector_val)
         sector_val_json = {str(k if pd.notna(k) else "Unclassified"): _round2(v) for k, v in sector_val.items()}
         sector_wt_json = {str(k if pd.notna(k) else "Unclassified"): _round4(v) for k, v in sector_wt.items()}
@@ -0,0 +1,153 @@
+# backend/services/batch_analysis.py
+"""
+Analysis of stored batches, computed from Position rows once per batch and
+analytics version and kept in batch_analyses. ingest_batch() deletes a
+batch's rows there whenever it writes the batch; a new ANALYTICS_VERSION
+simply misses (and the stale row is replaced on the next read).
+
+analyze_batches() does the same for many batches at once (e.g. the latest
+batch of every client of a firm): cache hits are read in bulk and the
+misses computed with the same engine as get_batch_analysis(), so a cached
+row does not depend on which endpoint filled it. On the pandas engine the
+misses are analyzed together, FIRM_ANALYSIS_CHUNK batches per vectorized
+pass, instead of one pandas pipeline per batch.
+"""
+from __future__ import annotations
+import json
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from config import ANALYTICS_ENGINE, COMPACT_HOLDINGS_FRAMES
+from services.analytics import ANALYTICS_VERSION, analyze_portfolio, analyze_portfolios
+from services.batch_state import analyze_batch_state
+from services.sql_analytics import analyze_batch_sql
+from services.utils import STANDARD_ORDER, normalize_custodian_csv
+
+FIRM_ANALYSIS_CHUNK = 500  # batches per vectorized pass (bounds memory)
+IN_CLAUSE_SIZE = 500  # ids per IN (...) list; older SQLite caps bound parameters at 999
+
+def positions_frame(db: Session, batch_id: int) -> pd.DataFrame:
+    """A batch's positions in the normalized upload schema (STANDARD_ORDER)."""
+    P = models.Position
+    rows = db.execute(
+        select(P.symbol, P.name, P.quantity, P.price, P.market_value, P.sector, P.currency)
+        .where(P.batch_id == batch_id)
+        .order_by(P.id)
+    ).all()
+    return pd.DataFrame.from_records(rows, columns=STANDARD_ORDER)
+
+def positions_frame_many(db: Session, batch_ids: List[int]) -> pd.DataFrame:
+    """positions_frame() of several batches, plus a batch_id column."""
+    P = models.Position
+    rows = []
+    for ids in _chunks(batch_ids, IN_CLAUSE_SIZE):
+        rows += db.execute(
+            select(P.symbol, P.name, P.quantity, P.price, P.market_value, P.sector, P.currency, P.batch_id)
+            .where(P.batch_id.in_(ids))
+            .order_by(P.id)
+        ).all()
+    return pd.DataFrame.from_records(rows, columns=STANDARD_ORDER + ["batch_id"])
+
+def compute_batch_analysis(db: Session, batch_id: int, engine: Optional[str] = None) -> Dict:
+    """
+    analyze_portfolio() of a stored batch. Engines (default ANALYTICS_ENGINE):
+    "incremental" derives it from the batch's holding aggregates, "sql"
+    aggregates in the database, "pandas" re-reads every position.
+    """
+    engine = engine or ANALYTICS_ENGINE
+    if engine == "incremental":
+        return analyze_batch_state(db, batch_id)
+    if engine == "sql":
+        return analyze_batch_sql(db, batch_id)
+    return analyze_portfolio(normalize_custodian_csv(positions_frame(db, batch_id), compact=COMPACT_HOLDINGS_FRAMES))
+
+def compute_batch_analyses(db: Session, batch_ids: List[int], engine: Optional[str] = None) -> Dict[int, Dict]:
+    """compute_batch_analysis() for each batch id; one vectorized pass on the pandas engine."""
+    engine = engine or ANALYTICS_ENGINE
+    if engine in ("incremental", "sql"):
+        return {b: compute_batch_analysis(db, b, engine) for b in batch_ids}
+    frame = normalize_custodian_csv(positions_frame_many(db, batch_ids), carry=["batch_id"],
+                                    compact=COMPACT_HOLDINGS_FRAMES)
+    return analyze_portfolios(frame, "batch_id", keys=batch_ids)
+
+def get_batch_analysis(db: Session, batch_id: int) -> Dict:
+    """
+    {"batch_id", "analytics_version", "cached", "analysis"} for an ingested
+    batch: read from batch_analyses, or computed and stored on a miss.
+    """
+    A = models.BatchAnalysis
+    hit: Optional[models.BatchAnalysis] = (
+        db.query(A).filter(A.batch_id == batch_id, A.analytics_version == ANALYTICS_VERSION).first()
+    )
+    if hit is not None:
+        return _out(batch_id, json.loads(hit.result_json), cached=True)
+
+    analysis = compute_batch_analysis(db, batch_id)
+    db.query(A).filter(A.batch_id == batch_id).delete(synchronize_session=False)  # other versions
+    db.add(A(batch_id=batch_id, analytics_version=ANALYTICS_VERSION, result_json=json.dumps(analysis)))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # a concurrent reader stored it first; same result
+    return _out(batch_id, analysis, cached=False)
+
+def analyze_batches(db: Session, batch_ids: List[int]) -> List[Dict]:
+    """get_batch_analysis() for many ingested batches, in batch id order."""
+    A = models.BatchAnalysis
+    ids = sorted(set(batch_ids))
+    out: Dict[int, Dict] = {}
+    for chunk in _chunks(ids, FIRM_ANALYSIS_CHUNK):
+        hits = {}
+        for part in _chunks(chunk, IN_CLAUSE_SIZE):
+            hits.update(
+                (a.batch_id, a.result_json)
+                for a in db.query(A.batch_id, A.result_json)
+                .filter(A.batch_id.in_(part), A.analytics_version == ANALYTICS_VERSION)
+            )
+        for batch_id, result_json in hits.items():
+            out[batch_id] = _out(batch_id, json.loads(result_json), cached=True)
+
+        missing = [b for b in chunk if b not in hits]
+        if not missing:
+            continue
+        computed = compute_batch_analyses(db, missing)
+        for part in _chunks(missing, IN_CLAUSE_SIZE):
+            db.query(A).filter(A.batch_id.in_(part)).delete(synchronize_session=False)  # other versions
+        db.add_all(
+            A(batch_id=b, analytics_version=ANALYTICS_VERSION, result_json=json.dumps(computed[b]))
+            for b in missing
+        )
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # a concurrent reader stored some first; same results
+        for b in missing:
+            out[b] = _out(b, computed[b], cached=False)
+    return [out[b] for b in ids]
+
+def latest_batch_ids(db: Session, firm_id: int) -> List[int]:
+    """The newest ingested batch of each of a firm's clients."""
+    B = models.Batch
+    return [
+        batch_id for (batch_id,) in db.execute(
+            select(func.max(B.id))
+            .where(B.firm_id == firm_id, B.status == "ingested")
+            .group_by(B.client_id)
+        )
+    ]
+
+def invalidate_batch_analysis(db: Session, batch_id: int) -> None:
+    """Drop cached analyses for a batch (caller commits)."""
+    db.query(models.BatchAnalysis).filter(models.BatchAnalysis.batch_id == batch_id).delete(synchronize_session=False)
+
+def _out(batch_id: int, analysis: Dict, cached: bool) -> Dict:
+    return {"batch_id": batch_id, "analytics_version": ANALYTICS_VERSION, "cached": cached, "analysis": analysis}
+
+def _chunks(ids: List[int], size: int) -> Iterator[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
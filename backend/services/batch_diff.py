@@ -0,0 +1,126 @@
+# backend/services/batch_diff.py
+"""
+What changed between two batches, holding by holding.
+
+Both batches are reduced to one row per key, (account_id, symbol) when
+both batches carry accounts and symbol otherwise, by a GROUP BY in the
+database over the rows analyze_portfolio() sees (normalized as in
+services/sql_analytics.py). The smaller side is loaded into a dict; the
+other side is streamed from the database and probed against it, and the
+keys left in the dict afterwards are the ones only the smaller side has.
+Time is O(holdings of both), memory O(holdings of the smaller one), and
+the result is written out as JSON while it is computed, never held whole.
+
+Per key: quantity and market value in each batch, their changes, and the
+weight drift (weight in b - weight in a, weights over each batch's total
+value). A key is "added" or "removed" if only one batch has it, "changed"
+if its quantity (6 dp) or market value (2 dp) differs, else "unchanged";
+unchanged keys are left out of the stream unless asked for but still
+count toward the summary's turnover (half the sum of |weight drift|).
+Rows come in the database's grouping order.
+"""
+from __future__ import annotations
+import json
+from typing import Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, null, select
+from sqlalchemy.orm import Session
+
+import models
+from services.sql_analytics import normalized_rows
+
+STREAM_ROWS = 2000  # rows fetched per round trip from the probed batch
+FLUSH_BYTES = 1 << 16
+
+Key = Tuple[Optional[int], str]
+
+def _grouped(batch_id: int, by_account: bool):
+    rows = normalized_rows(batch_id, with_account=by_account)
+    r = rows.c
+    account = r.account_id if by_account else null()
+    return (
+        select(account.label("account_id"), r.symbol, func.sum(r.quantity), func.sum(r.market_value))
+        .group_by(*([r.account_id] if by_account else []), r.symbol)
+    )
+
+def _has_accounts(db: Session, batch_id: int) -> bool:
+    P = models.Position
+    return db.query(P.id).filter(P.batch_id == batch_id, P.account_id.isnot(None)).first() is not None
+
+def _total(db: Session, batch_id: int) -> Tuple[int, float]:
+    r = normalized_rows(batch_id).c
+    n, total = db.execute(select(func.count(), func.coalesce(func.sum(cast(r.market_value, Float)), 0.0))).one()
+    return int(n), float(total)
+
+def _row(key: Key, by_account: bool, a: Optional[Tuple[float, float]], b: Optional[Tuple[float, float]],
+         total_a: float, total_b: float) -> Dict:
+    qty_a, mv_a = a or (0.0, 0.0)
+    qty_b, mv_b = b or (0.0, 0.0)
+    w_a = mv_a / total_a if total_a > 0 else 0.0
+    w_b = mv_b / total_b if total_b > 0 else 0.0
+    if a is None:
+        change = "added"
+    elif b is None:
+        change = "removed"
+    elif round(qty_a, 6) != round(qty_b, 6) or round(mv_a, 2) != round(mv_b, 2):
+        change = "changed"
+    else:
+        change = "unchanged"
+    return {
+        **({"account_id": key[0]} if by_account else {}),
+        "symbol": key[1],
+        "change": change,
+        "quantity_a": round(qty_a, 6) if a else None,
+        "quantity_b": round(qty_b, 6) if b else None,
+        "quantity_change": round(qty_b - qty_a, 6),
+        "market_value_a": round(mv_a, 2) if a else None,
+        "market_value_b": round(mv_b, 2) if b else None,
+        "market_value_change": round(mv_b - mv_a, 2),
+        "weight_a": round(w_a, 6),
+        "weight_b": round(w_b, 6),
+        "weight_drift": round(w_b - w_a, 6),
+    }
+
+def _pairs(db: Session, batch_a: int, batch_b: int, by_account: bool, rows_a: int, rows_b: int
+           ) -> Iterator[Tuple[Key, Optional[Tuple[float, float]], Optional[Tuple[float, float]]]]:
+    """(key, (quantity, mv) in a or None, same in b) for every key of either batch."""
+    build_id, probe_id = (batch_a, batch_b) if rows_a <= rows_b else (batch_b, batch_a)
+    build: Dict[Key, Tuple[float, float]] = {
+        (acc, sym): (float(q or 0.0), float(mv or 0.0))
+        for acc, sym, q, mv in db.execute(_grouped(build_id, by_account))
+    }
+    probe = db.execute(_grouped(probe_id, by_account).execution_options(yield_per=STREAM_ROWS))
+    for acc, sym, q, mv in probe:
+        probed, built = (float(q or 0.0), float(mv or 0.0)), build.pop((acc, sym), None)
+        yield ((acc, sym), built, probed) if probe_id == batch_b else ((acc, sym), probed, built)
+    for key, built in build.items():  # keys only the hashed batch has
+        yield (key, built, None) if build_id == batch_a else (key, None, built)
+
+def stream_batch_diff(db: Session, batch_a: int, batch_b: int, by_account: Optional[bool] = None,
+                      include_unchanged: bool = False) -> Iterator[str]:
+    """The diff of batch_b against batch_a, as chunks of one JSON document."""
+    if by_account is None:
+        by_account = _has_accounts(db, batch_a) and _has_accounts(db, batch_b)
+    rows_a, total_a = _total(db, batch_a)
+    rows_b, total_b = _total(db, batch_b)
+
+    head = {"batch_a": batch_a, "batch_b": batch_b, "by_account": by_account,
+            "total_value_a": round(total_a, 2), "total_value_b": round(total_b, 2)}
+    buf, size, sep = [json.dumps(head)[:-1] + ', "changes": ['], 0, ""
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    abs_drift = 0.0
+    for key, a, b in _pairs(db, batch_a, batch_b, by_account, rows_a, rows_b):
+        row = _row(key, by_account, a, b, total_a, total_b)
+        counts[row["change"]] += 1
+        abs_drift += abs(row["weight_drift"])
+        if row["change"] == "unchanged" and not include_unchanged:
+            continue
+        text = sep + json.dumps(row)
+        sep = ", "
+        buf.append(text)
+        size += len(text)
+        if size >= FLUSH_BYTES:
+            yield "".join(buf)
+            buf, size = [], 0
+    buf.append('], "summary": ' + json.dumps({**counts, "turnover": round(abs_drift / 2, 6)}) + "}")
+    yield "".join(buf)
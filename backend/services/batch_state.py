@@ -0,0 +1,166 @@
+# backend/services/batch_state.py
+"""
+Running analytics state per batch, kept in holding_aggregates: for every
+(batch, source file, holding) the market-value sum and the row counts
+analyze_portfolio() needs (see analytics.holding_aggregates).
+
+ingest_batch() records each positions file's aggregates as it writes the
+file, inside the file's savepoint; remove_batch_file() deletes a file's rows and its aggregates, which
+subtracts it exactly. A batch's analysis is then derived from the summed
+aggregates in O(holdings) (analytics.analyze_holdings) instead of
+re-reading every position. Batches ingested before the state existed get
+it built on first read, or before files are appended to them.
+"""
+from __future__ import annotations
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+from services.analytics import (
+    HOLDING_COLUMNS, HoldingAggregator, analyze_holdings, holding_aggregates, merge_holdings,
+)
+from services.bulk import BulkWriter
+from services.utils import STANDARD_ORDER, normalize_custodian_csv
+
+STATE_COLUMNS = ["batch_id", "file_id"] + HOLDING_COLUMNS
+# decimal places positions keep per numeric column (Numeric(20, scale))
+_SCALES = {c: models.Position.__table__.c[c].type.scale for c in ("quantity", "price", "market_value")}
+
+def record_file(db: Session, batch_id: int, file_id: int, aggregates: Optional[pd.DataFrame] = None) -> None:
+    """
+    Add the aggregates of a positions file just written into a batch
+    (replacing any it had): `aggregates` when the writer built them (see
+    FileState), else read back from its rows. Called inside the file's
+    savepoint, so a file that fails takes its state with it; ensure_state()
+    first for batches that may predate the state.
+    """
+    drop_file(db, batch_id, file_id)
+    if aggregates is None:
+        aggregates = _file_aggregates(db, batch_id, file_id)
+    _insert(db, batch_id, file_id, aggregates)
+
+class FileState:
+    """
+    A positions file's aggregates, built from the columns ingest writes,
+    chunk by chunk, instead of reading the rows back: quantity, price and
+    market value are taken as the database stores them (_as_stored), so
+    result() is what _file_aggregates() would return for the written rows.
+    """
+
+    def __init__(self, db: Session):
+        self._half_up = db.get_bind().dialect.name != "sqlite"
+        self._aggregator = HoldingAggregator()
+
+    def add(self, columns: Dict[str, list]) -> None:
+        """Add one chunk of _clean_positions() output."""
+        frame = {
+            c: _as_stored(np.array(columns[c], dtype=float), _SCALES[c], self._half_up) if c in _SCALES else columns[c]
+            for c in STANDARD_ORDER
+        }
+        self._aggregator.add(normalize_custodian_csv(pd.DataFrame(frame, columns=STANDARD_ORDER)))
+
+    def result(self) -> pd.DataFrame:
+        return self._aggregator.result()
+
+def stored_file_state(db: Session, batch_id: int, file_id: int) -> Optional[pd.DataFrame]:
+    """A file's aggregates as recorded in a batch; None if the batch has none for it."""
+    HA = models.HoldingAggregate
+    rows = db.execute(
+        select(*(getattr(HA, c) for c in HOLDING_COLUMNS))
+        .where(HA.batch_id == batch_id, HA.file_id == file_id)
+        .order_by(HA.id)
+    ).all()
+    return pd.DataFrame.from_records(rows, columns=HOLDING_COLUMNS) if rows else None
+
+def drop_file(db: Session, batch_id: int, file_id: Optional[int]) -> None:
+    HA = models.HoldingAggregate
+    db.query(HA).filter(HA.batch_id == batch_id, HA.file_id == file_id).delete(synchronize_session=False)
+
+def rebuild_batch(db: Session, batch_id: int) -> None:
+    """Aggregates for every file of a batch (batches ingested before the state existed)."""
+    db.query(models.HoldingAggregate).filter_by(batch_id=batch_id).delete(synchronize_session=False)
+    P = models.Position
+    file_ids = db.execute(select(P.source_file_id).where(P.batch_id == batch_id).distinct()).scalars().all()
+    for file_id in file_ids:
+        _insert(db, batch_id, file_id, _file_aggregates(db, batch_id, file_id))
+
+def batch_holdings(db: Session, batch_id: int) -> pd.DataFrame:
+    """The batch's aggregates summed over its files: one row per holding."""
+    HA = models.HoldingAggregate
+    rows = db.execute(
+        select(*(getattr(HA, c) for c in HOLDING_COLUMNS)).where(HA.batch_id == batch_id).order_by(HA.id)
+    ).all()
+    return merge_holdings(pd.DataFrame.from_records(rows, columns=HOLDING_COLUMNS))
+
+def analyze_batch_state(db: Session, batch_id: int) -> Dict:
+    ensure_state(db, batch_id)
+    return analyze_holdings(batch_holdings(db, batch_id))
+
+def symbol_values(db: Session, batch_id: int) -> Dict[str, float]:
+    """Market value per symbol (summed over its holdings), rows without a symbol left out."""
+    ensure_state(db, batch_id)
+    holdings = batch_holdings(db, batch_id)
+    holdings = holdings[holdings["symbol"] != ""]
+    mv = holdings["market_value"].astype(float) + holdings["market_value_residual"].astype(float)
+    return {str(s): float(v) for s, v in mv.groupby(holdings["symbol"], sort=False).sum().items()}
+
+def ensure_state(db: Session, batch_id: int) -> None:
+    """Build the state of a batch that has positions but none yet (ingested before it existed)."""
+    if not _has_state(db, batch_id) and _has_positions(db, batch_id):
+        rebuild_batch(db, batch_id)
+
+def _file_aggregates(db: Session, batch_id: int, file_id: Optional[int]) -> pd.DataFrame:
+    P = models.Position
+    rows = db.execute(
+        select(P.symbol, P.name, P.quantity, P.price, P.market_value, P.sector, P.currency)
+        .where(P.batch_id == batch_id, P.source_file_id == file_id)
+        .order_by(P.id)
+    ).all()
+    return holding_aggregates(normalize_custodian_csv(pd.DataFrame.from_records(rows, columns=STANDARD_ORDER)))
+
+def _insert(db: Session, batch_id: int, file_id: Optional[int], aggregates: pd.DataFrame) -> None:
+    if aggregates.empty:
+        return
+    writer = BulkWriter(db, models.HoldingAggregate.__table__, STATE_COLUMNS)
+    writer.add_columns({c: aggregates[c].tolist() for c in HOLDING_COLUMNS}, {"batch_id": batch_id, "file_id": file_id})
+    writer.close()
+
+def _as_stored(values: np.ndarray, scale: int, half_up: bool) -> np.ndarray:
+    """
+    Floats as a Numeric(_, scale) column returns them. SQLite keeps the
+    float and reads it back through "%.{scale}f", i.e. round(v, scale);
+    other databases round the decimal literal the float is sent as (its
+    repr) half away from zero, and have no negative zero. Values clear of
+    a rounding tie take the vectorized path, which agrees with both.
+    """
+    step = 10.0 ** scale
+    with np.errstate(all="ignore"):
+        scaled = values * step
+        out = np.rint(scaled) / step
+        frac = np.abs(scaled - np.floor(scaled))
+        clear = np.isnan(values) | np.isfinite(scaled) & (np.abs(scaled) < 2.0 ** 52) & (
+            np.abs(frac - 0.5) > 1e-9 + np.abs(scaled) * 1e-15
+        )
+    quantum = Decimal(1).scaleb(-scale)
+    for i in np.flatnonzero(~clear):
+        v = float(values[i])
+        if not np.isfinite(v):
+            out[i] = v
+        elif half_up:
+            out[i] = float(Decimal(repr(v)).quantize(quantum, ROUND_HALF_UP))
+        else:
+            out[i] = round(v, scale)
+    if half_up:
+        out[out == 0] = 0.0
+    return out
+
+def _has_state(db: Session, batch_id: int) -> bool:
+    return db.query(models.HoldingAggregate.id).filter_by(batch_id=batch_id).first() is not None
+
+def _has_positions(db: Session, batch_id: int) -> bool:
+    return db.query(models.Position.id).filter_by(batch_id=batch_id).first() is not None
@@ -0,0 +1,101 @@
+# backend/services/bulk.py
+from __future__ import annotations
+import csv
+import io
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Table, insert
+from sqlalchemy.orm import Session
+
+from config import INGEST_BATCH_SIZE, INGEST_BULK_MODE
+
+# ---------- Bulk row writer ----------
+
+COPY_NULL = r"\N"
+
+def _copy_cursor(db: Session):
+    """Raw DBAPI cursor if the driver can COPY (psycopg2 / psycopg 3), else None."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    cur = db.connection().connection.cursor()
+    if hasattr(cur, "copy_expert") or hasattr(cur, "copy"):
+        return cur
+    cur.close()
+    return None
+
+class BulkWriter:
+    """
+    Buffers row dicts for one table and writes them in batches, bypassing the
+    ORM unit of work:
+      - "copy":   Postgres COPY ... FROM STDIN (csv), when the driver supports it
+      - "insert": Core insert() executemany (SQLite and everything else)
+      - "auto":   copy when available, insert otherwise
+    All rows must carry the same keys (`columns`).
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        table: Table,
+        columns: List[str],
+        batch_size: Optional[int] = None,
+        mode: Optional[str] = None,
+    ):
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.batch_size = max(1, batch_size or INGEST_BATCH_SIZE)
+        self.count = 0
+        self._rows: List[Dict[str, Any]] = []
+        self._cursor = None
+
+        mode = mode or INGEST_BULK_MODE
+        if mode in ("auto", "copy"):
+            self._cursor = _copy_cursor(db)
+        self.mode = "copy" if self._cursor is not None else "insert"
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def add_columns(self, columns: Dict[str, List[Any]], fixed: Dict[str, Any]) -> None:
+        """Add rows given column-wise; `fixed` holds values shared by every row."""
+        names = list(columns)
+        for values in zip(*(columns[c] for c in names)):
+            row = dict(fixed)
+            row.update(zip(names, values))
+            self.add(row)
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        if self.mode == "copy":
+            self._copy(self._rows)
+        else:
+            self.db.execute(insert(self.table), self._rows)
+        self.count += len(self._rows)
+        self._rows = []
+
+    def close(self) -> int:
+        self.flush()
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        return self.count
+
+    def _copy(self, rows: List[Dict[str, Any]]) -> None:
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        for r in rows:
+            w.writerow([COPY_NULL if r[c] is None else r[c] for c in self.columns])
+        sql = (
+            f"COPY {self.table.name} ({', '.join(self.columns)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        )
+        buf.seek(0)
+        if hasattr(self._cursor, "copy_expert"):  # psycopg2
+            self._cursor.copy_expert(sql, buf)
+        else:  # psycopg 3
+            with self._cursor.copy(sql) as cp:
+                cp.write(buf.getvalue())
@@ -0,0 +1,107 @@
+# backend/services/dates.py
+from __future__ import annotations
+import re
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# ---------- Single-value parser (reference semantics) ----------
+
+US_DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
+def parse_date(date_s: str) -> Optional[date]:
+    """
+    ISO date (first token, "/" read as "-"), else US mm/dd/yyyy.
+    Returns None when neither applies or the date does not exist.
+    """
+    try:
+        return date.fromisoformat(date_s.strip().split(" ")[0].replace("/", "-"))
+    except Exception:
+        # simple US style mm/dd/yyyy support
+        m = US_DATE_RE.match(date_s.strip())
+        if m:
+            try:
+                return date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+            except ValueError:
+                return None
+        return None
+
+# ---------- Column parser with format inference ----------
+
+# Strict shapes that parse_date() reads the same way pandas does with the format
+DATE_FORMATS = {
+    "iso": ("%Y-%m-%d", r"[0-9]{4}-[0-9]{2}-[0-9]{2}"),
+    "us": ("%m/%d/%Y", r"[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}"),
+}
+
+class DateColumnParser:
+    """
+    Parses a file's date column chunk by chunk, with the same results as
+    parse_date() per value:
+      - the file's format is inferred once from a sample of the first chunk
+      - each chunk is factorized, so every distinct string is parsed once,
+        and results are memoized across chunks (up to `memo_size` strings)
+      - new strings in the inferred format go through one pd.to_datetime call;
+        anything else falls back to parse_date()
+    `unparsed` counts the values (rows) that did not parse.
+    """
+
+    def __init__(self, sample_size: int = 200, memo_size: int = 100_000):
+        self.sample_size = sample_size
+        self.memo_size = memo_size
+        self.format: Optional[str] = None
+        self.inferred = False
+        self.unparsed = 0
+        self._memo: Dict[str, Optional[date]] = {}
+
+    def _tokens(self, values: Iterable[str], fmt: str) -> pd.Series:
+        tok = pd.Series(list(values), dtype=object).str.strip().str.split(" ").str[0]
+        return tok.str.replace("/", "-", regex=False) if fmt == "iso" else tok
+
+    def infer(self, values: Iterable[str]) -> Optional[str]:
+        sample = [v for v in values if v][: self.sample_size]
+        best, best_hits = None, 0
+        for fmt, (_, pattern) in DATE_FORMATS.items():
+            hits = int(self._tokens(sample, fmt).str.fullmatch(pattern).sum()) if sample else 0
+            if hits > best_hits:
+                best, best_hits = fmt, hits
+        self.format, self.inferred = best, True
+        return best
+
+    def _parse_new(self, uniques: np.ndarray) -> np.ndarray:
+        out = np.full(len(uniques), None, dtype=object)
+        todo = np.ones(len(uniques), dtype=bool)
+        if self.format is not None and len(uniques):
+            fmt, pattern = DATE_FORMATS[self.format]
+            tok = self._tokens(uniques, self.format)
+            shaped = tok.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool)
+            if shaped.any():
+                parsed = pd.to_datetime(tok[shaped], format=fmt, errors="coerce")
+                ok = parsed.notna().to_numpy()
+                idx = np.flatnonzero(shaped)[ok]
+                out[idx] = parsed[ok].dt.date.to_numpy(dtype=object)
+                todo[idx] = False  # NaT (out of range, 02/30, ...) is settled by parse_date below
+        for i in np.flatnonzero(todo):
+            out[i] = parse_date(uniques[i])
+        return out
+
+    def parse(self, values: np.ndarray) -> np.ndarray:
+        """Object array of date / None for a column of non-empty date strings."""
+        if not self.inferred:
+            self.infer(values)
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        uniques = np.asarray(uniques, dtype=object)
+        parsed = np.full(len(uniques) + 1, None, dtype=object)  # last slot: code -1
+        new = np.array([u not in self._memo for u in uniques], dtype=bool)
+        for i in np.flatnonzero(~new):
+            parsed[i] = self._memo[uniques[i]]
+        if new.any():
+            fresh = self._parse_new(uniques[new])
+            parsed[np.flatnonzero(new)] = fresh
+            if len(self._memo) < self.memo_size:
+                self._memo.update(zip(uniques[new].tolist(), fresh.tolist()))
+        result = parsed[codes]
+        self.unparsed += int(sum(1 for d in result if d is None))
+        return result
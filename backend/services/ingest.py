@@ -1,16 +1,40 @@
 # backend/services/ingest.py
 from __future__ import annotations
+import codecs
 import csv
-import io
+import hashlib
 import json
+import math
+import multiprocessing
+import os
+import pickle
 import re
+import tempfile
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import date
-from typing import Dict, List, Tuple, Optional
+from functools import partial
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import event, func, insert, literal, select
+
+import numpy as np
+import pandas as pd
 
 import models  # Changed from "from .. import models" for flat structure
+from config import INGEST_BATCH_SIZE, INGEST_WORKERS, INGEST_PARALLEL_MIN_FILES
+from services.batch_analysis import invalidate_batch_analysis
+from services.batch_state import FileState, drop_file, ensure_state, record_file, stored_file_state
+from services.price_store import price_store
+from services.prices import clear_price_caches
+from services.bulk import BulkWriter
+from services.dates import DateColumnParser
+from services.mapping_cache import CachedMapping, mapping_cache
+from services.utils import normalization_plan
 
 # ---------- Utility parsing helpers ----------
 
@@ -29,9 +53,11 @@ def clean_number(v: str) -> Optional[float]:
     s = CURRENCY_REGEX.sub("", s)
     try:
         n = float(s)
-        return -n if neg else n
     except ValueError:
         return None
+    if not math.isfinite(n):
+        return None  # "inf", "nan", "1e400": no amount the tables or the analytics can use
+    return -n if neg else n
 
 def header_signature(headers: List[str]) -> str:
     # normalized, lower-cased, spaces collapsed
@@ -65,8 +91,335 @@ def pick(mapping: Dict[str, int], row: List[str], key: str) -> Optional[str]:
         return None
     return row[idx]
 
+# ---------- Column-wise cleaning ----------
+#
+# Vectorized equivalents of pick()/clean_number() for a whole chunk of rows.
+# A numeric column is a (values float64, null bool) pair: null marks what
+# clean_number() returns None for, so a literal "nan" stays NaN, not NULL.
+
+class RowBlock:
+    """
+    A chunk of data rows, addressed by column: source row numbers plus
+    positional columns (object arrays, None where a row is too short).
+    Columns are extracted on first use and treated as read-only.
+    """
+
+    def __init__(self, source_row: np.ndarray, get_column: Callable[[int], np.ndarray]):
+        self.source_row = source_row
+        self._get = get_column
+        self._cache: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def from_rows(cls, numbered: Iterable[Tuple[int, List[str]]]) -> "RowBlock":
+        numbered = list(numbered)
+        rows = [row for _, row in numbered]
+
+        def get(idx: int) -> np.ndarray:
+            out = np.full(len(rows), None, dtype=object)
+            out[:] = [row[idx] if idx < len(row) else None for row in rows]
+            return out
+        return cls(np.array([i for i, _ in numbered], dtype=np.int64), get)
+
+    @classmethod
+    def from_frame(cls, source_row: np.ndarray, frame: pd.DataFrame) -> "RowBlock":
+        def get(idx: int) -> np.ndarray:
+            if idx >= frame.shape[1]:
+                return np.full(len(frame), None, dtype=object)
+            return frame.iloc[:, idx].to_numpy(dtype=object)
+        return cls(source_row, get)
+
+    def __len__(self) -> int:
+        return len(self.source_row)
+
+    def column(self, idx: int) -> np.ndarray:
+        if idx not in self._cache:
+            self._cache[idx] = self._get(idx)
+        return self._cache[idx]
+
+    def take(self, keep: np.ndarray) -> "RowBlock":
+        return RowBlock(self.source_row[keep], lambda idx: self.column(idx)[keep])
+
+def pick_column(mapping: Dict[str, int], block: RowBlock, key: str) -> np.ndarray:
+    """pick() for every row at once, as an object array (None where missing)."""
+    idx = mapping.get(key)
+    if idx is None or idx < 0:
+        return np.full(len(block), None, dtype=object)
+    return block.column(idx)
+
+def first_present(*columns) -> np.ndarray:
+    """Element-wise `a or b or ...`; a plain string acts as a constant column."""
+    out = columns[-1]
+    for col in reversed(columns[:-1]):
+        out = np.where(col.astype(bool), col, out)
+    return np.asarray(out, dtype=object)
+
+def _floats_fast(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    float(v) for the strings that cast cleanly; (values, ok). What pandas
+    cannot parse is left not-ok, even if float() might take it ("1_000").
+    """
+    try:
+        # object -> float64 casting goes through float() per element, in C
+        return values.astype(float), np.ones(len(values), dtype=bool)
+    except (TypeError, ValueError):
+        pass
+    out = np.full(len(values), np.nan)
+    ok = pd.to_numeric(pd.Series(values), errors="coerce").notna().to_numpy()
+    try:
+        out[ok] = values[ok].astype(float)
+    except (TypeError, ValueError):
+        ok[:] = False
+    return out, ok
+
+def _floats_exact(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float(v) for each string, with the same accept/reject rules; (values, failed)."""
+    out, ok = _floats_fast(values)
+    failed = np.zeros(len(values), dtype=bool)
+    for i in np.flatnonzero(~ok):
+        try:
+            out[i] = float(values[i])
+        except (TypeError, ValueError):
+            failed[i] = True
+    return out, failed
+
+def clean_number_column(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    clean_number() over a column: (values, null) where null == clean_number() is None.
+    Clean numeric columns convert in one cast; "$1,234.50"-style columns after
+    dropping "$" and "," column-wide; only what still fails (parentheses
+    negatives, blanks, junk) gets the full strip/parentheses treatment.
+    """
+    out = np.full(len(values), np.nan)
+    null = ~values.astype(bool)  # None / ""
+    present = np.flatnonzero(~null)
+    if not len(present):
+        return out, null
+    sub = values[present]
+    try:
+        out[present] = sub.astype(float)
+        null[present] = ~np.isfinite(out[present])  # as clean_number(): no inf/nan
+        return out, null
+    except (TypeError, ValueError):
+        pass
+    # float() ignores surrounding whitespace, and no float literal contains
+    # "(" or ")", so dropping [,$] before the cast cannot change a result
+    stripped = pd.Series(sub, dtype=object).str.replace("$", "", regex=False).str.replace(",", "", regex=False)
+    nums, ok = _floats_fast(stripped.to_numpy(dtype=object))
+    failed = ~ok
+    if failed.any():
+        # the rest exactly as clean_number() does it, column-wise (parentheses negatives, ...)
+        fidx = np.flatnonzero(failed)
+        t = [v.strip() for v in sub[fidx]]
+        neg = np.fromiter((v[:1] == "(" and v[-1:] == ")" for v in t), dtype=bool, count=len(t))
+        t = np.array([CURRENCY_REGEX.sub("", v.strip("()")) for v in t], dtype=object)
+        pnums, pfailed = _floats_exact(t)
+        pnums[neg] = -pnums[neg]
+        nums[fidx] = pnums
+        # blanks and junk: clean_number() returns None for those
+        null[present[fidx[pfailed]]] = True
+    out[present] = nums
+    null[present] |= ~np.isfinite(nums)
+    return out, null
+
+def round2_column(values: np.ndarray) -> np.ndarray:
+    """Python's round(x, 2) element-wise (np.round differs on near-half cases)."""
+    with np.errstate(all="ignore"):  # inf/nan inputs fall through to round()
+        scaled = values * 100.0
+        out = np.rint(scaled) / 100.0
+        frac = np.abs(scaled - np.floor(scaled))
+        exact = np.isfinite(scaled) & (np.abs(scaled) < 2.0 ** 52) & (
+            np.abs(frac - 0.5) > 1e-9 + np.abs(scaled) * 1e-15
+        )
+    for i in np.flatnonzero(~exact):
+        out[i] = round(float(values[i]), 2)
+    return out
+
+def _nullable_list(values: np.ndarray, null: np.ndarray) -> list:
+    out = values.tolist()
+    for i in np.flatnonzero(null):
+        out[i] = None
+    return out
+
+# ---------- Streaming readers ----------
+
+READ_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Raw file content, or any binary file-like object (e.g. UploadFile.file)
+FileSource = Union[bytes, BinaryIO]
+
+class SourceReader:
+    """
+    Reads a FileSource in fixed-size chunks, decodes UTF-8 incrementally and
+    yields CSV rows lazily, so memory stays bounded by one chunk plus the
+    rows buffered for the current DB flush. Tracks bytes read and the
+    SHA-256 of the content as it goes.
+    """
+
+    def __init__(self, src: FileSource, chunk_size: int = READ_CHUNK_SIZE):
+        self.src = src
+        self.chunk_size = chunk_size
+        self.size_bytes = 0
+        self.sha256: Optional[str] = None  # set once the content has been fully hashed
+
+    def _raw_chunks(self) -> Iterator[bytes]:
+        if isinstance(self.src, (bytes, bytearray)):
+            view = memoryview(self.src)
+            for off in range(0, len(view), self.chunk_size):
+                yield bytes(view[off:off + self.chunk_size])
+            return
+        while True:
+            chunk = self.src.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def _seekable(self) -> bool:
+        return isinstance(self.src, (bytes, bytearray)) or (hasattr(self.src, "seekable") and self.src.seekable())
+
+    def content_size(self) -> Optional[int]:
+        """Bytes left to read, without reading them (bytes or seekable streams only)."""
+        if isinstance(self.src, (bytes, bytearray)):
+            return len(self.src)
+        if not self._seekable():
+            return None
+        start = self.src.tell()
+        end = self.src.seek(0, os.SEEK_END)
+        self.src.seek(start)
+        return end - start
+
+    def prehash(self) -> Optional[str]:
+        """
+        Hash the content before parsing, so duplicates can be skipped. Only
+        possible for bytes or seekable streams (UploadFile spools to a
+        seekable temp file); returns None otherwise. This is an extra pass
+        over the content, so ingest only asks for it when a file of the same
+        size could match (see _dedup_hash); otherwise chunks() hashes the
+        content as it is parsed.
+        """
+        if self.sha256 is None:
+            if not self._seekable():
+                return None
+            start = None if isinstance(self.src, (bytes, bytearray)) else self.src.tell()
+            h = hashlib.sha256()
+            for chunk in self._raw_chunks():
+                h.update(chunk)
+            if start is not None:
+                self.src.seek(start)
+            self.sha256 = h.hexdigest()
+        return self.sha256
+
+    def peek_header(self) -> Optional[List[str]]:
+        """The header row without consuming the content (bytes or seekable streams only)."""
+        if not self._seekable():
+            return None
+        start = None if isinstance(self.src, (bytes, bytearray)) else self.src.tell()
+        header = next(SourceReader(self.src, self.chunk_size).rows(), None)
+        if start is not None:
+            self.src.seek(start)
+        return header
+
+    def chunks(self) -> Iterator[bytes]:
+        h = hashlib.sha256() if self.sha256 is None else None
+        for chunk in self._raw_chunks():
+            self.size_bytes += len(chunk)
+            if h is not None:
+                h.update(chunk)
+            yield chunk
+        if h is not None:
+            self.sha256 = h.hexdigest()
+
+    def lines(self) -> Iterator[str]:
+        # split on "\n" only (like iterating io.StringIO), keeping the terminator
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        pending = ""
+        for chunk in self.chunks():
+            parts = (pending + decoder.decode(chunk)).split("\n")
+            pending = parts.pop()
+            for line in parts:
+                yield line + "\n"
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+
+    def rows(self) -> Iterator[List[str]]:
+        return csv.reader(self.lines())
+
+    def read_all(self) -> bytes:
+        """Whole content as bytes (size and hash tracked as for streaming)."""
+        if isinstance(self.src, (bytes, bytearray)) and self.sha256 is not None:
+            self.size_bytes = len(self.src)
+            return bytes(self.src)
+        return b"".join(self.chunks())
+
+# ---------- Parse-once files ----------
+
+# pd.read_csv's default NA tokens, so table() reads like read_csv did for analytics
+READ_CSV_NA_VALUES = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+class ParsedFile:
+    """
+    A file parsed once, for callers that need the whole content anyway
+    (/upload persists and analyzes every file). `frame` holds the raw cell
+    strings by column position (None where a row is short) and is what
+    ingest_batch writes from; table() is the same data as a named,
+    read_csv-like frame for analytics. Size and SHA-256 are taken while reading.
+    """
+
+    def __init__(self, src: FileSource):
+        source = SourceReader(src)
+        reader = source.rows()
+        header = next(reader, None)
+        rows = list(reader)
+        self.header: Optional[List[str]] = header
+        width = len(header) if header is not None else 0
+        self.frame = pd.DataFrame(rows, dtype=object).reindex(columns=range(width))
+        self.frame = self.frame.astype(object).where(self.frame.notna(), None)
+        self.source_row = np.arange(2, len(rows) + 2, dtype=np.int64)  # row 1 is the header
+        self.size_bytes = source.size_bytes
+        self.sha256 = source.sha256
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def content_size(self) -> Optional[int]:
+        return self.size_bytes
+
+    def prehash(self) -> Optional[str]:
+        return self.sha256
+
+    def blocks(self, size: int) -> Iterator[RowBlock]:
+        for start in range(0, len(self.frame), size):
+            stop = start + size
+            yield RowBlock.from_frame(self.source_row[start:stop], self.frame.iloc[start:stop])
+
+    def table(self) -> pd.DataFrame:
+        """Named columns (duplicates suffixed ".1", ...), NA tokens as NaN."""
+        names, seen = [], {}
+        for i, h in enumerate(self.header or []):
+            name = h or f"Unnamed: {i}"
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        table = self.frame.set_axis(names, axis=1)
+        return table.mask(table.isin(READ_CSV_NA_VALUES) | table.isna())
+
 # ---------- Mapping memory ----------
 
+# session.info key: ids of the mappings this session created in its open transaction, kept out of the
+# process-wide cache until they are committed (a rollback would leave the cache pointing at no row)
+UNCOMMITTED_MAPPINGS = "uncommitted_mapping_ids"
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_uncommitted_mappings(session: Session, transaction) -> None:
+    if transaction.parent is None:  # the outermost transaction committed or rolled back, not a savepoint
+        session.info.pop(UNCOMMITTED_MAPPINGS, None)
+
 def find_or_create_mapping(db: Session, firm_id: int, headers: List[str], custodian_hint: Optional[str]) -> models.Mapping:
     sig = header_signature(headers)
     m: models.Mapping | None = db.execute(
@@ -79,33 +432,8 @@ def find_or_create_mapping(db: Session, firm_id: int, headers: List[str], custod
     if m:
         return m
 
-    # naive inferred mapping (v1). Can be edited later by a UI.
-    headers_l = [h.strip().lower() for h in headers]
-    index_map = {h: i for i, h in enumerate(headers_l)}
-
-    def find_col(cands: List[str]) -> Optional[int]:
-        for c in cands:
-            if c in index_map:
-                return index_map[c]
-        return None
-
-    inferred = {
-        # positions fields
-        "symbol": find_col(["symbol", "ticker", "security", "security id"]),
-        "name": find_col(["name", "security name"]),
-        "quantity": find_col(["quantity", "shares", "qty"]),
-        "price": find_col(["price", "current price", "last price"]),
-        "market_value": find_col(["market value", "marketvalue", "mv"]),
-        "cost_basis": find_col(["cost basis", "cost", "avg cost", "average cost"]),
-        "sector": find_col(["sector"]),
-        "currency": find_col(["currency", "ccy"]),
-        # prices fields
-        "date": find_col(["date", "as of", "as_of", "pricedate"]),
-        "close": find_col(["close", "price", "px_last"]),
-        # balances fields
-        "cash": find_col(["cash"]),
-        "account": find_col(["account", "account number", "acct"]),
-    }
+    # naive inferred mapping (v1), from the header layout's cached plan. Can be edited later by a UI.
+    inferred = normalization_plan(tuple(headers)).mapping
 
     m = models.Mapping(
         firm_id=firm_id,
@@ -115,10 +443,26 @@ def find_or_create_mapping(db: Session, firm_id: int, headers: List[str], custod
         version=1,
     )
     db.add(m)
-    db.commit()
-    db.refresh(m)
+    db.flush()  # id now; committed with the caller's transaction
+    db.info.setdefault(UNCOMMITTED_MAPPINGS, set()).add(m.id)
     return m
 
+def resolve_mapping(db: Session, firm_id: int, headers: List[str], custodian_hint: Optional[str]) -> CachedMapping:
+    """
+    Mapping for a header layout (row id, version and parsed columns), served
+    from the in-process cache when possible so repeat layouts never touch the
+    mappings table. A mapping created in the caller's open transaction is
+    cached by the first lookup after that transaction commits.
+    """
+    key = (firm_id, header_signature(headers))
+    mapping = mapping_cache.get(key)
+    if mapping is None:
+        mapping_row = find_or_create_mapping(db, firm_id, headers, custodian_hint)
+        mapping = CachedMapping(mapping_row.id, mapping_row.version or 1, json.loads(mapping_row.json_mapping or "{}"))
+        if mapping.id not in db.info.get(UNCOMMITTED_MAPPINGS, ()):
+            mapping_cache.put(key, mapping)
+    return mapping
+
 # ---------- Core ingest ----------
 
 class IngestResult(dict):
@@ -132,197 +476,576 @@ def ingest_batch(
     client_id: int,
     as_of: date,
     created_by: Optional[int],
-    files: List[Tuple[str, bytes, Optional[str]]],  # (filename, content, custodian_hint)
+    files: List[Tuple[str, Union[FileSource, ParsedFile], Optional[str]]],  # (filename, content/stream/parsed, custodian_hint)
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch: Optional[models.Batch] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
 ) -> IngestResult:
     """
     Returns IngestResult with:
-      { "batch_id": int, "files": [{id, kind, rows}], "positions": n, "prices": n, "balances": n }
-    """
-    # 1) create batch
-    batch = models.Batch(
-        firm_id=firm_id,
-        client_id=client_id,
-        created_by=created_by,
-        as_of_date=as_of,
-        status="ingested",
-    )
-    db.add(batch)
-    db.commit()
-    db.refresh(batch)
+      { "batch_id": int, "files": [{id, kind, rows}], "positions": n, "prices": n, "balances": n,
+        "deduplicated": n }
+    Files whose SHA-256 matches an earlier successful upload for the firm,
+    ingested with the same mapping version and kind and still holding rows,
+    are not parsed; their rows are copied into this batch (see _link_prior_file).
+    Only files with a same-size candidate are hashed before parsing.
+    Each other file is streamed: read in chunks, decoded incrementally, parsed
+    row by row and written through BulkWriter in chunks of `batch_size`
+    (defaults to INGEST_BATCH_SIZE). A ParsedFile is written from its frame,
+    without reading the content again.
 
-    out_files = []
-    positions_inserted = 0
-    prices_inserted = 0
-    balances_inserted = 0
+    With `workers` > 1 (default INGEST_WORKERS, 1) and at least
+    INGEST_PARALLEL_MIN_FILES files, parsing and cleaning run in a process
+    pool instead; workers read each file from a path and spool compact
+    column buffers back chunk by chunk, and all DB writes stay here,
+    applied in file order.
 
-    for (fname, content, custodian_hint) in files:
-        # 2) persist File (storage_path is local dev placeholder)
-        frow = models.File(
+    `batch` ingests into an existing Batch (queued, or one being appended
+    to) instead of creating one; it is marked "ingested" in the same commit
+    as its rows. `progress` is
+    called as progress(rows_processed, files_done) while files are written.
+    """
+    # 1) create batch; everything below runs in one transaction, committed once
+    if batch is None:
+        batch = models.Batch(
             firm_id=firm_id,
-            storage_path=f"uploads/{fname}",
-            size_bytes=len(content),
-            mime="text/csv",
+            client_id=client_id,
+            created_by=created_by,
+            as_of_date=as_of,
+            status="ingested",
         )
-        db.add(frow)
-        db.commit()
-        db.refresh(frow)
+        db.add(batch)
+    batch.status = "ingested"
+    db.flush()
+    ensure_state(db, batch.id)  # appending to a batch from before the running state: build it for its rows first
 
-        # 3) read CSV
-        text = content.decode("utf-8", errors="ignore")
-        reader = csv.reader(io.StringIO(text))
-        rows = list(reader)
-        if not rows:
-            out_files.append({"file_id": frow.id, "kind": "unknown", "rows": 0})
-            continue
+    workers = INGEST_WORKERS if workers is None else workers
+    to_parse = sum(1 for _, content, _ in files if not isinstance(content, ParsedFile))
+    pool = _parse_pool(workers) if workers > 1 and to_parse >= INGEST_PARALLEL_MIN_FILES else None
+    window = 2 * workers if pool else 0  # files parsed ahead of the writer
 
-        headers = [h.strip() for h in rows[0]]
-        kind = detect_file_kind(fname, headers)
-        mapping_row = find_or_create_mapping(db, firm_id, headers, custodian_hint)
-        mapping = json.loads(mapping_row.json_mapping or "{}") if mapping_row else {}
-
-        # 4) route based on kind
-        if kind == "positions":
-            cnt = _ingest_positions(db, batch.id, frow.id, headers, rows[1:], mapping, as_of)
-            positions_inserted += cnt
-        elif kind == "prices":
-            cnt = _ingest_prices(db, batch.id, frow.id, headers, rows[1:], mapping)
-            prices_inserted += cnt
-        elif kind == "balances":
-            cnt = _ingest_balances(db, batch.id, frow.id, headers, rows[1:], mapping)
-            balances_inserted += cnt
+    out_files: List[Optional[Dict]] = [None] * len(files)
+    totals = {"positions": 0, "prices": 0, "balances": 0}
+    pending: deque = deque()  # (index, File row or None, file id, source, work) in file order
+    processed = [0, 0]  # source rows, files
+
+    def tick(rows: int) -> None:
+        processed[0] += rows
+        if progress is not None:
+            progress(processed[0], processed[1])
+
+    def write_next() -> None:
+        idx, frow, file_id, source, work = pending.popleft()
+        base = processed[0]
+        # each file writes inside its own SAVEPOINT: a bad file only rolls back itself
+        try:
+            with db.begin_nested():
+                info = work()
+                if info["kind"] == "positions":  # running analytics state, rolled back with the file
+                    record_file(db, batch.id, info["file_id"], info.pop("aggregates", None))
+            if frow is not None:
+                frow.sha256 = source.sha256  # only successful files are dedup candidates
+        except Exception as e:
+            info = {"file_id": file_id, "kind": "failed", "rows": 0, "error": str(e), "inserted": 0}
+        if frow is not None:
+            frow.size_bytes = source.size_bytes
+        inserted = info.pop("inserted")
+        if info["kind"] in totals:
+            totals[info["kind"]] += inserted
+        out_files[idx] = info
+        processed[0] = base + info["rows"]  # streamed files ticked per chunk; settle on the final count
+        processed[1] += 1
+        tick(0)
+
+    for idx, (fname, content, custodian_hint) in enumerate(files):
+        source = content if isinstance(content, ParsedFile) else SourceReader(content)
+
+        # 2) content already ingested for this firm, the same way? link its rows instead of re-parsing.
+        # Header, hash and lookup run in the file's own savepoint too: a file they fail on is recorded
+        # as failed, like a parse error, and the rest of the batch goes on.
+        layout, prior, error = None, None, None
+        try:
+            db.flush()  # sha256/size of the files written so far (autoflush is off)
+            with db.begin_nested():
+                layout = _peek_layout(db, fname, source, firm_id, custodian_hint)
+                sha256 = _dedup_hash(db, firm_id, source, pending) if layout is not None else None
+            if sha256 is not None:
+                if any(p[3].content_size() == source.content_size() and p[3].prehash() == sha256 for p in pending):
+                    while pending:  # an earlier copy in this batch becomes a candidate once written
+                        write_next()
+                    db.flush()
+                with db.begin_nested():
+                    prior = _find_prior_file(db, firm_id, sha256, *layout)
+        except Exception as e:
+            layout, prior, error = None, None, e
+        if prior is not None:
+            link = partial(_link_prior_file, db, batch.id, prior.id, layout[0], as_of)
+            pending.append((idx, None, prior.id, source, link))
         else:
-            # default try positions
-            cnt = _ingest_positions(db, batch.id, frow.id, headers, rows[1:], mapping, as_of)
-            positions_inserted += cnt
+            # 3) persist File (storage_path is local dev placeholder); kept even if parsing fails
+            frow = models.File(
+                firm_id=firm_id,
+                storage_path=f"uploads/{fname}",
+                mime="text/csv",
+                mapping_id=layout[1].id if layout else None,
+                mapping_version=layout[1].version if layout else None,
+            )
+            db.add(frow)
+            db.flush()
+
+            # 4) parse + clean: streamed inline, or handed to the pool
+            if error is not None:
+                work = partial(_raise, error)
+            elif pool is None or isinstance(source, ParsedFile):
+                work = partial(_ingest_file, db, batch.id, frow.id, fname, source, firm_id, custodian_hint, as_of, batch_size, tick)
+            else:
+                work = _submit_file(pool, db, batch.id, frow.id, fname, source, firm_id, custodian_hint, as_of, batch_size, tick)
+            pending.append((idx, frow, frow.id, source, work))
 
-        out_files.append({"file_id": frow.id, "kind": kind, "rows": max(0, len(rows) - 1)})
+        while len(pending) > window:
+            write_next()
+    while pending:
+        write_next()
 
+    invalidate_batch_analysis(db, batch.id)  # batch rows changed
     db.commit()
+    if totals["prices"]:
+        clear_price_caches()
+        if price_store.enabled:
+            price_store.add_files(db, [f["file_id"] for f in out_files if f["kind"] == "prices"])
 
     return IngestResult(
         batch_id=batch.id,
         files=out_files,
-        positions=positions_inserted,
-        prices=prices_inserted,
-        balances=balances_inserted,
+        positions=totals["positions"],
+        prices=totals["prices"],
+        balances=totals["balances"],
+        deduplicated=sum(1 for f in out_files if f.get("deduplicated")),
     )
 
-# ---------- Specific ingestors ----------
+def remove_batch_file(db: Session, batch_id: int, file_id: int) -> Dict[str, int]:
+    """
+    Delete the rows one file contributed to a batch (e.g. before ingesting
+    a corrected version into the same batch) and subtract it from the
+    batch's analytics state. Returns rows removed per kind.
+    """
+    Pr = models.Price
+    price_span = db.query(func.min(Pr.date), func.max(Pr.date)).filter(
+        Pr.batch_id == batch_id, Pr.source_file_id == file_id
+    ).one()
+    price_symbols = [s for (s,) in db.query(Pr.symbol).filter(
+        Pr.batch_id == batch_id, Pr.source_file_id == file_id
+    ).distinct()]
+    removed = {}
+    for kind, model in (("positions", models.Position), ("prices", models.Price), ("balances", models.Balance)):
+        removed[kind] = (
+            db.query(model)
+            .filter(model.batch_id == batch_id, model.source_file_id == file_id)
+            .delete(synchronize_session=False)
+        )
+    drop_file(db, batch_id, file_id)
+    invalidate_batch_analysis(db, batch_id)
+    db.commit()
+    if removed["prices"]:
+        clear_price_caches()
+        if price_store.enabled:
+            price_store.refresh(db, price_symbols, *price_span)  # fall back to older rows for those days
+    return removed
 
-def _ingest_positions(
+def _read_header(db: Session, fname: str, reader: Iterator[List[str]], firm_id: int, custodian_hint: Optional[str]):
+    """(kind, mapping) from the header row, or None for an empty file."""
+    header_row = next(reader, None)
+    if header_row is None:
+        return None
+    headers = [h.strip() for h in header_row]
+    kind = detect_file_kind(fname, headers)
+    return kind, resolve_mapping(db, firm_id, headers, custodian_hint).columns
+
+def _peek_layout(
+    db: Session, fname: str, source: Union[SourceReader, ParsedFile], firm_id: int, custodian_hint: Optional[str],
+) -> Optional[Tuple[str, CachedMapping]]:
+    """(kind, mapping) from the header, without consuming the file; None if empty or not seekable."""
+    header_row = source.header if isinstance(source, ParsedFile) else source.peek_header()
+    if header_row is None:
+        return None
+    headers = [h.strip() for h in header_row]
+    return detect_file_kind(fname, headers), resolve_mapping(db, firm_id, headers, custodian_hint)
+
+def _ingest_file(
     db: Session,
     batch_id: int,
     file_id: int,
-    headers: List[str],
-    data_rows: List[List[str]],
-    mapping: Dict[str, int],
+    fname: str,
+    source: Union[SourceReader, ParsedFile],
+    firm_id: int,
+    custodian_hint: Optional[str],
     as_of: date,
-) -> int:
-    count = 0
-    for i, row in enumerate(data_rows, start=2):  # 1-based header means data starts at row 2
-        symbol = pick(mapping, row, "symbol") or pick(mapping, row, "ticker")
-        if not symbol:
-            # skip hopeless row
-            continue
-        name = pick(mapping, row, "name")
-        qty = clean_number(pick(mapping, row, "quantity") or pick(mapping, row, "shares") or "0")
-        price = clean_number(pick(mapping, row, "price"))
-        mv = clean_number(pick(mapping, row, "market_value"))
-        if mv is None and qty is not None and price is not None:
-            mv = round(qty * price, 2)
-        cost = clean_number(pick(mapping, row, "cost_basis") or pick(mapping, row, "average cost"))
-        currency = pick(mapping, row, "currency") or "USD"
-        sector = pick(mapping, row, "sector")
-
-        p = models.Position(
-            batch_id=batch_id,
-            account_id=None,  # v1: not mapping account unless provided; we'll add in v2
-            symbol=symbol.strip(),
-            name=name,
-            quantity=qty,
-            price=price,
-            market_value=mv,
-            cost_basis=cost,
-            currency=currency,
-            sector=sector,
-            as_of_date=as_of,
-            source_file_id=file_id,
-            source_row=i,
-        )
-        db.add(p)
-        count += 1
-    return count
+    batch_size: Optional[int],
+    tick: Callable[[int], None],
+) -> Dict:
+    reader = iter([source.header] if source.header is not None else []) if isinstance(source, ParsedFile) else source.rows()
+    head = _read_header(db, fname, reader, firm_id, custodian_hint)
+    if head is None:
+        return {"file_id": file_id, "kind": "unknown", "rows": 0, "inserted": 0}
+    kind, mapping = head
 
-def _ingest_prices(
-    db: Session,
-    batch_id: int,
-    file_id: int,
-    headers: List[str],
-    data_rows: List[List[str]],
-    mapping: Dict[str, int],
-) -> int:
-    count = 0
-    for i, row in enumerate(data_rows, start=2):
-        symbol = pick(mapping, row, "symbol") or pick(mapping, row, "ticker")
-        date_s = pick(mapping, row, "date")
-        px = clean_number(pick(mapping, row, "close") or pick(mapping, row, "price"))
-        if not symbol or not date_s or px is None:
-            continue
-        try:
-            d = date.fromisoformat(date_s.strip().split(" ")[0].replace("/", "-"))
-        except Exception:
-            # simple US style mm/dd/yyyy support
-            m = re.match(r"(\d{1,2})/(\d{1,2})/(\d{4})", date_s.strip())
-            if m:
-                d = date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
-            else:
-                continue
-        pr = models.Price(
-            batch_id=batch_id,
-            symbol=symbol.strip(),
-            date=d,
-            price=px,
-            currency="USD",
-            source_file_id=file_id,
-            source_row=i,
-        )
-        db.add(pr)
-        count += 1
-    return count
+    writer = _writer_for(db, kind, batch_size)
+    clean = _CLEANERS.get(kind, _clean_positions)
+    dates = DateColumnParser()  # per file: format inferred once, strings memoized across chunks
+    state = FileState(db) if kind == "positions" else None  # aggregates from the written columns
+    if isinstance(source, ParsedFile):
+        blocks = source.blocks(writer.batch_size)
+    else:
+        blocks = _stream_blocks(reader, writer.batch_size)
+    n_rows = 0
+    for block in blocks:
+        columns = clean(block, mapping, dates)
+        writer.add_columns(columns, _fixed_values(kind, batch_id, file_id, as_of))
+        if state is not None:
+            state.add(columns)
+        n_rows += len(block)
+        tick(len(block))
+    return {
+        "file_id": file_id, "kind": kind, "rows": n_rows, "unparsed_dates": dates.unparsed,
+        "inserted": writer.close(), **({"aggregates": state.result()} if state is not None else {}),
+    }
+
+def _stream_blocks(reader: Iterator[List[str]], size: int) -> Iterator[RowBlock]:
+    numbered = enumerate(reader, start=2)  # 1-based header means data starts at row 2
+    while True:
+        chunk = list(islice(numbered, size))
+        if not chunk:
+            return
+        yield RowBlock.from_rows(chunk)
+
+# ---------- Parallel parsing ----------
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+def _parse_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool, created on first use (re-created if the size
+    changes). Workers start from a fresh interpreter (forkserver, or spawn
+    where that is missing), never forked from the threaded API process.
+    """
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _POOL_WORKERS = workers
+        return _POOL
 
-def _ingest_balances(
+def _parse_file(path: str, kind: str, mapping: Dict[str, int], size: int) -> Tuple[int, int, str, str]:
+    """
+    Worker: stream-parse + clean a file (header skipped) in chunks of
+    `size` rows, pickling each chunk's packed columns to a temp file.
+    Returns (rows, unparsed dates, path of the chunks, SHA-256 of the file).
+    """
+    fd, out_path = tempfile.mkstemp(prefix="ingest-", suffix=".chunks")
+    n_rows = 0
+    dates = DateColumnParser()
+    clean = _CLEANERS.get(kind, _clean_positions)
+    try:
+        with open(path, "rb") as src, os.fdopen(fd, "wb") as out:
+            source = SourceReader(src)
+            reader = source.rows()
+            next(reader, None)
+            for block in _stream_blocks(reader, size):
+                pickle.dump((len(block), _pack_columns(clean(block, mapping, dates))), out, pickle.HIGHEST_PROTOCOL)
+                n_rows += len(block)
+    except BaseException:
+        os.unlink(out_path)
+        raise
+    return n_rows, dates.unparsed, out_path, source.sha256
+
+def _read_chunks(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def _worker_path(source: SourceReader) -> Tuple[str, bool]:
+    """
+    A path a worker can read the content from: the source's own file, or a
+    temp copy written in chunks (owned, so the caller removes it). Size and
+    SHA-256 are taken on the way (the worker hashes the source's own file
+    as it parses it).
+    """
+    name = getattr(source.src, "name", None)
+    if isinstance(name, str) and os.path.isfile(name) and source.src.tell() == 0:
+        source.size_bytes = os.path.getsize(name)
+        return name, False
+    fd, path = tempfile.mkstemp(prefix="ingest-", suffix=".csv")
+    with os.fdopen(fd, "wb") as out:
+        for chunk in source.chunks():
+            out.write(chunk)
+    return path, True
+
+def _submit_file(
+    pool: ProcessPoolExecutor,
     db: Session,
     batch_id: int,
     file_id: int,
-    headers: List[str],
-    data_rows: List[List[str]],
-    mapping: Dict[str, int],
-) -> int:
-    count = 0
-    for i, row in enumerate(data_rows, start=2):
-        date_s = pick(mapping, row, "date")
-        if not date_s:
-            continue
+    fname: str,
+    source: SourceReader,
+    firm_id: int,
+    custodian_hint: Optional[str],
+    as_of: date,
+    batch_size: Optional[int],
+    tick: Callable[[int], None],
+) -> Callable[[], Dict]:
+    """
+    Resolve kind + mapping here (they need the DB), hand the file's path to
+    a worker and return the deferred write step, which streams the worker's
+    chunks into the DB.
+    """
+    path, owned = None, False
+    try:
+        path, owned = _worker_path(source)
+        with open(path, "rb") as f:
+            head = _read_header(db, fname, SourceReader(f).rows(), firm_id, custodian_hint)
+    except Exception as e:
+        if owned:
+            os.unlink(path)
+        return partial(_raise, e)
+    if head is None:
+        if owned:
+            os.unlink(path)
+        return lambda: {"file_id": file_id, "kind": "unknown", "rows": 0, "inserted": 0}
+    kind, mapping = head
+    future: Future = pool.submit(_parse_file, path, kind, mapping, max(1, batch_size or INGEST_BATCH_SIZE))
+
+    def write() -> Dict:
+        chunks_path = None
         try:
-            d = date.fromisoformat(date_s.strip().split(" ")[0].replace("/", "-"))
-        except Exception:
-            m = re.match(r"(\d{1,2})/(\d{1,2})/(\d{4})", date_s.strip())
-            if m:
-                d = date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
-            else:
-                continue
-        cash = clean_number(pick(mapping, row, "cash"))
-        mv = clean_number(pick(mapping, row, "market_value"))
-        bal = models.Balance(
-            batch_id=batch_id,
-            account_id=None,
-            date=d,
-            cash=cash,
-            market_value=mv,
-            currency="USD",
-            source_file_id=file_id,
-            source_row=i,
+            n_rows, unparsed, chunks_path, sha256 = future.result()
+            source.sha256 = source.sha256 or sha256
+            writer = _writer_for(db, kind, batch_size)
+            fixed = _fixed_values(kind, batch_id, file_id, as_of)
+            state = FileState(db) if kind == "positions" else None
+            for rows, packed in _read_chunks(chunks_path):
+                columns = _unpack_columns(packed)
+                writer.add_columns(columns, fixed)
+                if state is not None:
+                    state.add(columns)
+                tick(rows)
+            return {
+                "file_id": file_id, "kind": kind, "rows": n_rows, "unparsed_dates": unparsed,
+                "inserted": writer.close(), **({"aggregates": state.result()} if state is not None else {}),
+            }
+        finally:
+            for p in (chunks_path, path if owned else None):
+                if p is not None and os.path.exists(p):
+                    os.unlink(p)
+    return write
+
+def _raise(exc: Exception):
+    raise exc
+
+# Compact IPC format: floats -> array('d') + null mask, dates -> ordinals, ints -> array('q')
+FLOAT_FIELDS = {"quantity", "price", "market_value", "cost_basis", "cash"}
+DATE_FIELDS = {"date"}
+INT_FIELDS = {"source_row"}
+
+def _pack_columns(columns: Dict[str, list]) -> Dict[str, Any]:
+    packed: Dict[str, Any] = {}
+    for name, values in columns.items():
+        if name in FLOAT_FIELDS:
+            packed[name] = (
+                array("d", [0.0 if v is None else v for v in values]),
+                bytes(v is None for v in values),
+            )
+        elif name in DATE_FIELDS:
+            packed[name] = array("q", [v.toordinal() for v in values])
+        elif name in INT_FIELDS:
+            packed[name] = array("q", values)
+        else:
+            packed[name] = values
+    return packed
+
+def _unpack_columns(packed: Dict[str, Any]) -> Dict[str, list]:
+    columns: Dict[str, list] = {}
+    for name, values in packed.items():
+        if name in FLOAT_FIELDS:
+            nums, nulls = values
+            columns[name] = [None if null else v for v, null in zip(nums, nulls)]
+        elif name in DATE_FIELDS:
+            columns[name] = [date.fromordinal(v) for v in values]
+        elif name in INT_FIELDS:
+            columns[name] = list(values)
+        else:
+            columns[name] = values
+    return columns
+
+# ---------- Content dedup ----------
+
+def _dedup_hash(db: Session, firm_id: int, source: Union[SourceReader, ParsedFile], pending: Iterable) -> Optional[str]:
+    """
+    SHA-256 of a file's content before it is parsed, if anything could share
+    it: an upload of the firm's with the same size that was parsed
+    successfully, or a file of that size ahead of it in this batch. Other
+    files skip the extra pass; they are hashed while they stream.
+    """
+    size = source.content_size()
+    if size is None:
+        return None
+    F = models.File
+    if not any(p[3].content_size() == size for p in pending) and db.execute(
+        select(F.id).where(F.firm_id == firm_id, F.size_bytes == size, F.sha256.isnot(None)).limit(1)
+    ).first() is None:
+        return None
+    return source.prehash()
+
+def _find_prior_file(db: Session, firm_id: int, sha256: str, kind: str, mapping: CachedMapping) -> Optional[models.File]:
+    """
+    Earliest successful upload of the same content for the firm that was
+    parsed with this mapping version (a mapping saved since then re-parses)
+    and still has rows of `kind` in some batch (its rows may all have been
+    removed, or it may have been read as another kind under another name).
+    """
+    model = _KIND_TABLES[kind][0]
+    F = models.File
+    has_rows = select(model.id).where(model.source_file_id == F.id).exists()
+    return db.execute(
+        select(F)
+        .where(
+            F.firm_id == firm_id, F.sha256 == sha256,
+            F.mapping_id == mapping.id, F.mapping_version == mapping.version, has_rows,
         )
-        db.add(bal)
-        count += 1
-    return count
\ No newline at end of file
+        .order_by(F.id)
+        .limit(1)
+    ).scalar_one_or_none()
+
+def _link_prior_file(db: Session, batch_id: int, file_id: int, kind: str, as_of: date) -> Dict:
+    """
+    Copy the `kind` rows an earlier upload of the same content produced into
+    this batch, server-side (INSERT ... SELECT). Rows come from the first
+    batch still holding the file's rows and keep their source_file_id/source_row;
+    positions also bring that batch's aggregates of the file, when recorded.
+    """
+    model, columns = _KIND_TABLES[kind]
+    table = model.__table__
+    first_batch = db.execute(select(func.min(table.c.batch_id)).where(table.c.source_file_id == file_id)).scalar()
+    overrides = {"batch_id": literal(batch_id), "as_of_date": literal(as_of)}
+    rows = select(*[overrides.get(c, table.c[c]) for c in columns]).where(
+        table.c.source_file_id == file_id,
+        table.c.batch_id == first_batch,
+    ).order_by(table.c.id)
+    n = db.execute(insert(table).from_select(columns, rows)).rowcount
+    info = {"file_id": file_id, "kind": kind, "rows": n, "inserted": n, "deduplicated": True}
+    if kind == "positions" and stored_file_state(db, batch_id, file_id) is None:
+        # first copy in this batch: the aggregates recorded with the rows copied (None: read back)
+        info["aggregates"] = stored_file_state(db, first_batch, file_id)
+    return info
+
+# ---------- Specific ingestors ----------
+#
+# Cleaners turn numbered raw rows [(source_row, row), ...] into column lists;
+# the per-file constants come from _fixed_values. Kept DB-free so they can run
+# in pool workers.
+
+# Column order for bulk writes (COPY needs it explicit)
+POSITION_COLUMNS = [
+    "batch_id", "account_id", "symbol", "name", "quantity", "price", "market_value",
+    "cost_basis", "currency", "sector", "as_of_date", "source_file_id", "source_row",
+]
+PRICE_COLUMNS = ["batch_id", "symbol", "date", "price", "currency", "source_file_id", "source_row"]
+BALANCE_COLUMNS = [
+    "batch_id", "account_id", "date", "cash", "market_value", "currency", "source_file_id", "source_row",
+]
+_KIND_TABLES = {
+    "positions": (models.Position, POSITION_COLUMNS),
+    "prices": (models.Price, PRICE_COLUMNS),
+    "balances": (models.Balance, BALANCE_COLUMNS),
+}
+
+def _writer_for(db: Session, kind: str, batch_size: Optional[int]) -> BulkWriter:
+    if kind == "prices":
+        return BulkWriter(db, models.Price.__table__, PRICE_COLUMNS, batch_size)
+    if kind == "balances":
+        return BulkWriter(db, models.Balance.__table__, BALANCE_COLUMNS, batch_size)
+    return BulkWriter(db, models.Position.__table__, POSITION_COLUMNS, batch_size)
+
+def _fixed_values(kind: str, batch_id: int, file_id: int, as_of: date) -> Dict[str, Any]:
+    if kind == "prices":
+        return {"batch_id": batch_id, "currency": "USD", "source_file_id": file_id}
+    if kind == "balances":
+        return {"batch_id": batch_id, "account_id": None, "currency": "USD", "source_file_id": file_id}
+    # v1: not mapping account unless provided; we'll add in v2
+    return {"batch_id": batch_id, "account_id": None, "as_of_date": as_of, "source_file_id": file_id}
+
+def _clean_positions(raw: RowBlock, mapping: Dict[str, int], dates: DateColumnParser) -> Dict[str, list]:
+    symbol = first_present(pick_column(mapping, raw, "symbol"), pick_column(mapping, raw, "ticker"))
+    keep = symbol.astype(bool)  # skip hopeless rows
+    if not keep.all():
+        raw, symbol = raw.take(keep), symbol[keep]
+
+    qty, qty_null = clean_number_column(first_present(
+        pick_column(mapping, raw, "quantity"), pick_column(mapping, raw, "shares"), "0",
+    ))
+    price, price_null = clean_number_column(pick_column(mapping, raw, "price"))
+    mv, mv_null = clean_number_column(pick_column(mapping, raw, "market_value"))
+    derive = mv_null & ~qty_null & ~price_null
+    if derive.any():
+        with np.errstate(all="ignore"):
+            mv[derive] = round2_column(qty[derive] * price[derive])
+        mv_null = mv_null & ~derive
+    cost, cost_null = clean_number_column(first_present(
+        pick_column(mapping, raw, "cost_basis"), pick_column(mapping, raw, "average cost"),
+    ))
+
+    return {
+        "symbol": [v.strip() for v in symbol],
+        "name": pick_column(mapping, raw, "name").tolist(),
+        "quantity": _nullable_list(qty, qty_null),
+        "price": _nullable_list(price, price_null),
+        "market_value": _nullable_list(mv, mv_null),
+        "cost_basis": _nullable_list(cost, cost_null),
+        "currency": first_present(pick_column(mapping, raw, "currency"), "USD").tolist(),
+        "sector": pick_column(mapping, raw, "sector").tolist(),
+        "source_row": raw.source_row.tolist(),
+    }
+
+def _clean_prices(raw: RowBlock, mapping: Dict[str, int], dates: DateColumnParser) -> Dict[str, list]:
+    symbol = first_present(pick_column(mapping, raw, "symbol"), pick_column(mapping, raw, "ticker"))
+    date_s = pick_column(mapping, raw, "date")
+    px, px_null = clean_number_column(first_present(pick_column(mapping, raw, "close"), pick_column(mapping, raw, "price")))
+
+    keep = np.flatnonzero(symbol.astype(bool) & date_s.astype(bool) & ~px_null)
+    d = dates.parse(date_s[keep])
+    keep, d = keep[d != None], d[d != None]  # noqa: E711 (element-wise)
+    return {
+        "symbol": [v.strip() for v in symbol[keep]],
+        "date": d.tolist(),
+        "price": px[keep].tolist(),
+        "source_row": raw.source_row[keep].tolist(),
+    }
+
+def _clean_balances(raw: RowBlock, mapping: Dict[str, int], dates: DateColumnParser) -> Dict[str, list]:
+    date_s = pick_column(mapping, raw, "date")
+    cash, cash_null = clean_number_column(pick_column(mapping, raw, "cash"))
+    mv, mv_null = clean_number_column(pick_column(mapping, raw, "market_value"))
+
+    keep = np.flatnonzero(date_s.astype(bool))
+    d = dates.parse(date_s[keep])
+    keep, d = keep[d != None], d[d != None]  # noqa: E711 (element-wise)
+    return {
+        "date": d.tolist(),
+        "cash": _nullable_list(cash[keep], cash_null[keep]),
+        "market_value": _nullable_list(mv[keep], mv_null[keep]),
+        "source_row": raw.source_row[keep].tolist(),
+    }
+
+_CLEANERS = {
+    "positions": _clean_positions,
+    "prices": _clean_prices,
+    "balances": _clean_balances,
+}
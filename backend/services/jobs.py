@@ -0,0 +1,259 @@
+# backend/services/jobs.py
+"""
+Background ingest jobs, no broker needed: the job table is the queue.
+
+enqueue_ingest() spools the uploads to INGEST_SPOOL_DIR, creates the Batch
+(status "queued") and its IngestJob, and hands the job id to a bounded
+thread pool. The worker runs ingest_batch() into that Batch and moves
+Batch.status and IngestJob.status through queued -> running -> ingested/failed.
+Jobs still queued when a process stops are picked up again by resume_jobs(),
+as are jobs left "running" by a process that died mid-ingest: the ingest
+is one transaction, so such a job wrote nothing and is requeued as is.
+"Running" is taken as orphaned once the job's heartbeat (written with its
+progress) is INGEST_JOB_STALE_SECONDS old; on SQLite, where progress is not
+persisted, a live ingest holds the write lock instead and the requeue
+UPDATE cannot get through. Workers claim a job with a conditional UPDATE,
+so each runs once at a time even with several API processes. The spooled
+uploads are removed only once the job succeeds; a failed job keeps them.
+
+Progress (rows processed) is kept in memory for the running process and
+persisted to the job row at most every PROGRESS_PERSIST_SECONDS, except on
+SQLite, where the ingest transaction holds the write lock until it commits.
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date, timedelta
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+import models
+from config import INGEST_JOB_STALE_SECONDS, INGEST_JOB_WORKERS, INGEST_SPOOL_DIR
+from database import SessionLocal, engine
+from services.ingest import ingest_batch
+
+PROGRESS_PERSIST_SECONDS = 1.0
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+_LIVE: Dict[int, Tuple[int, int]] = {}  # job id -> (rows_processed, files_done) while running
+_LIVE_LOCK = threading.Lock()
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, INGEST_JOB_WORKERS), thread_name_prefix="ingest-job")
+        return _EXECUTOR
+
+# ---------- Enqueue ----------
+
+def enqueue_ingest(
+    db: Session,
+    *,
+    firm_id: int,
+    client_id: int,
+    as_of: date,
+    created_by: Optional[int],
+    files: List[Tuple[str, BinaryIO, Optional[str]]],  # (filename, stream, custodian_hint)
+) -> models.IngestJob:
+    batch = models.Batch(
+        firm_id=firm_id,
+        client_id=client_id,
+        created_by=created_by,
+        as_of_date=as_of,
+        status="queued",
+    )
+    db.add(batch)
+    db.flush()
+
+    job_dir = _spool_dir(batch.id)
+    os.makedirs(job_dir, exist_ok=True)
+    spooled = []
+    for i, (fname, stream, custodian_hint) in enumerate(files):
+        path = os.path.join(job_dir, f"{i:04d}.csv")  # never trust the client filename as a path
+        with open(path, "wb") as out:
+            shutil.copyfileobj(stream, out, 1 << 20)
+        spooled.append({"filename": fname, "path": path, "custodian_hint": custodian_hint})
+
+    job = models.IngestJob(
+        batch_id=batch.id,
+        status="queued",
+        payload_json=json.dumps(spooled),
+        files_total=len(spooled),
+        files_done=0,
+        rows_processed=0,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _executor().submit(run_job, job.id)
+    return job
+
+def resume_jobs() -> int:
+    """
+    Re-submit jobs left queued by a previous process, after requeueing the
+    ones it left running (see requeue_stale_jobs). Returns how many.
+    """
+    requeue_stale_jobs()
+    db = SessionLocal()
+    try:
+        ids = [j.id for j in db.query(models.IngestJob.id).filter(models.IngestJob.status == "queued")]
+    finally:
+        db.close()
+    for job_id in ids:
+        _executor().submit(run_job, job_id)
+    return len(ids)
+
+def requeue_stale_jobs(stale_seconds: float = INGEST_JOB_STALE_SECONDS) -> int:
+    """
+    Put "running" jobs whose heartbeat is older than stale_seconds (all of
+    them on SQLite, see the module docstring) and their batches back to
+    "queued". Returns how many.
+    """
+    db = SessionLocal()
+    try:
+        job = models.IngestJob
+        stale = job.status == "running"
+        if engine.dialect.name != "sqlite":
+            cutoff = db.scalar(select(func.now())) - timedelta(seconds=stale_seconds)
+            last = func.coalesce(job.heartbeat_at, job.started_at)
+            stale &= or_(last.is_(None), last < cutoff)
+        batch_ids = [b for (b,) in db.query(job.batch_id).filter(stale)]
+        if not batch_ids:
+            return 0
+        requeued = db.execute(
+            update(job)
+            .where(stale, job.batch_id.in_(batch_ids))
+            .values(status="queued", started_at=None, heartbeat_at=None, rows_processed=0, files_done=0)
+        ).rowcount
+        db.execute(
+            update(models.Batch)
+            .where(models.Batch.id.in_(batch_ids), models.Batch.status == "running")
+            .values(status="queued")
+        )
+        db.commit()
+        return requeued
+    except OperationalError:
+        db.rollback()  # SQLite: another process is mid-ingest and holds the write lock
+        return 0
+    finally:
+        db.close()
+
+# ---------- Worker ----------
+
+def run_job(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        claimed = db.execute(
+            update(models.IngestJob)
+            .where(models.IngestJob.id == job_id, models.IngestJob.status == "queued")
+            .values(status="running", started_at=func.now(), heartbeat_at=func.now())
+        ).rowcount
+        if not claimed:
+            db.rollback()
+            return
+        job = db.query(models.IngestJob).filter_by(id=job_id).first()
+        batch = db.query(models.Batch).filter_by(id=job.batch_id).first()
+        batch.status = "running"
+        db.commit()
+
+        spooled = json.loads(job.payload_json or "[]")
+        try:
+            with ExitStack() as stack:
+                files = [
+                    (f["filename"], stack.enter_context(open(f["path"], "rb")), f["custodian_hint"])
+                    for f in spooled
+                ]
+                res = ingest_batch(
+                    db,
+                    firm_id=batch.firm_id,
+                    client_id=batch.client_id,
+                    as_of=batch.as_of_date,
+                    created_by=batch.created_by,
+                    files=files,
+                    batch=batch,
+                    progress=_progress_recorder(job_id),
+                )
+        except Exception as e:
+            db.rollback()
+            _finish(db, job_id, status="failed", error=f"{type(e).__name__}: {e}")
+        else:
+            rows = sum(f["rows"] for f in res["files"])
+            _finish(db, job_id, status="ingested", result=res, rows=rows)
+            shutil.rmtree(_spool_dir(job.batch_id), ignore_errors=True)  # a failed job keeps its uploads
+    finally:
+        with _LIVE_LOCK:
+            _LIVE.pop(job_id, None)
+        db.close()
+
+def _finish(db: Session, job_id: int, *, status: str, result: Optional[Dict] = None,
+            rows: Optional[int] = None, error: Optional[str] = None) -> None:
+    job = db.query(models.IngestJob).filter_by(id=job_id).first()
+    batch = db.query(models.Batch).filter_by(id=job.batch_id).first()
+    job.status = batch.status = status
+    job.error = error
+    job.finished_at = func.now()
+    if result is not None:
+        job.result_json = json.dumps(result)
+        job.files_done = len(result["files"])
+    if rows is not None:
+        job.rows_processed = rows
+    elif job_id in _LIVE:
+        job.rows_processed, job.files_done = _LIVE[job_id]
+    db.commit()
+
+def _spool_dir(batch_id: int) -> str:
+    return os.path.join(INGEST_SPOOL_DIR, str(batch_id))
+
+def _progress_recorder(job_id: int):
+    persist = engine.dialect.name != "sqlite"
+    last = [0.0]
+
+    def record(rows: int, files_done: int) -> None:
+        with _LIVE_LOCK:
+            _LIVE[job_id] = (rows, files_done)
+        now = time.monotonic()
+        if persist and now - last[0] >= PROGRESS_PERSIST_SECONDS:
+            last[0] = now
+            try:
+                # own connection + commit, so other API processes can see it mid-ingest
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(models.IngestJob)
+                        .where(models.IngestJob.id == job_id)
+                        .values(rows_processed=rows, files_done=files_done, heartbeat_at=func.now())
+                    )
+            except Exception:
+                pass  # progress is best-effort; the final count is written by _finish
+    return record
+
+# ---------- Status ----------
+
+def job_status(db: Session, batch: models.Batch) -> Dict:
+    """Status + progress for a batch; batches ingested inline have no job row."""
+    job = db.query(models.IngestJob).filter_by(batch_id=batch.id).first()
+    if job is None:
+        return {"batch_id": batch.id, "status": batch.status}
+    rows, files_done = job.rows_processed or 0, job.files_done or 0
+    with _LIVE_LOCK:
+        if job.id in _LIVE:
+            rows, files_done = _LIVE[job.id]
+    return {
+        "batch_id": batch.id,
+        "status": job.status,
+        "files_total": job.files_total or 0,
+        "files_done": files_done,
+        "rows_processed": rows,
+        "error": job.error,
+        "result": json.loads(job.result_json) if job.result_json else None,
+    }
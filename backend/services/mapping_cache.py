@@ -0,0 +1,85 @@
+# backend/services/mapping_cache.py
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from config import MAPPING_CACHE_SIZE, MAPPING_CACHE_TTL
+
+# ---------- In-process LRU of parsed mappings ----------
+
+MappingKey = Tuple[int, str]  # (firm_id, header_signature)
+
+class CachedMapping(NamedTuple):
+    # a mappings row as ingest needs it; content dedup keys files on (id, version)
+    id: int
+    version: int
+    columns: Dict[str, int]
+
+class MappingCache:
+    """
+    LRU + TTL cache of parsed column mappings keyed by (firm_id, header_signature).
+    Entries are per process: /mappings/save invalidates locally, and the TTL
+    bounds how long other workers can serve an outdated mapping.
+    Cached column dicts are shared; callers must not mutate them.
+    """
+
+    def __init__(self, maxsize: int = MAPPING_CACHE_SIZE, ttl: float = MAPPING_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[MappingKey, Tuple[float, CachedMapping]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: MappingKey) -> Optional[CachedMapping]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: MappingKey, mapping: CachedMapping) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, mapping)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, firm_id: int, signature: Optional[str] = None) -> None:
+        """Drop one (firm_id, signature) entry, or every entry of the firm."""
+        with self._lock:
+            if signature is not None:
+                self._data.pop((firm_id, signature), None)
+                return
+            for key in [k for k in self._data if k[0] == firm_id]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+mapping_cache = MappingCache()
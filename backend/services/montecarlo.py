@@ -0,0 +1,203 @@
+# backend/services/montecarlo.py
+"""
+Monte Carlo VaR / CVaR for a batch: simulated daily portfolio returns are
+compounded along each path, and the loss (1 - growth) at every requested
+horizon is kept.
+
+Models of the daily portfolio return:
+  - "bootstrap": days drawn with replacement from the portfolio's own
+    history (its weights applied to the stored prices, rebalanced daily as
+    in services/performance.py), so fat tails and skew carry over;
+  - "normal": zero-mean normal with the volatility of the shrinkage
+    covariance model (services/risk.py).
+
+Paths are simulated in chunks of MONTE_CARLO_CHUNK_PATHS on a process
+pool. Chunk i draws from the i-th stream spawned from one SeedSequence,
+so a (seed, paths, chunk size) triple reproduces the same numbers with
+any number of workers. Within a chunk, paths are generated in blocks of
+BLOCK_CELLS draws, and each chunk sends back only its worst losses: the
+K = ceil((1 - lowest confidence) * paths) largest of the run are among
+every chunk's K largest, so the tails merged in the parent give exact
+results in one buffer of K + min(K, chunk) losses per horizon. Confidences below
+MIN_CONFIDENCE are refused (K would approach every path) and requests are
+held to MONTE_CARLO_MAX_HORIZONS horizons, so a tail is at most half the
+paths at a bounded number of horizons.
+
+VaR at confidence c is the k-th largest loss, k = ceil((1 - c) * paths),
+and CVaR the mean of the k largest.
+"""
+from __future__ import annotations
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from config import MONTE_CARLO_CHUNK_PATHS, MONTE_CARLO_WORKERS
+from services.batch_state import symbol_values
+from services.performance import DEFAULT_LOOKBACK_DAYS, daily_returns, weighted_returns
+from services.prices import load_price_matrix
+from services.risk import covariance_model
+
+MODELS = ("bootstrap", "normal")
+CONFIDENCES = (0.95, 0.99)
+HORIZONS = (1, 10)
+MIN_CONFIDENCE = 0.5
+MIN_HISTORY_DAYS = 20
+BLOCK_CELLS = 1 << 21  # draws per block (16 MB of float64)
+
+# ---------- Simulation ----------
+
+def _simulate_chunk(model: str, param, horizons: Tuple[int, ...], n_paths: int,
+                    seed: np.random.SeedSequence, keep: int) -> np.ndarray:
+    """Worker: losses of n_paths paths at each horizon, the `keep` largest per horizon (unordered)."""
+    rng = np.random.Generator(np.random.PCG64(seed))
+    longest = max(horizons)
+    cols = np.asarray(horizons) - 1
+    block = max(1, BLOCK_CELLS // longest)
+    losses = np.empty((len(horizons), n_paths))
+    for lo in range(0, n_paths, block):
+        n = min(block, n_paths - lo)
+        if model == "bootstrap":
+            r = param[rng.integers(len(param), size=(n, longest))]
+        else:
+            r = rng.standard_normal((n, longest))
+            r *= param
+        r += 1.0
+        np.cumprod(r, axis=1, out=r)
+        losses[:, lo:lo + n] = 1.0 - r[:, cols].T
+    if keep < n_paths:
+        losses = np.partition(losses, n_paths - keep, axis=1)[:, n_paths - keep:]
+    return losses
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+def _simulation_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool, created on first use (re-created if the size
+    changes). Workers start from a fresh interpreter (forkserver, or spawn
+    where that is missing), never forked from the threaded API process.
+    """
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _POOL_WORKERS = workers
+        return _POOL
+
+def simulate_losses(model: str, param, *, paths: int, horizons: Sequence[int] = HORIZONS,
+                    confidences: Sequence[float] = CONFIDENCES, seed: int = 0,
+                    chunk_paths: int = MONTE_CARLO_CHUNK_PATHS, workers: int = MONTE_CARLO_WORKERS) -> List[Dict]:
+    """
+    VaR and CVaR (as fractions of the starting value) for every
+    (horizon, confidence). param: the daily return history ("bootstrap")
+    or the daily volatility ("normal").
+    """
+    horizons = tuple(int(h) for h in horizons)
+    if min(confidences) < MIN_CONFIDENCE:
+        raise ValueError(f"confidences must be at least {MIN_CONFIDENCE}")
+    keep = min(paths, max(1, math.ceil((1.0 - min(confidences)) * paths)))
+    sizes = [min(chunk_paths, paths - lo) for lo in range(0, paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(model, param, horizons, n, s, min(keep, n)) for n, s in zip(sizes, seeds)]
+
+    if workers <= 1 or len(jobs) == 1:
+        chunks = (_simulate_chunk(*job) for job in jobs)
+    else:
+        chunks = _simulation_pool(workers).map(_simulate_chunk, *zip(*jobs))
+
+    # keep the `keep` largest losses per horizon, merging chunk tails as they arrive into one buffer of
+    # `keep` plus a chunk's tail; losses are stored negated so the largest partition to the front in place
+    room = keep + min(keep, chunk_paths)
+    tail = np.empty((len(horizons), room))
+    filled = 0
+    for losses in chunks:
+        n = losses.shape[1]
+        if filled + n > room:
+            tail[:, :filled].partition(keep - 1, axis=1)
+            filled = keep
+        np.negative(losses, out=tail[:, filled:filled + n])
+        filled += n
+    if filled > keep:
+        tail[:, :filled].partition(keep - 1, axis=1)
+    tail = tail[:, :keep]
+    tail.sort(axis=1)
+    np.negative(tail, out=tail)  # largest loss first
+
+    out = []
+    for i, horizon in enumerate(horizons):
+        for confidence in confidences:
+            k = max(1, math.ceil((1.0 - confidence) * paths))
+            out.append({
+                "horizon_days": horizon,
+                "confidence": confidence,
+                "var": float(tail[i, k - 1]),
+                "cvar": float(tail[i, :k].mean()),
+            })
+    return out
+
+# ---------- Batch ----------
+
+def _round(x: Optional[float], digits: int = 6) -> Optional[float]:
+    return None if x is None or not math.isfinite(x) else round(x, digits)
+
+def batch_monte_carlo(db: Session, batch_id: int, as_of: date, *, paths: int, model: str = "bootstrap",
+                      horizons: Sequence[int] = HORIZONS, confidences: Sequence[float] = CONFIDENCES,
+                      seed: Optional[int] = None, start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+    end = end or as_of
+    start = start or end - timedelta(days=DEFAULT_LOOKBACK_DAYS)
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (1 << 63))  # reported, so the run can be replayed
+    values = symbol_values(db, batch_id)
+    firm_id = db.get(models.Batch, batch_id).firm_id
+
+    if model == "bootstrap":
+        matrix = load_price_matrix(db, firm_id, values.keys(), start, end)
+        returns = daily_returns(matrix.values) if len(matrix.dates) else np.empty((0, len(matrix.symbols)))
+        priced = (~np.isnan(returns)).any(axis=0)
+        mv = np.array([values[s] for s in matrix.symbols], dtype=float)[priced]
+        param = weighted_returns(returns[:, priced], mv / mv.sum()) if mv.sum() > 0 else np.empty(0)
+        param = param[~np.isnan(param)]
+        history_days = len(param)
+    else:
+        cov = covariance_model(db, firm_id, values.keys(), start, end, "shrinkage")
+        mv = np.array([values[s] for s in cov.symbols], dtype=float)
+        w = mv / mv.sum() if mv.sum() > 0 else np.zeros_like(mv)
+        param = math.sqrt(max(float(w @ cov.dot(w)), 0.0))
+        history_days = int(cov.deviations.shape[0])
+    modeled_value = float(mv.sum())
+
+    if history_days >= MIN_HISTORY_DAYS and modeled_value > 0:
+        results = simulate_losses(model, param, paths=paths, horizons=horizons, confidences=confidences, seed=seed)
+    else:
+        results = [{"horizon_days": h, "confidence": c, "var": None, "cvar": None} for h in horizons for c in confidences]
+    return {
+        "batch_id": batch_id,
+        "start": start,
+        "end": end,
+        "model": model,
+        "paths": paths,
+        "seed": seed,
+        "history_days": history_days,
+        "modeled_value": round(modeled_value, 2),
+        "results": [
+            {
+                **r,
+                "var": _round(r["var"]),
+                "cvar": _round(r["cvar"]),
+                "var_value": _round(r["var"] * modeled_value if r["var"] is not None else None, 2),
+                "cvar_value": _round(r["cvar"] * modeled_value if r["cvar"] is not None else None, 2),
+            }
+            for r in results
+        ],
+    }
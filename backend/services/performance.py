@@ -0,0 +1,146 @@
+# backend/services/performance.py
+"""
+Return, volatility and drawdown metrics from a PriceMatrix, every symbol
+at once: each metric is one array operation down the date axis, with no
+per-symbol loop.
+
+  - gaps are carried forward from the symbol's last price; before its
+    first price a symbol has no returns;
+  - volatility is the annualized sample standard deviation of daily
+    returns (TRADING_DAYS per year);
+  - max_drawdown is the deepest fall from a running peak (<= 0);
+  - trailing returns run from the last price on or before the same day
+    1, 3, 6 and 12 months (and the year start) before the last date, and
+    are None when the history does not reach back that far.
+
+batch_performance() weights the symbols of a stored batch by market value
+and reports the same metrics for the portfolio, rebalanced daily to those
+weights among the symbols priced on each day.
+"""
+from __future__ import annotations
+import math
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+import models
+from services.batch_state import symbol_values
+from services.prices import PriceMatrix, load_price_matrix
+
+TRADING_DAYS = 252
+TRAILING_MONTHS = {"1m": 1, "3m": 3, "6m": 6, "1y": 12}
+DEFAULT_LOOKBACK_DAYS = 372  # a year and a week: return_1y has a base price to start from
+
+# ---------- Vectorized kernels ----------
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Carry each column's last non-NaN value down; leading NaNs stay."""
+    valid = ~np.isnan(values)
+    rows = np.where(valid, np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+def daily_returns(values: np.ndarray) -> np.ndarray:
+    """Simple returns between consecutive dates; NaN where either price is missing or not positive."""
+    prices = forward_fill(np.where(values > 0, values, np.nan))
+    with np.errstate(invalid="ignore"):
+        return prices[1:] / prices[:-1] - 1.0
+
+def price_metrics(matrix: PriceMatrix) -> Dict[str, np.ndarray]:
+    """Per-symbol metrics, each an array aligned with matrix.symbols."""
+    n_dates, n_symbols = matrix.shape
+    prices = forward_fill(np.where(matrix.values > 0, matrix.values, np.nan))
+    valid = ~np.isnan(prices)
+    observed = valid.any(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = prices[1:] / prices[:-1] - 1.0 if n_dates else np.empty((0, n_symbols))
+        has_return = ~np.isnan(returns)
+        n_returns = has_return.sum(axis=0)
+        r = np.where(has_return, returns, 0.0)
+        mean = r.sum(axis=0) / np.maximum(n_returns, 1)
+        var = (np.where(has_return, returns - mean, 0.0) ** 2).sum(axis=0) / np.maximum(n_returns - 1, 1)
+        volatility = np.where(n_returns >= 2, np.sqrt(var * TRADING_DAYS), np.nan)
+
+        first = prices[valid.argmax(axis=0), np.arange(n_symbols)] if n_dates else np.full(n_symbols, np.nan)
+        last = prices[-1] if n_dates else np.full(n_symbols, np.nan)
+        total_return = np.where(observed, last / first - 1.0, np.nan)
+
+        peak = np.fmax.accumulate(prices, axis=0)
+        max_drawdown = np.fmin.reduce(prices / peak - 1.0, axis=0) if n_dates else np.full(n_symbols, np.nan)
+
+        trailing = {}
+        if n_dates:
+            last_day = pd.Timestamp(matrix.dates[-1])
+            bases = dict((k, last_day - pd.DateOffset(months=m)) for k, m in TRAILING_MONTHS.items())
+            bases["ytd"] = pd.Timestamp(year=last_day.year - 1, month=12, day=31)
+            for label, base_day in bases.items():
+                row = np.searchsorted(matrix.dates, np.datetime64(base_day.date(), "D"), side="right") - 1
+                trailing[label] = last / prices[row] - 1.0 if row >= 0 else np.full(n_symbols, np.nan)
+        else:
+            trailing = {k: np.full(n_symbols, np.nan) for k in [*TRAILING_MONTHS, "ytd"]}
+
+    return {
+        "observations": n_returns,
+        "total_return": total_return,
+        "volatility": volatility,
+        "max_drawdown": max_drawdown,
+        **{f"return_{k}": v for k, v in trailing.items()},
+    }
+
+def weighted_returns(returns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Daily portfolio returns, weights renormalized over the symbols with a return that day."""
+    has_return = ~np.isnan(returns)
+    covered = has_return @ weights
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(covered > 0, np.where(has_return, returns, 0.0) @ weights / covered, np.nan)
+
+# ---------- Batch performance ----------
+
+def _metric(x) -> Optional[float]:
+    x = float(x)
+    return round(x, 6) if math.isfinite(x) else None
+
+def _metrics_row(metrics: Dict[str, np.ndarray], j: int) -> Dict:
+    return {k: (int(v[j]) if k == "observations" else _metric(v[j])) for k, v in metrics.items()}
+
+def batch_performance(db: Session, batch_id: int, as_of: date,
+                      start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+    end = end or as_of
+    start = start or end - timedelta(days=DEFAULT_LOOKBACK_DAYS)
+    values = symbol_values(db, batch_id)
+    matrix = load_price_matrix(db, db.get(models.Batch, batch_id).firm_id, values.keys(), start, end)
+
+    mv = np.array([values[s] for s in matrix.symbols], dtype=float)
+    metrics = price_metrics(matrix)
+    priced = ~np.isnan(metrics["total_return"])
+    total_mv = float(mv.sum())
+    weights = np.where(priced, mv, 0.0)
+    weights = weights / weights.sum() if weights.sum() > 0 else weights * 0.0
+
+    # the portfolio as a one-column price series: an index starting at 1
+    dates = matrix.dates if priced.any() else matrix.dates[:0]
+    port_returns = weighted_returns(daily_returns(matrix.values), weights)[:max(len(dates) - 1, 0)]
+    index = np.concatenate([[1.0], np.cumprod(1.0 + np.nan_to_num(port_returns))])[:len(dates), None]
+    port_row = _metrics_row(price_metrics(PriceMatrix(["portfolio"], dates, index)), 0)
+    port_row["observations"] = int((~np.isnan(port_returns)).sum())
+
+    order = np.argsort(-mv, kind="stable")
+    holdings: List[Dict] = [
+        {"symbol": matrix.symbols[j], "market_value": round(float(mv[j]), 2),
+         "weight": _metric(weights[j]), **_metrics_row(metrics, j)}
+        for j in order if priced[j]
+    ]
+    return {
+        "batch_id": batch_id,
+        "start": start,
+        "end": end,
+        "trading_days": int(len(matrix.dates)),
+        "priced_weight": _metric(mv[priced].sum() / total_mv) if total_mv > 0 else 0.0,
+        "unpriced_symbols": [matrix.symbols[j] for j in order if not priced[j]],
+        "portfolio": port_row,
+        "holdings": holdings,
+    }
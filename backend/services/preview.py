@@ -0,0 +1,80 @@
+# backend/services/preview.py
+"""
+Mapping previews that cost the same whatever the upload's size.
+
+Only the header and the first few rows are parsed, by pd.read_csv with
+nrows, so headers (duplicates suffixed ".1", blank ones "Unnamed: i")
+and cell text read exactly as a full read_csv of the file would show
+them. The row count comes from counting newlines in the raw bytes,
+streamed in chunks, up to PREVIEW_COUNT_MAX_BYTES. Blank lines are left
+out, as read_csv skips them, and a quoted cell that spans lines counts
+once per line. Past the budget the count is extrapolated from the lines
+per byte seen so far and flagged as approximate.
+"""
+from __future__ import annotations
+import os
+from typing import Any, BinaryIO, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import PREVIEW_COUNT_MAX_BYTES, PREVIEW_SAMPLE_ROWS
+from services.ingest import READ_CHUNK_SIZE
+
+def count_lines(src: BinaryIO, max_bytes: int = PREVIEW_COUNT_MAX_BYTES) -> Tuple[int, int, bool]:
+    """
+    Non-blank lines in src, read from its current position in chunks.
+    Returns (lines, bytes scanned, complete); when the scan stops at
+    max_bytes, lines covers only the bytes scanned so far.
+    """
+    lines = blanks = scanned = 0
+    tail = b"\0\n"  # the two bytes before the chunk; a blank first line counts as blank
+    last = b""
+    while scanned < max_bytes:
+        chunk = src.read(min(READ_CHUNK_SIZE, max_bytes - scanned))
+        if not chunk:
+            break
+        scanned += len(chunk)
+        lines += chunk.count(b"\n")
+        # blank lines ("\n\n", "\n\r\n", overlapping) ending in this chunk
+        buf = np.frombuffer(tail + chunk, dtype=np.uint8)
+        nl = buf == 0x0A
+        blanks += int(np.count_nonzero(nl[1:-1] & nl[2:]))
+        blanks += int(np.count_nonzero(nl[:-2] & (buf[1:-1] == 0x0D) & nl[2:]))
+        tail = bytes(buf[-2:])
+        last = chunk[-1:]
+    complete = not src.read(1)
+    if complete and last not in (b"", b"\n"):
+        lines += 1  # last line without a terminator
+    return lines - blanks, scanned, complete
+
+def preview_csv(src: BinaryIO, mapping: Dict[str, Any], rows: int = PREVIEW_SAMPLE_ROWS,
+                max_bytes: int = PREVIEW_COUNT_MAX_BYTES) -> Dict[str, Any]:
+    """
+    Headers, the first `rows` rows through `mapping` (field -> column
+    index) and the number of data rows of the CSV in the seekable stream
+    src (UploadFile.file is one). total_rows is exact when the whole file
+    fits in max_bytes, otherwise an estimate with total_rows_approximate set.
+    """
+    start = src.tell()
+    lines, scanned, complete = count_lines(src, max_bytes)
+    if complete:
+        total_rows = max(lines - 1, 0)  # minus the header
+    else:
+        size = src.seek(0, os.SEEK_END) - start
+        total_rows = max(round(lines * size / max(scanned, 1)) - 1, 0)
+    src.seek(start)
+
+    df = pd.read_csv(src, nrows=rows)
+    headers = df.columns.tolist()
+    sample = [{} for _ in range(len(df))]
+    for field, col_idx in mapping.items():
+        if col_idx is not None and col_idx < len(headers):
+            for row, value in zip(sample, df.iloc[:, col_idx].astype(str)):
+                row[field] = value
+    return {
+        "headers": headers,
+        "sample_rows": sample,
+        "total_rows": total_rows,
+        "total_rows_approximate": not complete,
+    }
@@ -0,0 +1,333 @@
+# backend/services/price_store.py
+"""
+The price history as memory-mapped .npy files under PRICE_STORE_DIR, so
+price matrices are read from the page cache instead of rebuilt from the
+prices table in every process.
+
+Layout (one generation of files at a time):
+  values.<gen>.npy  float64 [row, day]: the price, NaN if none
+  ids.<gen>.npy     int64   [row, day]: prices.id the value came from, 0 if none
+  index.json        generation, the database it mirrors, the first day of
+                    the grid, the (firm, symbol) of each row, the capacities
+                    and the nearest days of prices left out of the grid
+
+Prices are per firm (see services/prices.py), so a row is one firm's
+history of one symbol, contiguous. Days are calendar days from the grid's
+origin, so a date's column is arithmetic and only rows need an index.
+Every uvicorn worker maps the same files read-only; the kernel shares the
+pages and a matrix request copies out just the rows and days it asks for.
+
+The grid only spans days from PRICE_STORE_START to a year past today, so
+a mistyped date (1900, 2204) cannot stretch every row over centuries.
+Prices outside that window are left out and the index keeps the nearest
+day left out on each side; matrix() returns None for a range reaching
+past one and the caller reads it from the table instead.
+
+Writes (ingest, file removal, the first build) take an exclusive flock
+and update the files in place: a cell only takes a price with a higher
+prices.id than the one it holds, so the latest ingested row wins whatever
+order files are applied in. A write that needs a new row or a day
+outside the grid past the capacity rewrites both files into the next
+generation (capacities grow geometrically) and swaps index.json
+atomically; readers notice the new generation on their next read.
+
+If the directory is empty, or mirrors another database, the first read
+builds it from the prices table. If applying an ingest fails, the index
+is removed so the next read rebuilds rather than serving stale prices.
+"""
+from __future__ import annotations
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+
+import models
+from config import PRICE_STORE_DIR, PRICE_STORE_START
+
+STORE_VERSION = 2
+MIN_ROW_CAPACITY = 64
+DAY_HEADROOM = 366  # spare days past the last price, so daily appends rarely regrow
+EPOCH = np.datetime64("1970-01-01", "D")
+
+def _day(d) -> int:
+    return int((np.datetime64(d, "D") - EPOCH).astype(int))
+
+def _window() -> Tuple[int, int]:
+    """First and last day the grid may hold."""
+    return _day(PRICE_STORE_START), _day(date.today()) + DAY_HEADROOM
+
+def _database_key(db: Session) -> str:
+    return db.get_bind().url.render_as_string(hide_password=True)
+
+class _View:
+    """One generation as mapped by this process."""
+
+    def __init__(self, index: Dict, values: np.ndarray, ids: np.ndarray):
+        self.index = index
+        self.values = values
+        self.ids = ids
+        self.origin = int(index["origin"])
+        self.rows = {(f, s): i for i, (f, s) in enumerate(index["rows"])}
+
+class PriceStore:
+    def __init__(self, root: str = PRICE_STORE_DIR):
+        self.root = root
+        self._view: Optional[_View] = None
+        self._index_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    # ---------- Reads ----------
+
+    def matrix(self, db: Session, firm_id: int, symbols: List[str], start: Optional[date], end: Optional[date]):
+        """
+        A firm's PriceMatrix of symbols (sorted) over [start, end], as
+        load_price_matrix() returns it; None if the range reaches days of
+        prices left out of the grid.
+        """
+        from services.prices import PriceMatrix
+
+        view = self._current(db)
+        before, after = view.index.get("before"), view.index.get("after")
+        if before is not None and (start is None or _day(start) <= before):
+            return None
+        if after is not None and (end is None or _day(end) >= after):
+            return None
+        rows = np.array([view.rows.get((firm_id, s), -1) for s in symbols], dtype=np.int64)
+        n_days = view.values.shape[1]
+        lo = 0 if start is None else min(max(_day(start) - view.origin, 0), n_days)
+        hi = n_days if end is None else min(max(_day(end) - view.origin + 1, lo), n_days)
+
+        block = np.full((len(symbols), hi - lo), np.nan)
+        known = rows >= 0
+        if known.any() and hi > lo:
+            block[known] = view.values[rows[known], lo:hi]
+        traded = ~np.isnan(block).all(axis=0)
+        dates = EPOCH + (view.origin + lo + np.flatnonzero(traded))
+        return PriceMatrix(symbols, dates.astype("datetime64[D]"), np.ascontiguousarray(block[:, traded].T))
+
+    def _current(self, db: Session) -> _View:
+        with self._lock:
+            for _ in range(2):
+                index = self._read_index()
+                if index is None or index.get("version") != STORE_VERSION or index.get("database") != _database_key(db):
+                    self.rebuild(db)
+                    continue
+                try:
+                    if self._view is None or self._view.index["generation"] != index["generation"]:
+                        self._view = _View(index, *self._map(index, "r"))
+                    elif self._view.index is not index:
+                        self._view = _View(index, self._view.values, self._view.ids)
+                    return self._view
+                except FileNotFoundError:
+                    continue  # regrown between reading the index and mapping it
+            raise RuntimeError(f"price store at {self.root} could not be opened")
+
+    # ---------- Writes ----------
+
+    def rebuild(self, db: Session) -> None:
+        """Build the store from every row of the prices table."""
+        with self._writing():
+            index = {
+                "version": STORE_VERSION, "database": _database_key(db), "generation": self._next_generation(),
+                "origin": 0, "days": 0, "rows": [], "row_capacity": 0, "before": None, "after": None,
+            }
+            self._apply(index, None, None, _price_rows(db))
+
+    def add_files(self, db: Session, file_ids: Sequence[int]) -> None:
+        """Apply the prices just ingested from these files (no-op before the store is built)."""
+        if not file_ids:
+            return
+        self._guarded(lambda index, values, ids: self._apply(
+            index, values, ids, _price_rows(db, models.Price.source_file_id.in_(list(file_ids)))
+        ), db)
+
+    def refresh(self, db: Session, symbols: Sequence[str], start: date, end: date) -> None:
+        """Re-read the cells of symbols over [start, end] from the table, e.g. after prices were deleted."""
+        if not symbols:
+            return
+        Pr = models.Price
+        wanted = set(symbols)
+
+        def reload(index, values, ids):
+            rows = [i for i, (_, s) in enumerate(index["rows"]) if s in wanted]  # every firm's
+            lo = max(_day(start) - index["origin"], 0)
+            hi = max(min(_day(end) - index["origin"] + 1, values.shape[1]), lo)
+            for r in rows:
+                values[r, lo:hi] = np.nan
+                ids[r, lo:hi] = 0
+            frame = _price_rows(db, Pr.symbol.in_(list(symbols)), Pr.date >= start, Pr.date <= end)
+            self._apply(index, values, ids, frame)
+        self._guarded(reload, db)
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next read."""
+        try:
+            os.remove(self._path("index.json"))
+        except FileNotFoundError:
+            pass
+
+    def _guarded(self, update, db: Session) -> None:
+        try:
+            with self._writing() as state:
+                if state is None or state[0].get("database") != _database_key(db):
+                    return
+                update(*state)
+        except Exception:
+            self.invalidate()  # the table is already committed; rebuild from it on the next read
+
+    @contextmanager
+    def _writing(self) -> Iterator[Optional[Tuple[Dict, np.ndarray, np.ndarray]]]:
+        """Exclusive across processes; yields the current (index, values, ids) opened for update."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self._read_index(cached=False)
+                if index is None or index.get("version") != STORE_VERSION:
+                    yield None
+                else:
+                    yield (index, *self._map(index, "r+"))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _apply(self, index: Dict, values: Optional[np.ndarray], ids: Optional[np.ndarray],
+               frame: pd.DataFrame) -> None:
+        """Write rows (id, firm_id, symbol, day, price) into the grid, growing it first if needed; saves index.json."""
+        low, high = _window()
+        before, after = frame["day"] < low, frame["day"] > high
+        if before.any():
+            index["before"] = max(index.get("before") or low, int(frame["day"][before].max()))
+        if after.any():
+            index["after"] = min(index.get("after") or high, int(frame["day"][after].min()))
+        frame = frame[~(before | after)]
+        if frame.empty:
+            if values is not None and index["days"]:
+                values.flush()
+                ids.flush()
+            self._write_index(index)
+            return
+
+        known = {(f, s) for f, s in index["rows"]}
+        pairs = frame[["firm_id", "symbol"]].drop_duplicates().itertuples(index=False, name=None)
+        index["rows"] = index["rows"] + [[int(f), s] for f, s in pairs if (f, s) not in known]
+        first, last = int(frame["day"].min()), int(frame["day"].max())
+        origin, days = index["origin"], index["days"]
+        if not days or first < origin or last >= origin + days or len(index["rows"]) > index["row_capacity"]:
+            values, ids = self._regrow(index, values, ids, first, last)
+
+        frame = frame.sort_values("id", kind="stable").drop_duplicates(["firm_id", "symbol", "day"], keep="last")
+        row = pd.MultiIndex.from_tuples([tuple(r) for r in index["rows"]]).get_indexer(
+            pd.MultiIndex.from_arrays([frame["firm_id"], frame["symbol"]])
+        )
+        col = frame["day"].to_numpy() - index["origin"]
+        new_id = frame["id"].to_numpy()
+        newer = new_id > ids[row, col]
+        values[row[newer], col[newer]] = frame["price"].to_numpy()[newer]
+        ids[row[newer], col[newer]] = new_id[newer]
+        values.flush()
+        ids.flush()
+        self._write_index(index)
+
+    def _regrow(self, index: Dict, values: Optional[np.ndarray], ids: Optional[np.ndarray], first: int, last: int):
+        """Copy the grid into a new generation sized for the rows and days [first, last]."""
+        old_origin, old_days, old_capacity = index["origin"], index["days"], index["row_capacity"]
+        if old_days:
+            first, last = min(first, old_origin), max(last, old_origin + old_days - 1)
+        capacity = max(MIN_ROW_CAPACITY, len(index["rows"]), old_capacity)
+        if len(index["rows"]) > old_capacity:
+            capacity = max(capacity, 2 * old_capacity)
+        days = last - first + 1 + max(DAY_HEADROOM, old_days // 2)
+
+        index.update(generation=self._next_generation(), origin=first, days=days, row_capacity=capacity)
+        new_values, new_ids = self._map(index, "w+", shape=(capacity, days))
+        new_values[:] = np.nan
+        new_ids[:] = 0
+        if values is not None and old_days:
+            offset = old_origin - first
+            new_values[:old_capacity, offset:offset + old_days] = values
+            new_ids[:old_capacity, offset:offset + old_days] = ids
+        self._retire_all_but(index["generation"])
+        return new_values, new_ids
+
+    # ---------- Files ----------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _read_index(self, cached: bool = True) -> Optional[Dict]:
+        """index.json; readers reuse their mapped view's copy while the file is unchanged."""
+        path = self._path("index.json")
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if cached and self._view is not None and self._index_stamp == stamp:
+                return self._view.index
+            with open(path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        if cached:
+            self._index_stamp = stamp
+        return index
+
+    def _write_index(self, index: Dict) -> None:
+        tmp = self._path(f"index.json.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._path("index.json"))
+
+    def _map(self, index: Dict, mode: str, shape: Optional[Tuple[int, int]] = None):
+        gen = index["generation"]
+        if mode != "w+" and not index["days"]:
+            return np.empty((0, 0)), np.empty((0, 0), dtype=np.int64)  # no prices yet, no files
+        if mode == "w+":
+            return (
+                np.lib.format.open_memmap(self._path(f"values.{gen}.npy"), mode="w+", dtype=np.float64, shape=shape),
+                np.lib.format.open_memmap(self._path(f"ids.{gen}.npy"), mode="w+", dtype=np.int64, shape=shape),
+            )
+        return (
+            np.load(self._path(f"values.{gen}.npy"), mmap_mode=mode),
+            np.load(self._path(f"ids.{gen}.npy"), mmap_mode=mode),
+        )
+
+    def _next_generation(self) -> int:
+        index = self._read_index(cached=False)
+        generations = [int(n.split(".")[1]) for n in os.listdir(self.root) if n.endswith(".npy")]
+        return max([index["generation"] if index else 0, *generations]) + 1
+
+    def _retire_all_but(self, generation: int) -> None:
+        # processes still mapping old files keep their pages until they remap
+        for name in os.listdir(self.root):
+            if name.endswith(".npy") and int(name.split(".")[1]) != generation:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+
+def _price_rows(db: Session, *conditions) -> pd.DataFrame:
+    Pr, B = models.Price, models.Batch
+    rows = db.execute(
+        select(Pr.id, B.firm_id, Pr.symbol, Pr.date, cast(Pr.price, Float))
+        .join(B, B.id == Pr.batch_id)
+        .where(Pr.price.isnot(None), *conditions)
+    ).all()
+    frame = pd.DataFrame.from_records(rows, columns=["id", "firm_id", "symbol", "date", "price"])
+    if frame.empty:
+        return pd.DataFrame({"id": [], "firm_id": [], "symbol": [], "day": [], "price": []})
+    days = (frame["date"].to_numpy(dtype="datetime64[D]") - EPOCH).astype(np.int64)
+    return pd.DataFrame({"id": frame["id"].astype(np.int64), "firm_id": frame["firm_id"].astype(np.int64),
+                         "symbol": frame["symbol"], "day": days, "price": frame["price"].astype(float)})
+
+price_store = PriceStore()
@@ -0,0 +1,157 @@
+# backend/services/prices.py
+"""
+Price history as a dense date x symbol matrix.
+
+load_price_matrix() reads a firm's prices of a symbol set over a date
+range in one pass and lays them out as a float64 array (rows: the dates
+any of the symbols has a price on, ascending; columns: the symbols,
+sorted; NaN where a symbol has no price that day). Prices belong to the
+firm whose batch they were ingested in (prices.batch_id -> batches.firm_id)
+and are shared by all its batches, so when several rows exist for the
+same symbol and date the last one the firm ingested wins; other firms'
+prices are never read.
+
+With PRICE_STORE_DIR set, matrices are cut from the memory-mapped store
+every worker shares (services/price_store.py), which ingest keeps current.
+Without it, or for ranges reaching prices dated outside the store's
+window, they are read from the table and cached per process by
+(firm, symbols, start, end). Ingest clears these caches (and the others built on
+prices, e.g. covariances) in the process that wrote new prices; the TTL
+bounds how long other workers can serve values without them. Cached values
+are shared; callers must not write to them.
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+
+import models
+from config import PRICE_MATRIX_CACHE_SIZE, PRICE_MATRIX_CACHE_TTL
+from services.price_store import price_store
+
+IN_CLAUSE_SIZE = 500
+
+class PriceMatrix:
+    """values[i, j]: price of symbols[j] on dates[i] (NaN if none)."""
+
+    def __init__(self, symbols: List[str], dates: np.ndarray, values: np.ndarray):
+        self.symbols = symbols
+        self.dates = dates  # datetime64[D], ascending
+        self.values = values
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.values.shape
+
+    def columns(self, symbols: Sequence[str]) -> np.ndarray:
+        """Column index of each symbol (-1 if not in the matrix)."""
+        return pd.Index(self.symbols).get_indexer(list(symbols))
+
+# ---------- Loading ----------
+
+def load_price_matrix(db: Session, firm_id: int, symbols: Sequence[str], start: Optional[date] = None,
+                      end: Optional[date] = None, use_cache: bool = True) -> PriceMatrix:
+    symbols = sorted(set(symbols))
+    if use_cache and price_store.enabled:
+        matrix = price_store.matrix(db, firm_id, symbols, start, end)
+        if matrix is not None:
+            return matrix
+    key = (firm_id, tuple(symbols), start, end)
+    if use_cache:
+        cached = price_matrix_cache.get(key)
+        if cached is not None:
+            return cached
+    matrix = _read_matrix(db, firm_id, symbols, start, end)
+    if use_cache:
+        price_matrix_cache.put(key, matrix)
+    return matrix
+
+def _read_matrix(db: Session, firm_id: int, symbols: List[str], start: Optional[date],
+                 end: Optional[date]) -> PriceMatrix:
+    Pr, B = models.Price, models.Batch
+    rows = []
+    for i in range(0, len(symbols), IN_CLAUSE_SIZE):
+        q = select(Pr.id, Pr.symbol, Pr.date, cast(Pr.price, Float)).join(B, B.id == Pr.batch_id).where(
+            B.firm_id == firm_id, Pr.symbol.in_(symbols[i:i + IN_CLAUSE_SIZE]), Pr.price.isnot(None)
+        )
+        if start is not None:
+            q = q.where(Pr.date >= start)
+        if end is not None:
+            q = q.where(Pr.date <= end)
+        rows.extend(db.execute(q).all())
+    if not rows:
+        return PriceMatrix(symbols, np.array([], dtype="datetime64[D]"), np.empty((0, len(symbols))))
+
+    frame = pd.DataFrame.from_records(rows, columns=["id", "symbol", "date", "price"])
+    # latest ingested row per (symbol, date)
+    frame = frame.sort_values("id", kind="stable").drop_duplicates(["symbol", "date"], keep="last")
+    row_dates = frame["date"].to_numpy(dtype="datetime64[D]")
+    dates = np.unique(row_dates)
+    values = np.full((len(dates), len(symbols)), np.nan)
+    values[np.searchsorted(dates, row_dates), pd.Index(symbols).get_indexer(frame["symbol"])] = (
+        frame["price"].astype(float).to_numpy()
+    )
+    return PriceMatrix(symbols, dates, values)
+
+# ---------- In-process LRU of price-derived data ----------
+
+_CACHES: List["PriceDataCache"] = []
+
+class PriceDataCache:
+    """
+    LRU + TTL cache of values computed from the prices table (matrices,
+    covariances), keyed by tuples starting with (firm, symbols, start, end).
+    Every instance is cleared by clear_price_caches().
+    """
+
+    def __init__(self, maxsize: int = PRICE_MATRIX_CACHE_SIZE, ttl: float = PRICE_MATRIX_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _CACHES.append(self)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+price_matrix_cache = PriceDataCache()
+
+def clear_price_caches() -> None:
+    """After prices were written or deleted by this process."""
+    for cache in _CACHES:
+        cache.clear()
@@ -0,0 +1,179 @@
+# backend/services/sql_analytics.py
+"""
+analyze_portfolio() for a stored batch, computed inside the database.
+
+The positions never leave the database: normalize_custodian_csv()'s row
+cleanup is expressed as a CTE, the holding and sector sums are GROUP BYs,
+top-N is a ROW_NUMBER() window and the HHI is a SUM of squared weights.
+Only a handful of small result sets come back (one summary row, the top
+ten holdings, one row per sector, the duplicated symbols).
+
+The output matches compute_batch_analysis() on the same rows (see
+benchmarks/check_sql_analytics.py), with two differences that only show
+on exact ties or at the last bit of a float:
+  - holdings and sectors with equal values are ordered by key here, and
+    duplicated symbols with equal counts by their largest holding, where
+    pandas keeps its quicksort's (unspecified) tie order;
+  - the database sums in its own order, so a total can differ in the last
+    ulp before rounding.
+Text is trimmed with TRIM(), i.e. spaces only; symbols are stored already
+stripped by ingest.
+"""
+from __future__ import annotations
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import Float, and_, case, cast, distinct, func, or_, select
+from sqlalchemy.orm import Session
+
+import models
+from services.analytics import _empty_result, _round2, _round4
+
+KEY_COLUMNS = ("symbol", "name", "sector", "currency")
+TOP_HOLDINGS = 10
+
+def _text(col):
+    # astype(str).replace({"nan": "", "None": "", "NaN": ""}).str.strip()
+    return func.trim(case((or_(col.is_(None), col.in_(("nan", "None", "NaN"))), ""), else_=col))
+
+def normalized_rows(batch_id: int, with_account: bool = False):
+    """
+    The batch's rows after normalize_custodian_csv(), as a CTE (plus
+    account_id if asked); shared with the other in-database queries, e.g.
+    services/batch_diff.py.
+    """
+    P = models.Position
+    qty = func.coalesce(cast(P.quantity, Float), 0.0)
+    price = func.coalesce(cast(P.price, Float), 0.0)
+    mv = cast(P.market_value, Float)
+    base = (
+        select(
+            _text(P.symbol).label("symbol"),
+            _text(P.name).label("name"),
+            _text(P.sector).label("sector"),
+            _text(P.currency).label("currency"),
+            qty.label("quantity"),
+            price.label("price"),
+            case((or_(mv.is_(None), mv == 0), qty * price), else_=mv).label("market_value"),
+            *([P.account_id] if with_account else []),
+        )
+        .where(P.batch_id == batch_id)
+        .cte("base")
+    )
+    # rows with no symbol and no value are dropped
+    return (
+        select(base)
+        .where(~and_(base.c.symbol == "", base.c.market_value == 0))
+        .cte("normalized")
+    )
+
+def analyze_batch_sql(db: Session, batch_id: int) -> Dict:
+    rows = normalized_rows(batch_id)
+    r = rows.c
+
+    def count_if(cond):
+        return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+    def any_if(cond):
+        return func.coalesce(func.max(case((cond, 1), else_=0)), 0)
+
+    summary = db.execute(select(
+        func.count().label("n"),
+        func.sum(r.market_value).label("total"),
+        count_if(r.price > 0).label("priced"),
+        count_if(r.market_value > 0).label("mv_pos"),
+        (any_if(r.symbol != "") + any_if(r.quantity != 0) + any_if(r.price != 0)
+         + any_if(r.market_value != 0)).label("present"),
+        count_if(r.symbol == "").label("missing"),
+        count_if(r.market_value == 0).label("zero_mv"),
+    )).one()
+    n = int(summary.n)
+    if not n:
+        return _empty_result()
+
+    # holdings: groupby(symbol, name, sector, currency), weighted and ranked
+    holdings = (
+        select(*(r[c] for c in KEY_COLUMNS), func.sum(r.market_value).label("mv"))
+        .group_by(*(r[c] for c in KEY_COLUMNS))
+        .cte("holdings")
+    )
+    h = holdings.c
+    total_w = func.sum(h.mv).over()
+    ranked = select(
+        holdings,
+        case((total_w > 0, h.mv / total_w), else_=0.0).label("w"),
+        func.row_number().over(order_by=(h.mv.desc(), *(h[c] for c in KEY_COLUMNS))).label("rn"),
+    ).cte("ranked")
+    k = ranked.c
+
+    def top_k(n_top: int):
+        return func.coalesce(func.sum(case((k.rn <= n_top, k.w), else_=0.0)), 0.0)
+
+    agg = db.execute(select(
+        func.count(distinct(k.symbol)).label("holdings"),
+        func.coalesce(func.sum(case((k.w > 0, k.w * k.w), else_=0.0)), 0.0).label("hhi"),
+        count_if(k.w > 0).label("positive"),
+        top_k(1).label("top1"),
+        top_k(3).label("top3"),
+        top_k(5).label("top5"),
+    )).one()
+    top = db.execute(
+        select(*(k[c] for c in KEY_COLUMNS), k.mv, k.w).where(k.rn <= TOP_HOLDINGS).order_by(k.rn)
+    ).all()
+
+    div_score = 0.0
+    if agg.positive > 1:
+        div_score = float(max(0.0, min(1.0, (1.0 - agg.hhi) / (1.0 - 1.0 / agg.positive))))
+
+    # sectors: one row each; weights computed here like _weights()
+    sectors = db.execute(
+        select(r.sector, func.sum(r.market_value).label("mv"))
+        .group_by(r.sector)
+        .order_by(func.sum(r.market_value).desc(), r.sector)
+    ).all()
+    sv = np.array([s.mv for s in sectors], dtype=float)
+    total_s = float(sv.sum())
+    sw = sv * 0.0 if total_s <= 0 else sv / total_s
+
+    # symbols spread over several holdings, most holdings first (value_counts order)
+    dupes = db.execute(
+        select(h.symbol)
+        .group_by(h.symbol)
+        .having(func.count() > 1)
+        .order_by(func.count().desc(), func.max(h.mv).desc(), h.symbol)
+    ).scalars().all()
+
+    priced_ratio = summary.priced / n
+    mv_ratio = summary.mv_pos / n
+    mapped_ratio = summary.present / 4
+    transparency_score = 100.0 * (0.5 * mv_ratio + 0.3 * priced_ratio + 0.2 * mapped_ratio)
+
+    return {
+        "total_value": _round2(summary.total),
+        "holdings": int(agg.holdings),
+        "sector_allocation_value": {s.sector: _round2(v) for s, v in zip(sectors, sv)},
+        "sector_allocation_weight": {s.sector: _round4(w) for s, w in zip(sectors, sw)},
+        "top_holdings": [
+            {
+                **{c: t[i] for i, c in enumerate(KEY_COLUMNS)},
+                "market_value": _round2(t.mv),
+                "weight": _round4(t.w),
+            }
+            for t in top
+        ],
+        "top1_weight": _round4(agg.top1),
+        "top3_weight": _round4(agg.top3),
+        "top5_weight": _round4(agg.top5),
+        "diversification_score": _round4(div_score),
+        "transparency": {
+            "priced_ratio": _round4(priced_ratio),
+            "mv_ratio": _round4(mv_ratio),
+            "mapped_ratio": _round4(mapped_ratio),
+            "score": _round2(transparency_score),
+        },
+        "diagnostics": {
+            "missing_symbol_rows": int(summary.missing),
+            "zero_mv_rows": int(summary.zero_mv),
+            "duplicate_symbols": list(dupes),
+        },
+    }
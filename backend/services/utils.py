@@ -1,7 +1,11 @@
 import pandas as pd
 import numpy as np
 import re
-from typing import Dict, List
+from functools import lru_cache
+from pandas.api.types import infer_dtype, is_bool_dtype, is_float_dtype, is_integer_dtype
+from typing import Dict, List, Optional, Tuple
+
+from config import NORMALIZATION_PLAN_CACHE_SIZE
 
 # ---------- 1) Header Synonyms & Standard Schema ----------
 
@@ -72,9 +76,115 @@ def _to_number(x):
     except:
         return np.nan
 
+# _smart_numeric() applies _to_number() column-wise. Text cells are laid out
+# as rows of code points (numpy "U" arrays viewed as uint32), so stripping,
+# the parentheses / percent checks and the _MONEY_RE removal are array ops
+# over a whole block of cells; the cleaned strings are then parsed by
+# float() itself in one C loop, so every value matches _to_number() exactly.
+# Character classes are looked up in tables over U+0000..U+3000 (no
+# whitespace code point is higher); anything above is an ordinary character.
+_TABLE_SIZE = 0x3001
+_STRIP_CHARS = np.array([chr(c).isspace() for c in range(_TABLE_SIZE)] + [False])
+_MONEY_CHARS = np.array([_MONEY_RE.match(chr(c)) is not None for c in range(_TABLE_SIZE)] + [False])
+_PLAIN_CHARS = np.isin(np.arange(_TABLE_SIZE + 1), [ord(c) for c in "0123456789.eE+-"])
+_MAX_CELL_CHARS = 64  # longer cells go through _to_number() one by one
+_CLEAN_BLOCK_ROWS = 1 << 16
+# infer_dtype() kinds whose values float() converts exactly as _to_number() does
+_NUMBER_KINDS = {"floating", "integer", "mixed-integer-float", "boolean"}
+
+def _to_float(x) -> float:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _cast_exact(values: np.ndarray, convert) -> np.ndarray:
+    """float() of each value in one C loop; convert() per value if any of them fails."""
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return np.array([convert(v) for v in values], dtype=float)
+
+def _clean_block(strings: np.ndarray) -> np.ndarray:
+    """_to_number() of a block of short str cells."""
+    n = len(strings)
+    length = np.fromiter(map(len, strings), dtype=np.int64, count=n)
+    width = max(int(length.max(initial=0)), 1)
+    codes = strings.astype(f"U{width}").view(np.uint32).reshape(n, width)
+    chars = np.minimum(codes, _TABLE_SIZE)
+    inside = np.arange(width) < length[:, None]
+    rows = np.arange(n)
+
+    # str.strip(), then "(...)" means negative
+    body = inside & ~_STRIP_CHARS[chars]
+    first = body.argmax(axis=1)
+    last = width - 1 - body[:, ::-1].argmax(axis=1)
+    neg = body.any(axis=1) & (codes[rows, first] == ord("(")) & (codes[rows, last] == ord(")"))
+    lo, hi = first + neg, last - neg
+    cols = np.arange(width)
+    keep = (cols >= lo[:, None]) & (cols <= hi[:, None]) & ~_MONEY_CHARS[chars]
+
+    # trailing "%" after the removal
+    kept = keep.any(axis=1)
+    tail = width - 1 - keep[:, ::-1].argmax(axis=1)
+    pct = kept & (codes[rows, tail] == ord("%"))
+    keep[rows[pct], tail[pct]] = False
+
+    # pack the kept characters to the left of each row
+    dest = np.cumsum(keep, axis=1, dtype=np.int64)
+    dest += (rows * width - 1)[:, None]
+    packed = np.zeros(n * width, dtype=np.uint32)
+    packed[dest[keep]] = codes[keep]
+    cleaned = packed.view(f"U{width}").astype(object)
+
+    out = np.full(n, np.nan)
+    nul = ((codes == 0) & inside).any(axis=1)  # "U" arrays drop trailing NULs
+    plain = kept & ~nul & (keep <= _PLAIN_CHARS[chars]).all(axis=1)
+    out[plain] = _cast_exact(cleaned[plain], _to_float)
+    other = np.flatnonzero(~plain & ~nul)  # inf, nan, N/A, non-ASCII digits, ...
+    out[other] = [_to_float(c) for c in cleaned[other]]
+    out[pct] /= 100.0
+    out[neg] *= -1
+    odd = np.flatnonzero(nul)
+    out[odd] = [_to_number(v) for v in strings[odd]]
+    return out
+
+def _clean_strings(strings: np.ndarray) -> np.ndarray:
+    """_to_number() of an object array of str."""
+    out = np.full(len(strings), np.nan)
+    long = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings)) > _MAX_CELL_CHARS
+    short = np.flatnonzero(~long)
+    for lo in range(0, len(short), _CLEAN_BLOCK_ROWS):
+        block = short[lo:lo + _CLEAN_BLOCK_ROWS]
+        out[block] = _clean_block(strings[block])
+    out[long] = [_to_number(v) for v in strings[long]]
+    return out
+
 def _smart_numeric(series: pd.Series) -> pd.Series:
-    """Vectorized numeric cleanup."""
-    return series.apply(_to_number).astype(float)
+    """
+    Vectorized numeric cleanup, value for value what _to_number() returns.
+    Numeric columns are cast directly, and so are text columns float()
+    accepts as they stand; otherwise the text cells go through the
+    vectorized cleanup (currency, commas, parentheses, %, "—").
+    """
+    if is_float_dtype(series) or is_integer_dtype(series) or is_bool_dtype(series):
+        return series.astype(float)
+
+    values = series.to_numpy(dtype=object, na_value=None)
+    out = np.full(len(values), np.nan)
+    present = np.flatnonzero(~pd.isna(values))
+    values = values[present]
+    kind = infer_dtype(values, skipna=False)
+    if kind in _NUMBER_KINDS:
+        out[present] = values.astype(float)
+    elif kind in ("string", "empty"):
+        try:
+            out[present] = values.astype(float)  # float() takes every cell as it stands
+        except (TypeError, ValueError):
+            out[present] = _clean_strings(values)
+    else:  # mixed cell types (e.g. from Excel): per cell
+        out[present] = [_to_number(v) for v in values]
+    return pd.Series(out, index=series.index, name=series.name)
 
 # ---------- 3) Header Normalization ----------
 
@@ -91,10 +201,10 @@ def _canonical_name(col: str) -> str:
     lc2 = lc.replace("_", " ").replace("-", " ").strip()
     return FLAT_INDEX.get(lc2, lc)
 
-def _rename_to_canonical(df: pd.DataFrame) -> pd.DataFrame:
+def _canonical_renames(columns) -> Dict[str, str]:
     new_cols = {}
     seen = set()
-    for c in df.columns:
+    for c in columns:
         can = _canonical_name(c)
         # avoid duplicate canon names by keeping the first occurrence
         if can in seen:
@@ -102,7 +212,7 @@ def _rename_to_canonical(df: pd.DataFrame) -> pd.DataFrame:
         else:
             new_cols[c] = can
             seen.add(can)
-    return df.rename(columns=new_cols)
+    return new_cols
 
 # ---------- 4) Custodian Heuristics (optional) ----------
 
@@ -120,9 +230,96 @@ def detect_custodian(df: pd.DataFrame) -> str:
         return "schwab_like"
     return "custom"
 
-# ---------- 5) Public Normalizer ----------
+# ---------- 5) Normalization Plans ----------
+
+NUMERIC_COLUMNS = ["quantity", "price", "market_value"]
+TEXT_COLUMNS = ["symbol", "name", "sector", "currency"]
+
+# Columns a newly inferred mapping (services/ingest.py) reads per field: the first candidate, in this
+# order, among the stripped lower-cased headers (a repeated header gives its last column)
+MAPPING_CANDIDATES: Dict[str, List[str]] = {
+    # positions fields
+    "symbol": ["symbol", "ticker", "security", "security id"],
+    "name": ["name", "security name"],
+    "quantity": ["quantity", "shares", "qty"],
+    "price": ["price", "current price", "last price"],
+    "market_value": ["market value", "marketvalue", "mv"],
+    "cost_basis": ["cost basis", "cost", "avg cost", "average cost"],
+    "sector": ["sector"],
+    "currency": ["currency", "ccy"],
+    # prices fields
+    "date": ["date", "as of", "as_of", "pricedate"],
+    "close": ["close", "price", "px_last"],
+    # balances fields
+    "cash": ["cash"],
+    "account": ["account", "account number", "acct"],
+}
+
+class NormalizationPlan:
+    """
+    What normalize_custodian_csv() derives from a header layout alone:
+    renames to canonical names, the standard columns the layout lacks, the
+    numeric columns to coerce, the source column index of each standard
+    field and the columns a new mapping infers (MAPPING_CANDIDATES). Plans
+    are shared; callers must not mutate them.
+    """
+
+    def __init__(self, headers: Tuple, renames: Dict[str, str], missing: List[str], numeric: List[str],
+                 text: List[str], columns: Dict[str, int], mapping: Dict[str, Optional[int]]):
+        self.headers = headers
+        self.renames = renames
+        self.missing = missing
+        self.numeric = numeric
+        self.text = text
+        self.columns = columns
+        self.mapping = mapping
 
-def normalize_custodian_csv(df: pd.DataFrame) -> pd.DataFrame:
+@lru_cache(maxsize=NORMALIZATION_PLAN_CACHE_SIZE)
+def normalization_plan(headers: Tuple[str, ...]) -> NormalizationPlan:
+    """
+    Plan for a header layout (the exact labels, in order). A firm sends a
+    handful of layouts, so plans are memoized and repeat files skip the
+    synonym matching, and ingest infers new mappings from plan.mapping
+    without matching the candidates again.
+    """
+    headers = tuple(headers)
+    renames = _canonical_renames(headers)
+    columns: Dict[str, int] = {}
+    for i, h in enumerate(headers):
+        if renames[h] in STANDARD_ORDER:
+            columns.setdefault(renames[h], i)
+    missing = [c for c in STANDARD_ORDER if c not in columns]
+    index_map = {h.strip().lower(): i for i, h in enumerate(headers)}
+    mapping = {
+        field: next((index_map[c] for c in candidates if c in index_map), None)
+        for field, candidates in MAPPING_CANDIDATES.items()
+    }
+    return NormalizationPlan(
+        headers=headers,
+        renames={c: can for c, can in renames.items() if can != c},
+        missing=missing,
+        numeric=[c for c in NUMERIC_COLUMNS if c not in missing],
+        text=[c for c in TEXT_COLUMNS if c not in missing],
+        columns=columns,
+        mapping=mapping,
+    )
+
+# ---------- 6) Public Normalizer ----------
+
+def compact_holdings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    A normalized holdings frame with its text columns as categoricals (each
+    distinct string stored once, rows hold int codes) and its numeric
+    columns as float64. analyze_portfolio() groups on the codes instead of
+    hashing the strings again; results are identical.
+    """
+    return df.astype({
+        **{c: "category" for c in TEXT_COLUMNS if c in df.columns},
+        **{c: "float64" for c in NUMERIC_COLUMNS if c in df.columns},
+    })
+
+def normalize_custodian_csv(df: pd.DataFrame, carry: Optional[List[str]] = None,
+                            compact: bool = False) -> pd.DataFrame:
     """
     Normalize any custodian CSV into standard schema:
     ['symbol','name','quantity','price','market_value','sector','currency']
@@ -131,40 +328,44 @@ def normalize_custodian_csv(df: pd.DataFrame) -> pd.DataFrame:
     - Coerces numeric fields robustly (currency symbols, commas, parentheses)
     - Computes market_value = quantity * price if missing
     - Strips blank rows and keeps only standard columns (in order)
+
+    `carry` names extra columns (e.g. batch_id) passed through unchanged
+    after the standard ones. `compact` returns the frame as
+    compact_holdings() lays it out.
     """
+    carry = list(carry or [])
 
     if df is None or df.empty:
-        return pd.DataFrame(columns=STANDARD_ORDER)
+        return pd.DataFrame(columns=STANDARD_ORDER + carry)
 
-    # 1) Canonicalize headers
-    df = _rename_to_canonical(df)
+    # 1) Canonicalize headers (columns below are replaced, never written in place)
+    plan = normalization_plan(tuple(df.columns))
+    df = df.rename(columns=plan.renames, copy=False)
 
-    # 2) Keep best-guess columns; create missing ones empty
-    for col in STANDARD_ORDER:
-        if col not in df.columns:
-            df[col] = np.nan
+    # 2) Keep best-guess columns; create missing ones empty ("" for text, as cleaning would leave them)
+    for col in plan.missing:
+        df[col] = "" if col in TEXT_COLUMNS else np.nan
 
-    # 3) Numeric coercion
-    df["quantity"] = _smart_numeric(df["quantity"])
-    df["price"] = _smart_numeric(df["price"])
-    df["market_value"] = _smart_numeric(df["market_value"])
+    # 3) Numeric coercion (missing ones are already all-NaN floats)
+    for col in plan.numeric:
+        df[col] = _smart_numeric(df[col])
 
     # 4) If market_value missing/zero, recompute from qty * price
     mv_missing = df["market_value"].isna() | (df["market_value"] == 0)
     df.loc[mv_missing, "market_value"] = (df["quantity"].fillna(0) * df["price"].fillna(0))
 
     # 5) Clean text columns
-    for tcol in ["symbol", "name", "sector", "currency"]:
-        if tcol in df.columns:
-            df[tcol] = df[tcol].astype(str).replace({"nan": "", "None": "", "NaN": ""}).str.strip()
+    for tcol in plan.text:
+        df[tcol] = df[tcol].astype(str).replace({"nan": "", "None": "", "NaN": ""}).str.strip()
 
     # 6) Drop rows that still have no symbol and no value
     df = df[~(df["symbol"].replace({"": np.nan}).isna() & (df["market_value"].fillna(0) == 0))]
 
     # 7) Ensure order & only standard columns
-    df = df[STANDARD_ORDER]
+    df = df[STANDARD_ORDER + carry]
 
     # (Optional) attach provenance-like hints as attrs for debugging
     df.attrs["custodian_guess"] = detect_custodian(df)
 
-    return df.reset_index(drop=True)
+    df = df.reset_index(drop=True)
+    return compact_holdings(df) if compact else df